@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+asyncio client for Amazon Machine Learning realtime predictions, for
+services that can't block a thread on every predict call.
+
+    client = AsyncPredictClient("ml-12345678901", max_in_flight=1000)
+    prediction = await client.predict({"age": "42", "job": "services"})
+    ...
+    await client.close()
+
+At most max_in_flight predictions run at once, over at most max_connections
+keep-alive connections; submit() waits for a free slot before starting a
+prediction, so a producer that outruns the endpoint is slowed down instead
+of queueing without bound.  Each attempt times out after timeout seconds,
+and throttled, failed or timed out calls are retried with jittered
+exponential backoff, like wait_for_entity.py polls.
+
+Unlike the other tools this needs Python 3.7 or later, and no boto:
+requests are signed with the credentials in the AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY environment variables, or ~/.aws/credentials.
+
+Run as a script, it scores the records in a JSON lines file:
+
+Usage:
+    python3 async_predict.py ml_model_id records.jsonl [--max-in-flight 1000]
+        [--max-connections 100] [--timeout 5] [--retries 3]
+        [--service http://localhost:8080]
+"""
+import argparse
+import asyncio
+import collections
+import configparser
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import random
+import ssl
+import sys
+import time
+import urllib.parse
+
+TARGET_PREFIX = "AmazonML_20141212"
+RETRYABLE_ERRORS = frozenset([
+    "LimitExceededException", "ThrottlingException",
+    "InternalServerException", "ServiceUnavailableException",
+])
+
+
+class PredictError(Exception):
+
+    """A predict call that failed, and won't succeed if retried.
+    """
+
+    def __init__(self, status, error_type, message):
+        super(PredictError, self).__init__(
+            "%s %s: %s" % (status, error_type, message))
+        self.status = status
+        self.error_type = error_type
+
+
+class _RetryableError(Exception):
+    pass
+
+
+# Errors from a connection that failed or sent a response we couldn't
+# read; ValueError covers a malformed status line, chunk size or body.
+_TRANSPORT_ERRORS = (OSError, asyncio.IncompleteReadError, ValueError)
+
+
+def aws_credentials():
+    """Returns (access key, secret key, session token) from the environment
+    or ~/.aws/credentials, like boto finds them.
+    """
+    access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+    secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+    if access_key and secret_key:
+        return access_key, secret_key, os.environ.get("AWS_SESSION_TOKEN")
+    config = configparser.RawConfigParser()
+    config.read(os.path.expanduser("~/.aws/credentials"))
+    for section in (os.environ.get("AWS_PROFILE", "default"), "Credentials"):
+        if config.has_option(section, "aws_access_key_id"):
+            token = None
+            if config.has_option(section, "aws_session_token"):
+                token = config.get(section, "aws_session_token")
+            return (config.get(section, "aws_access_key_id"),
+                    config.get(section, "aws_secret_access_key"), token)
+    raise RuntimeError("No AWS credentials found in the environment or in "
+                       "~/.aws/credentials")
+
+
+def _sign(key, message):
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def signed_headers(host, target, body, credentials, region,
+                   service="machinelearning", now=None):
+    """Returns the headers of a JSON request to an AWS service, with an
+    AWS Signature Version 4 Authorization header.
+    """
+    access_key, secret_key, token = credentials
+    now = now or datetime.datetime.utcnow()
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+    headers = {
+        "content-type": "application/x-amz-json-1.1",
+        "host": host,
+        "x-amz-date": amz_date,
+        "x-amz-target": target,
+    }
+    if token:
+        headers["x-amz-security-token"] = token
+    names = sorted(headers)
+    canonical_request = "\n".join([
+        "POST", "/", "",
+        "".join("%s:%s\n" % (name, headers[name]) for name in names),
+        ";".join(names),
+        hashlib.sha256(body).hexdigest(),
+    ])
+    scope = "%s/%s/%s/aws4_request" % (date, region, service)
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    key = _sign(("AWS4" + secret_key).encode("utf-8"), date)
+    for part in (region, service, "aws4_request"):
+        key = _sign(key, part)
+    signature = hmac.new(key, string_to_sign.encode("utf-8"),
+                         hashlib.sha256).hexdigest()
+    headers["authorization"] = (
+        "AWS4-HMAC-SHA256 Credential=%s/%s, SignedHeaders=%s, Signature=%s"
+        % (access_key, scope, ";".join(names), signature))
+    headers["content-length"] = str(len(body))
+    return headers
+
+
+class _ConnectionPool(object):
+
+    """Keep-alive HTTP/1.1 connections to one host, at most max_connections
+    of them open at a time.
+    """
+
+    def __init__(self, url, max_connections):
+        parts = urllib.parse.urlsplit(url)
+        self.secure = parts.scheme == "https"
+        self.hostname = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.host = parts.netloc
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def request(self, headers, body):
+        """Sends a POST, and returns the response's status and body.
+        """
+        async with self._slots:
+            if self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(
+                    self.hostname, self.port,
+                    ssl=ssl.create_default_context() if self.secure else None)
+            try:
+                status, keep_alive, response = await self._exchange(
+                    reader, writer, headers, body)
+            except BaseException:
+                # Includes cancellation by a timeout, which leaves the
+                # connection in an unknown state.
+                writer.close()
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, response
+
+    async def _exchange(self, reader, writer, headers, body):
+        lines = ["POST / HTTP/1.1"]
+        lines.extend("%s: %s" % item for item in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by %s" % self.host)
+        parts = status_line.split()
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ConnectionError("Bad status line from %s: %r" %
+                                  (self.host, status_line))
+        status = int(parts[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            response = await self._read_chunked(reader)
+        elif "content-length" in response_headers:
+            response = await reader.readexactly(
+                int(response_headers["content-length"]))
+        else:
+            # The body runs to the end of the connection.
+            response = await reader.read()
+            keep_alive = False
+        return status, keep_alive, response
+
+    @staticmethod
+    async def _read_chunked(reader):
+        chunks = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Connection closed in a chunked body")
+            size = int(line.split(b";")[0], 16)
+            if size == 0:
+                break
+            chunks.append(await reader.readexactly(size))
+            if (await reader.readexactly(2)) != b"\r\n":
+                raise ValueError("Chunk not followed by CRLF")
+        # Skip any trailer headers.
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        return b"".join(chunks)
+
+    def close(self):
+        for reader, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+class AsyncPredictClient(object):
+
+    """Makes realtime predictions with a model's endpoint, many at once on
+    one event loop.  See the module documentation.  Create it on the event
+    loop that will use it.
+    """
+
+    def __init__(self, ml_model_id, region="us-east-1", max_in_flight=1000,
+                 max_connections=100, timeout=5.0, retries=3,
+                 credentials=None, service_url=None):
+        self.ml_model_id = ml_model_id
+        self.region = region
+        self.timeout = timeout
+        self.retries = retries
+        self.credentials = credentials or aws_credentials()
+        self.service_url = service_url or \
+            "https://machinelearning.%s.amazonaws.com" % region
+        self.max_in_flight = max_in_flight
+        self.max_connections = max_connections
+        self.num_retries = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._pools = {}
+        self._endpoint = None
+
+    def _pool(self, url):
+        pool = self._pools.get(url)
+        if pool is None:
+            pool = self._pools[url] = _ConnectionPool(url,
+                                                      self.max_connections)
+        return pool
+
+    async def _call(self, url, action, params):
+        pool = self._pool(url)
+        body = json.dumps(params).encode("utf-8")
+        headers = signed_headers(pool.host, "%s.%s" % (TARGET_PREFIX, action),
+                                 body, self.credentials, self.region)
+        status, response = await pool.request(headers, body)
+        obj = json.loads(response.decode("utf-8")) if response else {}
+        if status == 200:
+            return obj
+        error_type = obj.get("__type", "").split("#")[-1]
+        message = obj.get("message", obj.get("Message", ""))
+        if status >= 500 or error_type in RETRYABLE_ERRORS:
+            raise _RetryableError("%s %s: %s" % (status, error_type, message))
+        raise PredictError(status, error_type, message)
+
+    async def _call_with_retries(self, url, action, params):
+        delay = 0.05
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.wait_for(
+                    self._call(url, action, params), self.timeout)
+            except (_RetryableError, asyncio.TimeoutError) + \
+                    _TRANSPORT_ERRORS as e:
+                if attempt == self.retries:
+                    raise PredictError(None, type(e).__name__, str(e))
+            self.num_retries += 1
+            # exponential backoff with jitter
+            delay *= random.uniform(1.1, 2.0)
+            await asyncio.sleep(delay)
+
+    async def endpoint_url(self):
+        """Returns the URL of the model's realtime endpoint, looking it up
+        the first time.  Predictions that start before the lookup finishes
+        share it, and a failed lookup is tried again by the next caller.
+        """
+        if self._endpoint is None:
+            self._endpoint = asyncio.ensure_future(self._get_endpoint_url())
+        endpoint = self._endpoint
+        try:
+            # shield() so a caller's timeout doesn't cancel the lookup the
+            # others are waiting for.
+            return await asyncio.shield(endpoint)
+        except Exception:
+            if endpoint.done() and self._endpoint is endpoint:
+                self._endpoint = None
+            raise
+
+    async def _get_endpoint_url(self):
+        model = await self._call_with_retries(
+            self.service_url, "GetMLModel", {"MLModelId": self.ml_model_id})
+        endpoint = model.get("EndpointInfo", {}).get("EndpointUrl")
+        if not endpoint:
+            raise PredictError(None, "NoEndpoint",
+                               "ML model %s has no realtime endpoint" %
+                               self.ml_model_id)
+        return endpoint
+
+    async def submit(self, record):
+        """Starts predicting record (a dict of attribute name -> string),
+        once fewer than max_in_flight predictions are running, and returns
+        an asyncio task with the prediction.
+        """
+        await self._slots.acquire()
+        try:
+            return asyncio.ensure_future(self._predict_and_release(record))
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def predict(self, record):
+        """Returns the prediction for record.  Raises PredictError if it
+        fails, after retrying when that may help.
+        """
+        return await (await self.submit(record))
+
+    async def _predict_and_release(self, record):
+        try:
+            endpoint = await self.endpoint_url()
+            params = {
+                "MLModelId": self.ml_model_id,
+                "Record": record,
+                "PredictEndpoint": urllib.parse.urlsplit(endpoint).hostname,
+            }
+            result = await self._call_with_retries(endpoint, "Predict",
+                                                   params)
+            return result["Prediction"]
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        for pool in self._pools.values():
+            pool.close()
+
+
+def read_records(f):
+    for line in f:
+        if line.strip():
+            yield dict((name, value if isinstance(value, str)
+                        else json.dumps(value))
+                       for name, value in json.loads(line).items()
+                       if value is not None)
+
+
+async def score_file(client, f, out):
+    """Predicts every record in a JSON lines file, writing the predictions
+    to out in the same order.  Returns the latencies in milliseconds.
+    """
+    latencies = []
+    pending = collections.deque()
+
+    def write(task):
+        try:
+            result = task.result()
+        except (PredictError,) + _TRANSPORT_ERRORS as e:
+            result = {"Error": str(e)}
+        out.write(json.dumps(result) + "\n")
+
+    for record in read_records(f):
+        start = time.time()
+        task = await client.submit(record)
+        task.add_done_callback(
+            lambda task, start=start:
+            latencies.append((time.time() - start) * 1000))
+        pending.append(task)
+        # Write predictions as soon as the ones before them are done, and
+        # wait for the oldest when too many finished ones pile up behind it.
+        while pending and (pending[0].done() or
+                           len(pending) > 2 * client.max_in_flight):
+            await asyncio.wait([pending[0]])
+            write(pending.popleft())
+    while pending:
+        await asyncio.wait([pending[0]])
+        write(pending.popleft())
+    return latencies
+
+
+async def main(args):
+    client = AsyncPredictClient(
+        args.ml_model_id, region=args.region,
+        max_in_flight=args.max_in_flight,
+        max_connections=args.max_connections, timeout=args.timeout,
+        retries=args.retries, service_url=args.service)
+    start = time.time()
+    with open(args.records_fn) as f:
+        latencies = await score_file(client, f, sys.stdout)
+    seconds = time.time() - start
+    await client.close()
+    latencies.sort()
+    sys.stderr.write("Scored %d records in %.2fs, %.1f records/s, "
+                     "%d retries\n" % (len(latencies), seconds,
+                                       len(latencies) / seconds,
+                                       client.num_retries))
+    if latencies:
+        sys.stderr.write("Latency: p50 %.2fms  p99 %.2fms\n" % (
+            latencies[len(latencies) // 2],
+            latencies[min(len(latencies) - 1,
+                          int(len(latencies) * 0.99))]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("ml_model_id")
+    parser.add_argument("records_fn")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--service")
+    asyncio.run(main(parser.parse_args()))
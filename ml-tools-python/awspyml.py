@@ -12,23 +12,66 @@
 # and limitations under the License.
 """AWSPyML - Python utilities to help with Amazon Machine Learning.
 """
+import base64
+import bisect
 import boto
+import collections
 import csv
+import hashlib
+import io
+import itertools
 import json
 import math
+import multiprocessing
+import os
+import Queue
 import random
 import re
+import shutil
+import struct
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
+try:
+    import numpy
+except ImportError:
+    # Only needed for the faster, vectorized code paths.
+    numpy = None
 
-def aml_connection():
+
+_connections = threading.local()
+_validated_hosts = set()
+_validated_hosts_lock = threading.Lock()
+
+
+def aml_connection(host=None, port=None, is_secure=True):
     """Connects to the service and validates that credentials are configured properly.
+
+    Returns the calling thread's connection, creating it on first use, so
+    its pooled keep-alive HTTP connections (to the service and to realtime
+    endpoints) are reused instead of paying for a new TLS handshake every
+    time.  Credentials are only validated the first time a process connects
+    to a host.  host, port and is_secure point the connection somewhere
+    other than the service, such as predict_server.py.
     """
-    ml = boto.connect_machinelearning()
-    try:
-        # Check that the connection is configured properly
-        ml.describe_ml_models(limit=1)
-    except:
-        raise RuntimeError("""There was a problem connecting to Amazon Machine Learning.
+    key = (host, port, is_secure)
+    connections = getattr(_connections, "by_host", None)
+    if connections is None:
+        connections = _connections.by_host = {}
+    ml = connections.get(key)
+    if ml is not None:
+        return ml
+    ml = boto.connect_machinelearning(host=host, port=port,
+                                      is_secure=is_secure)
+    with _validated_hosts_lock:
+        validated = key in _validated_hosts
+    if not validated:
+        try:
+            # Check that the connection is configured properly
+            ml.describe_ml_models(limit=1)
+        except:
+            raise RuntimeError("""There was a problem connecting to Amazon Machine Learning.
 Be sure your AWS credentials are properly configured.
 A credentials file should be in ~/.aws/credentials
 (or C:\Users\USER_NAME\.aws\credentials on Windows)
@@ -38,9 +81,731 @@ and look like:
 aws_access_key_id = <your_access_key_here>
 aws_secret_access_key = <your_secret_key_here>
     """)
+        with _validated_hosts_lock:
+            _validated_hosts.add(key)
+    connections[key] = ml
     return ml
 
 
+def prediction_records(f, data_format="jsonl", schema=None):
+    """Yields the records in an open file as dicts of attribute name ->
+    string value, ready for predict, leaving out missing values.
+
+    data_format is "jsonl", for one JSON object per line, or "csv".  The
+    attribute names of a CSV file come from schema when it is given, and
+    from the file's header line otherwise.
+    """
+    if data_format == "jsonl":
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                obj = None
+            if not isinstance(obj, dict):
+                raise AWSPyMLException("Line %d is not a JSON object" %
+                                       line_num)
+            record = {}
+            for name, value in obj.items():
+                value = _json_cell(value)
+                if value:
+                    record[name] = value
+            yield record
+    elif data_format == "csv":
+        rows = csv.reader(f)
+        if schema is None:
+            names = next(rows, [])
+        else:
+            obj = schema.as_obj()
+            names = [var["attributeName"] for var in obj["attributes"]]
+            if obj["dataFileContainsHeader"]:
+                next(rows, None)
+        for row in rows:
+            if row:
+                yield dict((name, value) for name, value in zip(names, row)
+                           if value != '')
+    else:
+        raise AWSPyMLException("Unknown record format %s" % data_format)
+
+
+class EndpointCache(object):
+
+    """Remembers the realtime endpoint URL of ML models for ttl seconds, so
+    a prediction doesn't need a get_ml_model call before it.
+
+    Only READY endpoints are cached, so one that is still being created is
+    looked up again on every call.  Call invalidate when a prediction
+    fails in a way that suggests the endpoint moved or was deleted.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._endpoints = {}  # ML model id -> (URL, expiry time)
+        self._lock = threading.Lock()
+
+    def endpoint_url(self, ml_model_id, ml=None, ready_only=False):
+        """Returns the URL of the model's realtime endpoint, or '' if it
+        doesn't have one, or with ready_only, if it isn't READY yet.
+        """
+        now = time.time()
+        with self._lock:
+            url, expires = self._endpoints.get(ml_model_id, ('', 0))
+        if expires > now:
+            return url
+        model = (ml or aml_connection()).get_ml_model(ml_model_id)
+        info = model.get('EndpointInfo', {})
+        url = info.get('EndpointUrl', '')
+        ready = info.get('EndpointStatus', 'READY') == 'READY'
+        if url and ready:
+            with self._lock:
+                self._endpoints[ml_model_id] = (url, now + self.ttl)
+        return url if ready or not ready_only else ''
+
+    def invalidate(self, ml_model_id=None):
+        """Forgets the endpoint of ml_model_id, or of every model.
+        """
+        with self._lock:
+            if ml_model_id is None:
+                self._endpoints.clear()
+            else:
+                self._endpoints.pop(ml_model_id, None)
+
+
+endpoint_cache = EndpointCache()
+
+
+def predict(ml_model_id, record, ml=None):
+    """Makes a realtime prediction for a record (a dict of attribute name
+    -> value) with one call to the model's endpoint, which is looked up in
+    endpoint_cache.  Raises AWSPyMLException if the model has no realtime
+    endpoint.
+    """
+    ml = ml or aml_connection()
+    endpoint = endpoint_cache.endpoint_url(ml_model_id, ml)
+    if not endpoint:
+        raise AWSPyMLException("ML model %s has no realtime endpoint" %
+                               ml_model_id)
+    try:
+        return ml.predict(ml_model_id, record, predict_endpoint=endpoint)
+    except:
+        # Look the endpoint up again next time, in case it changed.
+        endpoint_cache.invalidate(ml_model_id)
+        raise
+
+
+def _canonical_value(value):
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    elif not isinstance(value, unicode):
+        value = unicode(value)
+    return u' '.join(value.split())
+
+
+class PredictionCache(object):
+
+    """Remembers realtime predictions for ttl seconds, so repeated records
+    don't cost another call to the endpoint.
+
+    Records are keyed by model id and their attributes in sorted order,
+    with surrounding and repeated whitespace removed and empty values left
+    out, since predict treats those the same.  When the cached predictions
+    take more than max_bytes, the least recently used are dropped.
+    Concurrent calls for the same record share one call to the endpoint.
+    hits, misses and coalesced count how calls were answered.
+
+    predict_function is called as predict_function(ml_model_id, record,
+    ml) on a miss; it defaults to predict.
+    """
+
+    # Rough per-entry overhead of the dict, key and tuple, in bytes.
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, ttl=300, max_bytes=64 * 1024 * 1024,
+                 predict_function=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.predict_function = predict_function or predict
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.num_bytes = 0
+        # Key -> (prediction, size, expiry time), least recently used first
+        self._entries = collections.OrderedDict()
+        self._in_flight = {}  # Key -> _BatchedRequest
+        self._lock = threading.Lock()
+
+    def key(self, ml_model_id, record):
+        """Returns the cache key of a record.
+        """
+        items = sorted((_canonical_value(name), _canonical_value(value))
+                       for name, value in record.items())
+        items = [item for item in items if item[1]]
+        canonical = json.dumps(items, ensure_ascii=False)
+        return ml_model_id, hashlib.sha1(canonical.encode('utf-8')).digest()
+
+    def predict(self, ml_model_id, record, ml=None):
+        """Returns the prediction for record, from the cache if it has a
+        fresh one.
+        """
+        key = self.key(ml_model_id, record)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries[key] = entry  # Now the most recently used
+                    self.hits += 1
+                    return entry[0]
+                self.num_bytes -= entry[1]
+            request = self._in_flight.get(key)
+            if request is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                request = self._in_flight[key] = _BatchedRequest(record)
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+            return request.prediction
+
+        try:
+            request.prediction = self.predict_function(ml_model_id, record,
+                                                       ml)
+        except Exception as e:
+            request.error = e
+        with self._lock:
+            del self._in_flight[key]
+            if request.error is None:
+                size = len(json.dumps(request.prediction)) + \
+                    self.ENTRY_OVERHEAD
+                self._entries[key] = (request.prediction, size,
+                                      time.time() + self.ttl)
+                self.num_bytes += size
+                while self.num_bytes > self.max_bytes and self._entries:
+                    old_key, old_entry = self._entries.popitem(last=False)
+                    self.num_bytes -= old_entry[1]
+                    self.evictions += 1
+        request.done.set()
+        if request.error is not None:
+            raise request.error
+        return request.prediction
+
+    def invalidate(self, ml_model_id=None):
+        """Forgets the cached predictions of ml_model_id, or of every model.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if ml_model_id is None or key[0] == ml_model_id:
+                    self.num_bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        """Returns the counters as a dict.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.num_bytes,
+            }
+
+
+class EndpointManager(object):
+
+    """Creates realtime endpoints when they are needed, and deletes them
+    once they have been idle for idle_seconds, so endpoints don't run (and
+    charge a reservation fee) when nobody uses them.  With min_rate, an
+    endpoint that has run for rate_window seconds is also deleted while its
+    predictions over the last rate_window seconds average less than
+    min_rate per second, for models whose occasional predictions aren't
+    worth a reservation fee; the next one waits for a new endpoint.
+
+    ensure_endpoint() (and predict(), which calls it) creates the model's
+    endpoint if it doesn't have one, and waits until it is READY instead of
+    failing.  schedule() warms an endpoint up ahead of expected load, by as
+    long as creating one has taken so far (warmup_seconds until one has
+    been created).  tick() does the scheduled creations and idle deletions;
+    call it periodically, or call start() to do it on a thread.  Only the
+    endpoints of models the manager has been used with are deleted.
+
+    clock and sleep can be replaced, together with ml, to test a policy
+    against FakeMLService in simulated time.
+    """
+
+    def __init__(self, ml=None, idle_seconds=1800, warmup_seconds=300,
+                 rate_window=300, min_rate=0, clock=time.time,
+                 sleep=time.sleep):
+        self.ml = ml
+        self.idle_seconds = idle_seconds
+        self.warmup_seconds = warmup_seconds
+        self.rate_window = rate_window
+        self.min_rate = min_rate
+        self.clock = clock
+        self.sleep = sleep
+        self._last_used = {}  # ML model id -> time of the last request
+        self._requests = {}  # ML model id -> deque of [second, count]
+        self._ready = {}  # ML model id -> time its endpoint was seen READY
+        self._schedule = []  # [start time, ML model id], sorted
+        self._creating = {}  # ML model id -> time creation was requested
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _connection(self):
+        return self.ml or aml_connection()
+
+    def record_requests(self, ml_model_id, count=1):
+        """Counts count predictions made with the model's endpoint.
+        """
+        now = self.clock()
+        second = int(now)
+        with self._lock:
+            self._last_used[ml_model_id] = now
+            buckets = self._requests.setdefault(ml_model_id,
+                                                collections.deque())
+            if buckets and buckets[-1][0] == second:
+                buckets[-1][1] += count
+            else:
+                buckets.append([second, count])
+            while buckets and buckets[0][0] <= second - self.rate_window:
+                buckets.popleft()
+
+    def request_rate(self, ml_model_id):
+        """Returns the model's predictions per second over the last
+        rate_window seconds.
+        """
+        now = self.clock()
+        with self._lock:
+            return self._request_rate(ml_model_id, now)
+
+    def _request_rate(self, ml_model_id, now):
+        since = int(now) - self.rate_window
+        buckets = self._requests.get(ml_model_id, ())
+        count = sum(n for second, n in buckets if second > since)
+        return count / float(self.rate_window)
+
+    def schedule(self, ml_model_id, start_time):
+        """Has the model's endpoint ready by start_time.
+        """
+        with self._lock:
+            self._schedule.append([start_time, ml_model_id])
+            self._schedule.sort()
+            self._last_used.setdefault(ml_model_id, self.clock())
+
+    def _endpoint_info(self, ml_model_id):
+        model = self._connection().get_ml_model(ml_model_id)
+        return model.get('EndpointInfo', {})
+
+    def _create(self, ml_model_id):
+        with self._lock:
+            if ml_model_id in self._creating:
+                return
+            self._creating[ml_model_id] = self.clock()
+        self._connection().create_realtime_endpoint(ml_model_id)
+
+    def ensure_endpoint(self, ml_model_id, timeout=900):
+        """Returns the URL of the model's READY realtime endpoint, creating
+        it and waiting for it if need be.  Raises AWSPyMLException if it
+        isn't ready after timeout seconds.
+        """
+        with self._lock:
+            self._last_used[ml_model_id] = self.clock()
+        url = endpoint_cache.endpoint_url(ml_model_id, self._connection(),
+                                          ready_only=True)
+        with self._lock:
+            creating = ml_model_id in self._creating
+            if url and not creating:
+                self._ready.setdefault(ml_model_id, self.clock())
+        if url and not creating:
+            return url
+        deadline = self.clock() + timeout
+        delay = 2
+        while True:
+            info = self._endpoint_info(ml_model_id)
+            status = info.get('EndpointStatus', 'NONE')
+            if status == 'READY':
+                with self._lock:
+                    started = self._creating.pop(ml_model_id, None)
+                    self._ready.setdefault(ml_model_id, self.clock())
+                if started is not None:
+                    # Warm up by as long as the slowest creation so far.
+                    self.warmup_seconds = max(self.warmup_seconds,
+                                              self.clock() - started)
+                endpoint_cache.invalidate(ml_model_id)
+                return endpoint_cache.endpoint_url(ml_model_id,
+                                                   self._connection())
+            if status in ('NONE', 'FAILED'):
+                with self._lock:
+                    self._creating.pop(ml_model_id, None)
+                self._create(ml_model_id)
+            if self.clock() >= deadline:
+                raise AWSPyMLException(
+                    "Realtime endpoint of %s not ready after %d seconds" %
+                    (ml_model_id, timeout))
+            # exponential backoff with jitter
+            delay = min(delay * random.uniform(1.1, 2.0), 30)
+            self.sleep(min(delay, max(deadline - self.clock(), 0)))
+
+    def predict(self, ml_model_id, record):
+        """Makes a realtime prediction, waiting for the model's endpoint to
+        be created if it doesn't have one.
+        """
+        self.ensure_endpoint(ml_model_id)
+        self.record_requests(ml_model_id)
+        return predict(ml_model_id, record, self._connection())
+
+    def tick(self):
+        """Creates the endpoints due to be warmed up, and deletes those
+        that have been idle too long.  Returns a list of (action, ML model
+        id) pairs, where action is "create" or "delete".
+        """
+        now = self.clock()
+        actions = []
+        with self._lock:
+            due = [model_id for start, model_id in self._schedule
+                   if start - self.warmup_seconds <= now]
+            # Endpoints about to be needed are kept; ones needed later can
+            # be deleted now and created again in time.
+            upcoming = set(model_id for start, model_id in self._schedule
+                           if start - self.warmup_seconds <= now < start)
+            self._schedule = [[start, model_id]
+                              for start, model_id in self._schedule
+                              if start > now]
+            idle = [model_id for model_id, last_used
+                    in self._last_used.items()
+                    if (now - last_used >= self.idle_seconds or
+                        self._too_slow(model_id, now)) and
+                    model_id not in upcoming and
+                    model_id not in self._creating]
+        with self._lock:
+            creating = list(self._creating.items())
+        for model_id, started in creating:
+            if self._endpoint_info(model_id).get('EndpointStatus') == 'READY':
+                with self._lock:
+                    self._creating.pop(model_id, None)
+                    self._ready.setdefault(model_id, now)
+                self.warmup_seconds = max(self.warmup_seconds, now - started)
+        for model_id in set(due):
+            status = self._endpoint_info(model_id).get('EndpointStatus',
+                                                       'NONE')
+            if status in ('NONE', 'FAILED'):
+                self._create(model_id)
+                actions.append(("create", model_id))
+            with self._lock:
+                self._last_used[model_id] = max(
+                    self._last_used.get(model_id, now), now)
+        for model_id in idle:
+            status = self._endpoint_info(model_id).get('EndpointStatus',
+                                                       'NONE')
+            if status != 'NONE':
+                self._connection().delete_realtime_endpoint(model_id)
+                endpoint_cache.invalidate(model_id)
+                actions.append(("delete", model_id))
+            with self._lock:
+                self._last_used.pop(model_id, None)
+                self._requests.pop(model_id, None)
+                self._ready.pop(model_id, None)
+        return actions
+
+    def _too_slow(self, ml_model_id, now):
+        """Returns whether the model's endpoint has been READY for a whole
+        rate_window, and got fewer than min_rate predictions per second
+        over it.
+        """
+        ready = self._ready.get(ml_model_id)
+        return (self.min_rate > 0 and ready is not None and
+                now - ready >= self.rate_window and
+                self._request_rate(ml_model_id, now) < self.min_rate)
+
+    def start(self, interval=60):
+        """Calls tick() every interval seconds on a background thread.
+        """
+        def run():
+            while not self._stopped.wait(interval):
+                self.tick()
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+
+class FakeMLService(object):
+
+    """Stands in for the realtime endpoint calls of a connection to the
+    service (get_ml_model, create_realtime_endpoint,
+    delete_realtime_endpoint and predict), for testing code that manages
+    endpoints.  Endpoints take creation_seconds of clock time to become
+    READY, or FAILED for the next failed_creations of them.  calls counts
+    the calls of each kind.
+    """
+
+    def __init__(self, creation_seconds=120, clock=time.time,
+                 failed_creations=0):
+        self.creation_seconds = creation_seconds
+        self.clock = clock
+        self.failed_creations = failed_creations
+        self.calls = collections.Counter()
+        self._ready_at = {}  # ML model id -> when its endpoint is READY
+        self._failing = set()  # ML model ids whose creation fails
+
+    def _info(self, ml_model_id):
+        ready_at = self._ready_at.get(ml_model_id)
+        if ready_at is None:
+            return {'EndpointStatus': 'NONE'}
+        if self.clock() < ready_at:
+            status = 'UPDATING'
+        elif ml_model_id in self._failing:
+            status = 'FAILED'
+        else:
+            status = 'READY'
+        info = {
+            'EndpointStatus': status,
+            'EndpointUrl': 'https://realtime.example.com/%s' % ml_model_id,
+            'PeakRequestsPerSecond': 200,
+        }
+        return info
+
+    def get_ml_model(self, ml_model_id):
+        self.calls['get_ml_model'] += 1
+        return {'MLModelId': ml_model_id, 'Status': 'COMPLETED',
+                'EndpointInfo': self._info(ml_model_id)}
+
+    def create_realtime_endpoint(self, ml_model_id):
+        self.calls['create_realtime_endpoint'] += 1
+        if self._info(ml_model_id)['EndpointStatus'] in ('NONE', 'FAILED'):
+            self._ready_at[ml_model_id] = \
+                self.clock() + self.creation_seconds
+            self._failing.discard(ml_model_id)
+            if self.failed_creations > 0:
+                self.failed_creations -= 1
+                self._failing.add(ml_model_id)
+        return {'MLModelId': ml_model_id,
+                'RealtimeEndpointInfo': self._info(ml_model_id)}
+
+    def delete_realtime_endpoint(self, ml_model_id):
+        self.calls['delete_realtime_endpoint'] += 1
+        self._ready_at.pop(ml_model_id, None)
+        self._failing.discard(ml_model_id)
+        return {'MLModelId': ml_model_id,
+                'RealtimeEndpointInfo': self._info(ml_model_id)}
+
+    def predict(self, ml_model_id, record, predict_endpoint):
+        self.calls['predict'] += 1
+        if self._info(ml_model_id)['EndpointStatus'] != 'READY':
+            raise AWSPyMLException("Endpoint of %s is not ready" %
+                                   ml_model_id)
+        digest = hashlib.md5(json.dumps(record, sort_keys=True)).hexdigest()
+        score = int(digest[:8], 16) / float(1 << 32)
+        return {'Prediction': binary_prediction(score)}
+
+
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED', 'INVALID', 'DELETED')
+
+
+class JobHistory(object):
+
+    """How long past asynchronous jobs (creating data sources, models,
+    evaluations and batch predictions) took, kept in a small JSON file, so
+    that pollers can predict when the next one will finish.
+
+    Durations are recorded per entity type with the size of the job's
+    input, and only the last max_jobs of each type are kept.
+    """
+
+    def __init__(self, path=None, max_jobs=100):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.awspyml',
+                                'job-history.json')
+        self.path = path
+        self.max_jobs = max_jobs
+
+    def _load(self):
+        try:
+            f = open(self.path)
+            try:
+                return json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return {}
+
+    def jobs(self, entity_type):
+        """Returns the [input size, seconds] of the recorded jobs of the
+        type, oldest first.  The input size may be None.
+        """
+        return self._load().get(entity_type, [])
+
+    def record(self, entity_type, input_size, seconds):
+        history = self._load()
+        jobs = history.setdefault(entity_type, [])
+        jobs.append([input_size, seconds])
+        del jobs[:-self.max_jobs]
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        f = open(tmp_path, 'w')
+        try:
+            json.dump(history, f, sort_keys=True)
+        finally:
+            f.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Windows won't rename over an existing file
+        os.rename(tmp_path, self.path)
+
+    def estimate(self, entity_type, input_size=None):
+        """Returns (seconds, spread): how long a job of the type with an
+        input of input_size bytes is expected to take, give or take spread
+        seconds.  Returns None if no job of the type has been recorded.
+
+        Jobs take a fixed overhead plus time in proportion to their input,
+        so with an input size and at least three sized jobs to go on, the
+        estimate is a least squares fit of seconds to input size.
+        Otherwise it is the median duration.  spread covers 90% of the
+        recorded jobs' errors.
+        """
+        jobs = self.jobs(entity_type)
+        if not jobs:
+            return None
+        sized = [(size, seconds) for size, seconds in jobs
+                 if size is not None]
+        sizes = set(size for size, seconds in sized)
+        slope = None
+        if input_size is not None and len(sized) >= 3 and len(sizes) > 1:
+            mean_size = sum(size for size, seconds in sized) / float(
+                len(sized))
+            mean_seconds = sum(seconds for size, seconds in sized) / float(
+                len(sized))
+            covariance = sum((size - mean_size) * (seconds - mean_seconds)
+                             for size, seconds in sized)
+            variance = sum((size - mean_size) ** 2 for size, seconds in sized)
+            slope = covariance / variance
+        if slope is not None and slope >= 0:
+            intercept = mean_seconds - slope * mean_size
+            seconds = max(intercept + slope * input_size, 0)
+            errors = [abs(intercept + slope * size - job_seconds)
+                      for size, job_seconds in sized]
+        else:
+            durations = sorted(seconds for size, seconds in jobs)
+            seconds = durations[len(durations) // 2]
+            errors = [abs(job_seconds - seconds) for job_seconds in durations]
+        errors.sort()
+        spread = errors[min(int(len(errors) * 0.9), len(errors) - 1)]
+        return seconds, max(spread, 0.1 * seconds)
+
+
+class PollSchedule(object):
+
+    """When to poll a job.  Without an estimate of how long it takes, the
+    delay between polls backs off exponentially with jitter.  With one, a
+    (seconds, spread) pair from JobHistory.estimate, the job is polled
+    dense_polls times over the window from seconds - spread to seconds +
+    spread, and only every early_fraction of seconds (at most max_delay)
+    before it, so completion is noticed soon after it happens without
+    polling all along, and a job that fails early isn't missed for long.
+    A job still running after the window is backed off as if there was no
+    estimate.
+    """
+
+    def __init__(self, estimate=None, min_delay=2, max_delay=600,
+                 dense_polls=5, early_fraction=0.1):
+        self.estimate = estimate
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.dense_polls = dense_polls
+        self.early_fraction = early_fraction
+        self.delay = min_delay
+
+    def next_delay(self, elapsed):
+        """Returns how many seconds to wait before polling again, elapsed
+        seconds after the job was created.
+        """
+        if self.estimate is not None:
+            seconds, spread = self.estimate
+            start = seconds - spread
+            end = seconds + spread
+            interval = max(self.min_delay, 2.0 * spread / self.dense_polls)
+            if elapsed < start:
+                early_delay = max(self.early_fraction * seconds,
+                                  self.min_delay)
+                return min(max(start - elapsed, self.min_delay), early_delay,
+                           self.max_delay)
+            if elapsed < end:
+                return interval
+            self.delay = max(self.delay, interval)
+
+        # exponential backoff with jitter
+        self.delay = min(self.delay * random.uniform(1.1, 2.0),
+                         self.max_delay)
+        return self.delay
+
+
+def _timestamp(value):
+    """Returns an entity's timestamp as seconds since the epoch, or None.
+    """
+    if isinstance(value, (int, long, float)):
+        return float(value)
+    return None
+
+
+def job_seconds(entity, now=None):
+    """Returns how long the job of an entity has been running (or, once
+    it has finished, took), from its CreatedAt and FinishedAt timestamps.
+    Returns None if the entity has no CreatedAt timestamp.
+    """
+    created = _timestamp(entity.get('CreatedAt'))
+    if created is None:
+        return None
+    finished = _timestamp(entity.get('FinishedAt'))
+    if finished is None or entity.get('Status') not in TERMINAL_STATUSES:
+        finished = time.time() if now is None else now
+    return max(finished - created, 0)
+
+
+def poll_until_terminal(poll, entity_type, input_size=None, history=None,
+                        clock=time.time, sleep=time.sleep):
+    """Calls poll(), which returns the description of an entity, until the
+    entity reaches a terminal status, and returns its last description.
+
+    The polls are scheduled around when history (a JobHistory) expects a
+    job of the entity type and input size to finish, and the duration of
+    a job that is seen running and then completes is recorded in it.
+    Pass history=False to back off blindly and record nothing.
+    """
+    if history is None:
+        history = JobHistory()
+    estimate = history.estimate(entity_type, input_size) if history else None
+    schedule = PollSchedule(estimate)
+    started = clock()
+    seen_running = False
+    while True:
+        entity = poll()
+        now = clock()
+        elapsed = job_seconds(entity, now)
+        if elapsed is None:
+            elapsed = now - started
+        if entity['Status'] in TERMINAL_STATUSES:
+            # A job that had finished before the first poll may have been
+            # recorded already, by whoever waited for it.
+            if history and seen_running and entity['Status'] == 'COMPLETED':
+                history.record(entity_type, input_size, elapsed)
+            return entity
+        seen_running = True
+        sleep(schedule.next_delay(elapsed))
+
+
 class Identifiers(object):
     chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
 
@@ -113,7 +878,7 @@ class JsonConfiguration(object):
 
     def write_to_file(self, filename, dense=False):
         self.validate()
-        f = open(filename)
+        f = open(filename, 'w')
         json.dump(self._obj, f, **self._json_kwargs(dense))
         f.close()
 
@@ -146,6 +911,43 @@ class Schema(JsonConfiguration):
             "excludedAttributeNames": [],  # Optional
             "rowId": None,  # Optional
         }
+        # attributeName -> sorted positions in attributes, so that lookups
+        # by name don't need to scan wide schemas.
+        self._index = {}
+        # Positions of attributes that have changed since the last
+        # successful validate(), so only those are checked again.
+        self._dirty = set()
+        # Set when the attributes list has been handed out, and so may have
+        # been changed in place: the next lookup rebuilds the index, and the
+        # next validate() checks every attribute.
+        self._reindex_needed = False
+        self._check_all = False
+
+    @classmethod
+    def read_from_file(cls, filename):
+        """Reads a schema from a JSON file, like those written by
+        write_to_file.  Keys this class doesn't know about are kept.
+        """
+        f = open(filename)
+        try:
+            obj = json.load(f)
+        finally:
+            f.close()
+        schema = cls()
+        schema._obj.update(obj)
+        schema._reindex()
+        schema._dirty = set(xrange(schema.num_attributes()))
+        return schema
+
+    def copy(self):
+        """Returns a copy that can be changed without changing this one.
+        """
+        schema = type(self)()
+        schema._obj.update(json.loads(json.dumps(self._obj)))
+        schema._reindex()
+        schema._dirty = set(self._dirty)
+        schema._check_all = self._check_all
+        return schema
 
     def validate(self):
         """Validates that the schema object is properly formed.
@@ -156,7 +958,13 @@ class Schema(JsonConfiguration):
         """
         if self.num_attributes() == 0:
             raise InvalidSchemaException("no attributes defined")
-        for idx, var in enumerate(self.attributes()):
+        attributes = self._obj["attributes"]
+        if self._check_all:
+            check = xrange(len(attributes))
+        else:
+            check = sorted(self._dirty)
+        for idx in check:
+            var = attributes[idx]
             name = var["attributeName"]
             typ = var["attributeType"]
             if not name or not typ:
@@ -167,8 +975,17 @@ class Schema(JsonConfiguration):
             if typ not in self.VALID_VARIABLE_TYPES:
                 raise InvalidSchemaException(
                     "variable %s has invalid type %s" % (name, typ))
+        self._dirty.clear()
+        self._check_all = False
         return True  # Passes all rules.
 
+    def as_obj(self):
+        obj = super(Schema, self).as_obj()
+        # The caller may change the attributes through obj.
+        self._reindex_needed = True
+        self._check_all = True
+        return obj
+
     def set_target(self, target_variable_name):
         """Sets the target variable to the variable of the specified name
         """
@@ -177,39 +994,133 @@ class Schema(JsonConfiguration):
                                   target_variable_name)
         self._obj['targetAttributeName'] = target_variable_name
 
+    def set_row_id(self, name):
+        """Sets the rowId to the variable of the specified name.  The row id
+        is passed through to predictions, but not used by the model.
+        """
+        if not self.get_variable_by_name(name):
+            raise SchemaException("Can't set rowId to undefined variable %s" %
+                                  name)
+        self._obj['rowId'] = name
+
+    def row_id(self):
+        return self._obj['rowId']
+
     def set_variable_name(self, idx, name):
         """For variable in the position idx, set its name
         """
-        self.get_variable_by_idx(idx)['attributeName'] = name
+        var = self.get_variable_by_idx(idx)
+        old_name = var['attributeName']
+        positions = self._index.get(old_name)
+        if positions is not None and idx in positions:
+            positions.remove(idx)
+            if not positions:
+                del self._index[old_name]
+        var['attributeName'] = name
+        if name is not None:
+            # With duplicate names, lookups find the first one (as a scan
+            # would), and the next one once it is renamed.
+            bisect.insort(self._index.setdefault(name, []), idx)
 
     def set_variable_type(self, idx, attributeType):
         """For variable in the position idx, set its field type.
         """
         self.get_variable_by_idx(idx)['attributeType'] = attributeType
 
+    def set_variable_types(self, types):
+        """Takes a dict of attribute name -> type, and sets the type of
+        each of those variables.
+        """
+        for name, attributeType in types.items():
+            self.set_variable_type(self._idx_of(name), attributeType)
+
+    def rename_attributes(self, new_names):
+        """Takes a dict of old attribute name -> new name, and renames each
+        of those variables, along with any references to them as the
+        target, row id or excluded attributes.
+        """
+        # Look everything up, and clear the old names, before renaming,
+        # so names can be swapped.
+        renames = [(self._idx_of(old), new) for old, new in new_names.items()]
+        for idx, new in renames:
+            self.set_variable_name(idx, None)
+        for idx, new in renames:
+            self.set_variable_name(idx, new)
+        obj = self._obj
+        if obj["targetAttributeName"] in new_names:
+            obj["targetAttributeName"] = new_names[obj["targetAttributeName"]]
+        if obj["rowId"] in new_names:
+            obj["rowId"] = new_names[obj["rowId"]]
+        obj["excludedAttributeNames"] = [
+            new_names.get(name, name) for name in obj["excludedAttributeNames"]]
+
+    def exclude_attributes(self, names):
+        """Adds the named attributes to excludedAttributeNames, so that they
+        are not used by the model.
+        """
+        excluded = self._obj["excludedAttributeNames"]
+        already_excluded = set(excluded)
+        for name in names:
+            self._idx_of(name)  # Must be defined
+            if name not in already_excluded:
+                excluded.append(name)
+                already_excluded.add(name)
+
     def num_attributes(self):
         return len(self._obj['attributes'])
 
     def attributes(self):
+        """Returns the list of attribute dicts.  Changing them in place is
+        allowed, but costs a full validation and a rebuild of the name
+        index, so prefer the set_* methods for wide schemas.
+        """
+        self._reindex_needed = True
+        self._check_all = True
         return self._obj["attributes"]
 
     def get_variable_by_name(self, name):
-        for var in self.attributes():
-            if var["attributeName"] == name:
-                return var
-        return None
+        if self._reindex_needed:
+            self._reindex()
+        positions = self._index.get(name)
+        if not positions:
+            return None
+        idx = positions[0]
+        attributes = self._obj["attributes"]
+        if idx >= len(attributes) or attributes[idx]["attributeName"] != name:
+            # Changed behind our back (through _obj), so rebuild the index.
+            self._reindex()
+            return self.get_variable_by_name(name)
+        # The caller may modify the attribute.
+        self._dirty.add(idx)
+        return attributes[idx]
 
     def get_variable_by_idx(self, idx):
-        if self.num_attributes() <= idx:
+        attributes = self._obj['attributes']
+        if len(attributes) <= idx:
             # The list is too small, so we expand it
-            amount = 1 + idx - self.num_attributes()
-            self._obj['attributes'].extend(
-                [{
+            attributes.extend(
+                {
                     "attributeName": None,
                     "attributeType": None,
-                }] * amount
+                } for i in xrange(1 + idx - len(attributes))
             )
-        return self._obj['attributes'][idx]
+        # The caller may modify the attribute.
+        self._dirty.add(idx)
+        return attributes[idx]
+
+    def _idx_of(self, name):
+        """Returns the position of the named attribute, or raises
+        SchemaException if there isn't one.
+        """
+        if self.get_variable_by_name(name) is None:
+            raise SchemaException("Undefined variable %s" % name)
+        return self._index[name][0]
+
+    def _reindex(self):
+        self._index = {}
+        for idx, var in enumerate(self._obj["attributes"]):
+            self._index.setdefault(var["attributeName"], []).append(idx)
+        self._reindex_needed = False
 
     def set_header_line(self, header_line):
         """Takes a boolean to specify whether or not the
@@ -219,91 +1130,3182 @@ class Schema(JsonConfiguration):
         self._obj["dataFileContainsHeader"] = header_line
 
 
-class SchemaGuesser(object):
+class TypeCountSummary(object):
 
-    """Guesses at a good Schema object by looking at sample data.
+    """Per-attribute counts of how many sampled values looked like each
+    SchemaGuesser.CODE_* type.
+
+    Summaries of disjoint parts of a data set (for instance byte ranges of
+    one file, or the files under a prefix) can be combined with merge().
+    Because each part may have sampled a different fraction of its records,
+    merged counts are scaled up to estimates for all records seen.
+
+    Counts are kept in a numpy array when numpy is installed, so that very
+    wide tables can be updated a whole block of records at a time.
+
+    With track_distinct, the summary also estimates how many distinct
+    values each attribute has among the categorical and integer values
+    sampled, in a HyperLogLog per attribute.  The sketch is None until the
+    attribute has such a value, and False once the attribute is ruled out
+    as an id, either by a value like a decimal number or by a block of
+    samples with repeated values.  distinct_repeats counts the values
+    that repeated one earlier in their block, and distinct_words the
+    categorical values with spaces or over ID_MAX_LENGTH characters, which
+    look like names or short texts rather than keys.
     """
 
-    def __init__(self):
-        self.data = []
-        self.num_attributes = 0
-        self.schema = Schema()
-        self.text_words_threshold = 20  # Heuristic.
+    ID_MAX_LENGTH = 64
 
-    def from_file(self, filename, target_variable=None, header_line='auto',
-                  num_lines_to_use=1000):
-        """Returns a Schema object that is guessed by looking at the first
-        num_lines_to_use records from the given file.
+    def __init__(self, num_attributes, track_distinct=False):
+        if numpy is not None:
+            self.counts = numpy.zeros((num_attributes, 4), dtype=numpy.int64)
+        else:
+            self.counts = [[0, 0, 0, 0] for i in xrange(num_attributes)]
+        self.records_seen = 0
+        self.records_sampled = 0
+        self.distinct = None
+        self.distinct_counted = None
+        self.distinct_repeats = None
+        self.distinct_words = None
+        if track_distinct:
+            self.distinct = [None] * num_attributes
+            self.distinct_counted = [0] * num_attributes
+            self.distinct_repeats = [0] * num_attributes
+            self.distinct_words = [0] * num_attributes
 
-        Can set header_line to true or false if known, otherwise, it guesses.
+    def resize(self, num_attributes):
+        """Adds attributes, with nothing counted yet, up to num_attributes.
         """
-        f = open(filename)
-        try:
-            self._load_csv_data(f, num_lines_to_use)
-            schema = self._guess_schema_from_data(header_line)
-            if target_variable:
-                schema.set_target(target_variable)
-            return schema
-        finally:
-            f.close()
+        more = num_attributes - len(self.counts)
+        if more <= 0:
+            return
+        if numpy is not None:
+            self.counts = numpy.vstack(
+                [self.counts, numpy.zeros((more, 4), dtype=numpy.int64)])
+        else:
+            self.counts.extend([0, 0, 0, 0] for i in xrange(more))
+        if self.distinct is not None:
+            self.distinct.extend([None] * more)
+            self.distinct_counted.extend([0] * more)
+            self.distinct_repeats.extend([0] * more)
+            self.distinct_words.extend([0] * more)
 
-    def _guess_schema_from_data(self, header_line):
-        if header_line == 'auto':
-            header_line = self._guess_if_header_line_present()
-        self._name_attributes(header_line)
+    def add(self, codes, amount=1):
+        """Adds (or with a negative amount, removes) a classified record.
+        """
+        self.add_rows([codes], amount)
 
-        for i in xrange(self.num_attributes):  # Loop through columns
-            column = [row[i] for row in self.data]
-            if header_line:
-                column = column[1:]
-            self.schema.set_variable_type(i, self._guess_variable_type(column))
-        return self.schema
+    def add_rows(self, rows, amount=1):
+        """Adds (or removes) classified records.  rows can be a 2-D numpy
+        array with one row per record, or a list of bytearrays.  Values
+        of 0xFF mark missing values and are not counted.
+        """
+        if numpy is None:
+            for codes in rows:
+                for i, code in enumerate(codes):
+                    if code != 0xFF:
+                        self.counts[i][code] += amount
+            return
+        rows = numpy.asarray(rows, dtype=numpy.uint8)
+        for code in xrange(4):
+            self.counts[:, code] += amount * (rows == code).sum(axis=0)
 
-    def _guess_variable_type(self, samples):
-        counts = {
-            "NUMERIC": 0,
-            "BINARY": 0,
-            "TEXT": 0,
-            "CATEGORICAL": 0,
-        }
-        for sample in samples:
-            try:
-                num = float(sample)
-                counts["NUMERIC"] += 1
-                if num == 0 or num == 1:
-                    counts["BINARY"] += 1
-            except:
-                # Non-numeric
-                word_count = len(re.split("\s+", sample))
-                if word_count > self.text_words_threshold:
-                    counts["TEXT"] += 1
-                else:
-                    counts["CATEGORICAL"] += 1
-        return max(counts, key=counts.get)
+    def estimated_counts(self):
+        """Returns the counts scaled to cover all records seen.
+        """
+        if not self.records_sampled:
+            return self.counts
+        scale = float(self.records_seen) / self.records_sampled
+        if numpy is not None:
+            return self.counts * scale
+        return [[count * scale for count in column] for column in self.counts]
 
-    def _name_attributes(self, header_line):
-        digits = int(math.floor(math.log10(self.num_attributes))) + 1
-        for idx, name in enumerate(self.data[0]):
-            if header_line:
-                self.schema.set_variable_name(idx, name)
+    def merge(self, other):
+        """Returns a new summary covering the records of both summaries.
+        """
+        if len(self.counts) != len(other.counts):
+            raise SchemaException(
+                "Can't merge summaries of %d and %d attributes" %
+                (len(self.counts), len(other.counts)))
+        merged = TypeCountSummary(len(self.counts))
+        if numpy is not None:
+            merged.counts = self.estimated_counts() + other.estimated_counts()
+        else:
+            for column, mine, theirs in zip(merged.counts,
+                                            self.estimated_counts(),
+                                            other.estimated_counts()):
+                for code in xrange(4):
+                    column[code] = mine[code] + theirs[code]
+        merged.records_seen = self.records_seen + other.records_seen
+        merged.records_sampled = merged.records_seen
+        if self.distinct is not None and other.distinct is not None:
+            merged.distinct = [
+                False if a is False or b is False else
+                b if a is None else a if b is None else a.merge(b)
+                for a, b in zip(self.distinct, other.distinct)]
+            merged.distinct_counted = [
+                a + b for a, b in zip(self.distinct_counted,
+                                      other.distinct_counted)]
+            merged.distinct_repeats = [
+                a + b for a, b in zip(self.distinct_repeats,
+                                      other.distinct_repeats)]
+            merged.distinct_words = [
+                a + b for a, b in zip(self.distinct_words,
+                                      other.distinct_words)]
+        return merged
+
+    def add_distinct(self, records, codes, code_categorical, code_numeric,
+                     min_ratio):
+        """Adds the values of classified records to the distinct value
+        sketches.  codes is what SchemaGuesser._classify_rows returned for
+        the records.  Attributes with fewer than min_ratio distinct values
+        among these records are ruled out as ids.
+        """
+        if isinstance(codes, list):
+            tracked = [i for i, sketch in enumerate(self.distinct)
+                       if sketch is not False]
+        else:
+            # Only look at attributes that have a value worth tracking.
+            candidates = ((codes == code_categorical) |
+                          (codes == code_numeric)).any(axis=0)
+            tracked = [i for i in numpy.flatnonzero(candidates).tolist()
+                       if self.distinct[i] is not False]
+        for i in tracked:
+            if isinstance(codes, list):
+                column_codes = [row[i] for row in codes]
             else:
-                name = "Var{number:0{width}d}".format(width=digits, number = idx + 1)
-                self.schema.set_variable_name(idx, name)
+                column_codes = codes[:, i].tolist()
+            values = set()
+            counted = 0
+            words = 0
+            max_repeats = (1 - min_ratio) * len(records)
+            for record, code in zip(records, column_codes):
+                value = record[i]
+                if code == code_numeric:
+                    if '.' in value or 'e' in value or 'E' in value:
+                        # Not an integer, so not an id.
+                        break
+                elif code != code_categorical:
+                    continue
+                elif ' ' in value or '\t' in value or \
+                        len(value) > self.ID_MAX_LENGTH:
+                    words += 1
+                values.add(value)
+                counted += 1
+                # Most columns repeat values early on.
+                if not counted & 63 and counted - len(values) > max_repeats:
+                    break
+            else:
+                if len(values) >= min_ratio * counted:
+                    if self.distinct[i] is None:
+                        self.distinct[i] = HyperLogLog()
+                    for value in values:
+                        self.distinct[i].add(value)
+                    self.distinct_counted[i] += counted
+                    self.distinct_repeats[i] += counted - len(values)
+                    self.distinct_words[i] += words
+                    continue
+            self.distinct[i] = False
 
-    def _guess_if_header_line_present(self):
-        header_row = self.data[0]
-        has_header_line = self._guess_variable_type(
-            header_row) == "CATEGORICAL"
-        self.schema.set_header_line(has_header_line)
-        return has_header_line
+    def to_obj(self):
+        """Returns the summary as plain lists and numbers, for JSON.
+        """
+        counts = self.counts
+        if numpy is not None:
+            counts = counts.tolist()
+        obj = {
+            "counts": counts,
+            "records_seen": self.records_seen,
+            "records_sampled": self.records_sampled,
+        }
+        if self.distinct is not None:
+            obj["distinct"] = [
+                base64.b64encode(bytes(sketch.registers)).decode('ascii')
+                if sketch else sketch
+                for sketch in self.distinct]
+            obj["distinct_counted"] = self.distinct_counted
+            obj["distinct_repeats"] = self.distinct_repeats
+            obj["distinct_words"] = self.distinct_words
+        return obj
 
-    def _load_csv_data(self, csvfile, num_lines_to_use):
-        """Loads at most num_lines_to_use records from the open file with csv
-        data.  Returns as list of lists.
+    @classmethod
+    def from_obj(cls, obj):
+        """Inverse of to_obj().
         """
-        csvreader = csv.reader(csvfile)
-        for record in csvreader:
-            self.data.append(record)
-            if len(self.data) == num_lines_to_use:
-                break
-        self.num_attributes = len(self.data[0])
+        summary = cls(len(obj["counts"]))
+        if numpy is not None:
+            summary.counts = numpy.array(obj["counts"]).reshape(-1, 4)
+        else:
+            summary.counts = [list(column) for column in obj["counts"]]
+        summary.records_seen = obj["records_seen"]
+        summary.records_sampled = obj["records_sampled"]
+        if obj.get("distinct") is not None:
+            summary.distinct = []
+            for registers in obj["distinct"]:
+                sketch = registers
+                if registers:
+                    sketch = HyperLogLog()
+                    sketch.registers = bytearray(base64.b64decode(registers))
+                summary.distinct.append(sketch)
+            summary.distinct_counted = obj["distinct_counted"]
+            # Summaries saved before these were kept count as having
+            # repeats and words, so only names can make their ids.
+            unknown = [1] * len(obj["counts"])
+            summary.distinct_repeats = obj.get("distinct_repeats", unknown)
+            summary.distinct_words = obj.get("distinct_words", unknown)
+        return summary
+
+
+def _data_files(path):
+    """Returns the non-empty files at path, which can be a file or a
+    directory of shard files.
+    """
+    if os.path.isdir(path):
+        filenames = sorted(
+            os.path.join(path, fn) for fn in os.listdir(path)
+            if not fn.startswith('.') and
+            os.path.isfile(os.path.join(path, fn)))
+    else:
+        filenames = [path]
+    filenames = [fn for fn in filenames if os.path.getsize(fn) > 0]
+    if not filenames:
+        raise AWSPyMLException("No data found in %s" % path)
+    return filenames
+
+
+def _byte_ranges(filenames, bytes_per_range):
+    """Yields (filename, start, end) tuples splitting each file into
+    ranges of bytes_per_range bytes.
+    """
+    for fn in filenames:
+        size = os.path.getsize(fn)
+        for start in xrange(0, size, bytes_per_range):
+            yield (fn, start, min(start + bytes_per_range, size))
+
+
+def _byte_range_lines(f, start, end, chunk_size=1 << 20):
+    """Returns an iterator over the lines of the open binary file f that
+    start within the byte range [start, end).
+
+    Records with quoted newlines that straddle a range boundary can be
+    split, which costs at most one garbled record per boundary.
+    """
+    if start > 0:
+        # Back up one byte so a line starting exactly at `start`
+        # is not mistaken for the tail of the previous one.
+        f.seek(start - 1)
+        f.readline()
+        position = f.tell()
+    else:
+        f.seek(0)
+        position = 0
+    return itertools.chain.from_iterable(
+        _byte_range_chunks(f, position, end, chunk_size))
+
+
+def _byte_range_chunks(f, position, end, chunk_size):
+    """Yields file-like chunks of whole lines, read from f's position up
+    to and including the line that spans end.  Reading a chunk at a time
+    keeps splitting it into lines out of the Python loop.
+    """
+    while position < end:
+        chunk = f.read(min(chunk_size, end - position))
+        if not chunk:
+            break
+        if not chunk.endswith(b'\n'):
+            chunk += f.readline()
+        position += len(chunk)
+        yield io.BytesIO(chunk)
+
+
+def _summarize_byte_range(task):
+    """Worker for SchemaGuesser.from_file_parallel.  Builds a
+    TypeCountSummary from the records of one newline-aligned byte range.
+    """
+    (filename, start, end, skip_first_record, num_attributes,
+     reservoir_size, text_words_threshold, id_distinct_ratio) = task
+    guesser = SchemaGuesser()
+    guesser.text_words_threshold = text_words_threshold
+    guesser.id_distinct_ratio = id_distinct_ratio
+    guesser.num_attributes = num_attributes
+    f = open(filename, 'rb')
+    try:
+        records = csv.reader(_byte_range_lines(f, start, end))
+        if skip_first_record:
+            next(records, None)
+        return guesser._sample_records(records, reservoir_size)
+    finally:
+        f.close()
+
+
+def _parse_s3_url(s3url):
+    """Splits an s3://bucket/key URL into (bucket, key).
+    """
+    match = re.match(r"^s3://([^/]+)/(.+)$", s3url)
+    if not match:
+        raise AWSPyMLException("Invalid S3 URL %s" % s3url)
+    return match.group(1), match.group(2)
+
+
+class S3RangeReader(object):
+
+    """Reads byte ranges of an S3 object without downloading all of it.
+    Safe to use from several threads, each of which gets its own
+    connection.
+    """
+
+    def __init__(self, s3url):
+        self.s3url = s3url
+        self.bucket_name, self.key_name = _parse_s3_url(s3url)
+        self._local = threading.local()
+
+    def _key(self):
+        key = getattr(self._local, "key", None)
+        if key is None:
+            bucket = boto.connect_s3().get_bucket(self.bucket_name,
+                                                  validate=False)
+            key = bucket.get_key(self.key_name)
+            if key is None:
+                raise AWSPyMLException("No such S3 object %s" % self.s3url)
+            self._local.key = key
+        return key
+
+    def size(self):
+        return self._key().size
+
+    def read(self, start, end):
+        """Returns the bytes in the range [start, end).
+        """
+        return self._key().get_contents_as_string(
+            headers={"Range": "bytes=%d-%d" % (start, end - 1)})
+
+
+class LocalRangeReader(object):
+
+    """Local stand-in for S3RangeReader, reading byte ranges of a file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def size(self):
+        return os.path.getsize(self.filename)
+
+    def read(self, start, end):
+        f = open(self.filename, 'rb')
+        try:
+            f.seek(start)
+            return f.read(end - start)
+        finally:
+            f.close()
+
+
+def range_reader(url):
+    """Returns a reader for byte ranges of an s3:// URL or a local file.
+    Any other object store can be used by passing an object with the same
+    size() and read(start, end) methods to SchemaGuesser.from_object.
+    """
+    if url.startswith("s3://"):
+        return S3RangeReader(url)
+    if url.startswith("file://"):
+        url = url[len("file://"):]
+    return LocalRangeReader(url)
+
+
+def _sample_byte_ranges(size, num_blocks, block_size):
+    """Returns sorted (start, end) byte ranges to sample an object of the
+    given size: the head, plus one randomly placed block in each of
+    num_blocks equal strata of the rest.  Small objects are read whole.
+    """
+    if size <= (num_blocks + 1) * block_size:
+        return [(0, size)]
+    ranges = [(0, block_size)]
+    stratum = (size - block_size) // num_blocks
+    for i in xrange(num_blocks):
+        low = block_size + i * stratum
+        start = random.randint(low, low + stratum - block_size)
+        ranges.append((start, start + block_size))
+    return ranges
+
+
+def _block_lines(data, start, end, size):
+    """Returns the complete lines in data, which holds the bytes [start,
+    end) of an object of the given size.  Unless the block starts the
+    object, everything up to the first newline is the tail of a line that
+    started earlier, so it is dropped, as is a partial last line.
+    """
+    lines = data.splitlines(True)
+    if start > 0 and lines:
+        lines.pop(0)
+    if end < size and lines and not lines[-1].endswith(b'\n'):
+        lines.pop()
+    return lines
+
+
+def file_fingerprint(filename, size, num_blocks=16, block_size=4096):
+    """Returns a hash of the first size bytes of the file, computed from
+    num_blocks blocks spread evenly across them (always including the
+    first and last block).  Cheap even for very large files, at the cost
+    of missing changes that fall between the blocks.
+    """
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    f = open(filename, 'rb')
+    try:
+        last_block = max(0, size - block_size)
+        for i in xrange(num_blocks):
+            f.seek(last_block * i // max(1, num_blocks - 1))
+            digest.update(f.read(min(block_size, size)))
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+class SchemaGuessCache(object):
+
+    """On-disk cache of what SchemaGuesser learned about files, keyed by
+    file name and guessing options, and checked against the file's size,
+    mtime and file_fingerprint().
+
+    Entries hold the TypeCountSummary rather than just the Schema, so that
+    the summary of records appended to a file can be merged into it.  Once
+    the cache directory holds more than max_bytes, the least recently used
+    entries are deleted.
+    """
+
+    def __init__(self, directory=None, max_bytes=16 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.awspyml',
+                                     'schema-cache')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, filename, options):
+        key = json.dumps([os.path.abspath(filename), options], sort_keys=True)
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() +
+                            '.json')
+
+    def get(self, filename, options):
+        """Returns the cached entry (a dict) for the file, or None.
+        """
+        path = self._entry_path(filename, options)
+        try:
+            f = open(path)
+            try:
+                entry = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return None
+        os.utime(path, None)  # Mark as recently used
+        return entry
+
+    def put(self, filename, options, entry):
+        path = self._entry_path(filename, options)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        f = open(tmp_path, 'w')
+        try:
+            json.dump(entry, f)
+        finally:
+            f.close()
+        if os.path.exists(path):
+            os.remove(path)  # Windows won't rename over an existing file
+        os.rename(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for fn in os.listdir(self.directory):
+            if fn.endswith('.json'):
+                path = os.path.join(self.directory, fn)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+# Bit flags describing a character, for vectorized classification.
+_CHAR_NUMERIC = 1  # Can appear in something float() accepts
+_CHAR_DIGIT = 2
+_CHAR_SPACE = 4  # Matched by "\s"
+_CHAR_NON_ASCII = 8
+_CHAR_LETTER_N = 16
+
+
+def _char_flags_table(spaces):
+    """Returns a bytes.translate() table mapping each character code to its
+    _CHAR_* flags.  Any code from 128 up stands for all non-ASCII
+    characters, which may be other scripts' digits.
+    """
+    table = bytearray(256)
+    # NUL is the padding numpy uses for strings shorter than the longest.
+    for c in '0123456789+-._eEnNaAiIfFtTyY\x00' + spaces:
+        table[ord(c)] |= _CHAR_NUMERIC
+    for c in '0123456789':
+        table[ord(c)] |= _CHAR_DIGIT
+    for c in spaces:
+        table[ord(c)] |= _CHAR_SPACE
+    table[ord('n')] |= _CHAR_LETTER_N
+    table[ord('N')] |= _CHAR_LETTER_N
+    for code in xrange(128, 256):
+        table[code] = _CHAR_NUMERIC | _CHAR_DIGIT | _CHAR_NON_ASCII
+    return bytes(table)
+
+
+_ASCII_SPACES = ' \t\n\r\x0b\x0c'
+_BYTE_CHAR_FLAGS = _char_flags_table(_ASCII_SPACES)
+# Unicode strings have more whitespace, including some outside of ASCII.
+_UNICODE_CHAR_FLAGS = _char_flags_table(_ASCII_SPACES + '\x1c\x1d\x1e\x1f')
+_NON_FINITE_WORDS = ['nan', 'inf', 'infinity']
+# Attribute names like "id", "customer_id", "customerId", "order key", or
+# the tweet fields "sid" and "r.uid".
+_ID_NAME = re.compile(r'(?:^|[^A-Za-z])(?:[cgopstu]?[Ii][Dd]|[Kk]ey|'
+                      r'[Uu]u[Ii][Dd]|[Gg]u[Ii][Dd])$|'
+                      r'[a-z0-9](?:Id|ID|Key|Uuid|UUID)$')
+
+
+def _parse_float_range(values, idx, numbers, numeric=None):
+    """Parses values[idx], from a numpy array of strings, into numbers[idx]
+    in bulk, and sets numeric[idx] for the values that parse.  The batch
+    is split in two whenever it contains something that does not parse.
+    """
+    if len(idx) <= 8:
+        for i in idx:
+            try:
+                numbers[i] = float(values[i])
+            except ValueError:
+                continue
+            if numeric is not None:
+                numeric[i] = True
+        return
+    try:
+        # Parsing a list is much faster than astype on an array.
+        numbers[idx] = numpy.array(values[idx].tolist(), dtype=numpy.float64)
+    except ValueError:
+        half = len(idx) // 2
+        _parse_float_range(values, idx[:half], numbers, numeric)
+        _parse_float_range(values, idx[half:], numbers, numeric)
+        return
+    if numeric is not None:
+        numeric[idx] = True
+
+
+class SchemaGuesser(object):
+
+    """Guesses at a good Schema object by looking at sample data.
+    """
+
+    # Each sampled cell is reduced to one of these codes, so that a column
+    # can be summarized by four counters instead of by its values.
+    CODE_NUMERIC = 0  # numeric, but not 0 or 1
+    CODE_BINARY = 1  # numeric 0 or 1
+    CODE_TEXT = 2
+    CODE_CATEGORICAL = 3
+
+    # Records are classified in blocks of about this many values, so
+    # memory use stays bounded however wide the table is.
+    BLOCK_VALUES = 1 << 20
+    # Samples of at least this many records are classified a column at a
+    # time.
+    COLUMN_MIN_RECORDS = 256
+
+    def __init__(self):
+        self.first_row = None
+        self.num_attributes = 0
+        self.num_records = 0
+        self.summary = None
+        self.schema = Schema()
+        self.text_words_threshold = 20  # Heuristic.
+        # Classify whole columns at once with numpy when it is installed.
+        self.vectorize = numpy is not None
+        # Attributes with at least this fraction of distinct values among
+        # id_min_values or more sampled values look like ids.  The first
+        # becomes the rowId and the others are excluded from the model.
+        # Set id_distinct_ratio to None to turn this off.
+        self.id_distinct_ratio = 0.95
+        self.id_min_values = 100
+
+    def from_file(self, filename, target_variable=None, header_line='auto',
+                  num_lines_to_use=1000, streaming=False, cache=None):
+        """Returns a Schema object that is guessed by looking at the first
+        num_lines_to_use records from the given file.
+
+        Can set header_line to true or false if known, otherwise, it guesses.
+
+        If streaming is set, the whole file is read once and num_lines_to_use
+        records are reservoir sampled from all of it, so the guess is not
+        biased by how the file is sorted.  Memory use stays bounded no
+        matter how large the file is.
+
+        If a SchemaGuessCache is given, a file that hasn't changed since it
+        was last guessed isn't read again, and a file that has only been
+        appended to only has its new records read.
+
+        An s3:// URL is sampled in place with from_object.
+        """
+        if filename.startswith("s3://"):
+            return self.from_object(filename, target_variable=target_variable,
+                                    header_line=header_line,
+                                    num_lines_to_use=num_lines_to_use)
+        if cache is not None:
+            self._load_cached_summary(filename, header_line, num_lines_to_use,
+                                      streaming, cache)
+        else:
+            self._read_file(filename, num_lines_to_use, streaming)
+        return self._finish_schema(header_line, target_variable)
+
+    def _read_file(self, filename, num_lines_to_use, streaming):
+        f = open(filename)
+        try:
+            if streaming:
+                self._stream_csv_data(f, num_lines_to_use)
+            else:
+                self._load_csv_data(f, num_lines_to_use)
+        finally:
+            f.close()
+
+    def _load_cached_summary(self, filename, header_line, num_lines_to_use,
+                             streaming, cache):
+        """Sets first_row and summary from the cache where possible, reading
+        only what the cache doesn't cover, and updates the cache.
+        """
+        options = {
+            "header_line": header_line,
+            "num_lines_to_use": num_lines_to_use,
+            "streaming": streaming,
+            "text_words_threshold": self.text_words_threshold,
+            # The sketches depend on the ratio, not just on whether
+            # there is one.
+            "id_distinct_ratio": self.id_distinct_ratio,
+        }
+        stat = os.stat(filename)
+        entry = cache.get(filename, options)
+        summary = None
+        if (entry is not None and stat.st_size >= entry["size"] and
+                file_fingerprint(filename, entry["size"]) ==
+                entry["fingerprint"]):
+            self.first_row = entry["first_row"]
+            self.num_attributes = len(self.first_row)
+            cached = TypeCountSummary.from_obj(entry["summary"])
+            if stat.st_size == entry["size"]:
+                if stat.st_mtime == entry["mtime"]:
+                    summary = cached
+            elif not streaming:
+                if cached.records_seen >= num_lines_to_use - 1:
+                    # The first lines, which are all that is used, are the
+                    # same as before.
+                    summary = cached
+            elif entry["ends_with_newline"]:
+                # Appended to, so only the new records need summarizing.
+                tail = _summarize_byte_range(
+                    (filename, entry["size"], stat.st_size, False,
+                     self.num_attributes, num_lines_to_use,
+                     self.text_words_threshold, self.id_distinct_ratio))
+                summary = cached.merge(tail)
+
+        if summary is not None:
+            self.summary = summary
+            self.num_records = summary.records_seen + 1
+        else:
+            self._read_file(filename, num_lines_to_use, streaming)
+
+        f = open(filename, 'rb')
+        try:
+            f.seek(max(0, stat.st_size - 1))
+            ends_with_newline = f.read(1) in (b'\n', b'')
+        finally:
+            f.close()
+        cache.put(filename, options, {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "fingerprint": file_fingerprint(filename, stat.st_size),
+            "ends_with_newline": ends_with_newline,
+            "first_row": self.first_row,
+            "summary": self.summary.to_obj(),
+        })
+
+    def from_file_parallel(self, path, target_variable=None,
+                           header_line='auto', num_lines_to_use=1000,
+                           processes=None, bytes_per_task=64 * 1024 * 1024):
+        """Returns a Schema object guessed from a large CSV file, or from
+        every file in a directory of CSV shards, using several processes.
+
+        Each file is split into newline-aligned byte ranges of about
+        bytes_per_task bytes.  Every range is reservoir sampled (keeping
+        num_lines_to_use records) in a worker process, and the resulting
+        TypeCountSummary objects are merged.  When the data has a header
+        line, every shard file is expected to start with it.
+        """
+        filenames = _data_files(path)
+        f = open(filenames[0], 'rb')
+        try:
+            self.first_row = next(csv.reader(f))
+        finally:
+            f.close()
+        self.num_attributes = len(self.first_row)
+        if header_line == 'auto':
+            header_line = self._guess_if_header_line_present()
+        self.schema.set_header_line(header_line)
+
+        tasks = []
+        for fn, start, end in _byte_ranges(filenames, bytes_per_task):
+            # The first file's first record is self.first_row, which
+            # is added back later if it is not a header.
+            skip_first = start == 0 and (header_line or fn == filenames[0])
+            tasks.append((fn, start, end, skip_first, self.num_attributes,
+                          num_lines_to_use, self.text_words_threshold,
+                          self.id_distinct_ratio))
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            summaries = pool.map(_summarize_byte_range, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        self.summary = summaries[0]
+        for summary in summaries[1:]:
+            self.summary = self.summary.merge(summary)
+        self.num_records = self.summary.records_seen + 1
+
+        return self._finish_schema(header_line, target_variable)
+
+    def from_object(self, url, target_variable=None, header_line='auto',
+                    num_lines_to_use=1000, num_blocks=16,
+                    block_size=256 * 1024, threads=8):
+        """Returns a Schema object guessed from a few byte ranges of a large
+        object, such as an s3:// URL, without downloading all of it.
+
+        url can also be a local filename, or any object with size() and
+        read(start, end) methods (see range_reader).  The head of the object
+        and num_blocks randomly placed blocks of block_size bytes are
+        fetched concurrently by threads threads, cut down to their complete
+        lines, and num_lines_to_use of those records are sampled.  So a
+        100 GB object costs a few MB of transfer.
+
+        A record with a quoted newline can be split at the start of a
+        block, which costs at most one garbled record per block.
+        """
+        reader = range_reader(url) if isinstance(url, basestring) else url
+        size = reader.size()
+        if size == 0:
+            raise SchemaException("No records found")
+        ranges = _sample_byte_ranges(size, num_blocks, block_size)
+        pool = ThreadPool(min(threads, len(ranges)))
+        try:
+            blocks = pool.map(lambda r: reader.read(r[0], r[1]), ranges)
+        finally:
+            pool.close()
+            pool.join()
+
+        csvreader = csv.reader(itertools.chain.from_iterable(
+            _block_lines(data, start, end, size)
+            for (start, end), data in zip(ranges, blocks)))
+        self._read_first_row(csvreader)
+        if header_line == 'auto':
+            header_line = self._guess_if_header_line_present()
+        self.schema.set_header_line(header_line)
+        self.summary = self._sample_records(csvreader, num_lines_to_use)
+        # Extrapolate the number of records from the sampled bytes.
+        sampled_bytes = sum(len(data) for data in blocks)
+        self.num_records = int(
+            (self.summary.records_seen + 1) * size / float(sampled_bytes))
+        return self._finish_schema(header_line, target_variable)
+
+    def _finish_schema(self, header_line, target_variable):
+        schema = self._guess_schema_from_data(header_line)
+        if target_variable:
+            schema.set_target(target_variable)
+        if self.id_distinct_ratio is not None:
+            id_names = [name for name in self.id_like_attributes()
+                        if name != target_variable]
+            if id_names and schema.row_id() is None:
+                schema.set_row_id(id_names.pop(0))
+            schema.exclude_attributes(id_names)
+        return schema
+
+    def id_like_attributes(self):
+        """Returns the names of the attributes that look like ids, those
+        named like keys first, and otherwise in schema order.
+
+        An id is a CATEGORICAL or NUMERIC (integer) attribute whose sampled
+        values were nearly all distinct (see id_distinct_ratio), and that
+        is also named like a key (see _ID_NAME), or else looks like one:
+        single-word categorical values, or integers that never repeated.
+        Short texts and names, and numeric features like incomes, are
+        nearly all distinct too, so a distinct ratio alone doesn't make an
+        attribute an id.  TEXT attributes never are.
+        """
+        summary = self.summary
+        if summary is None or summary.distinct is None:
+            return []
+        attributes = self.schema.attributes()
+        named = []
+        others = []
+        for idx, sketch in enumerate(summary.distinct):
+            counted = summary.distinct_counted[idx]
+            if not sketch or counted < self.id_min_values:
+                continue
+            if sketch.estimate() < self.id_distinct_ratio * counted:
+                continue
+            var = attributes[idx]
+            name = var["attributeName"]
+            name_hint = _ID_NAME.search(name) is not None
+            if var["attributeType"] == "CATEGORICAL":
+                looks_like_key = not summary.distinct_words[idx]
+            elif var["attributeType"] == "NUMERIC":
+                looks_like_key = not summary.distinct_repeats[idx]
+            else:
+                continue
+            if name_hint:
+                named.append(name)
+            elif looks_like_key:
+                others.append(name)
+        return named + others
+
+    def _guess_schema_from_data(self, header_line):
+        if header_line == 'auto':
+            header_line = self._guess_if_header_line_present()
+        self._name_attributes(header_line)
+
+        # Samples were already reduced to counters while reading.
+        if not header_line:
+            self.summary.add(self._classify_row(self.first_row))
+        counts = self.summary.estimated_counts()
+        for i in xrange(self.num_attributes):
+            self.schema.set_variable_type(
+                i, self._guess_variable_type_from_counts(counts[i]))
+        return self.schema
+
+    def _classify_sample(self, sample):
+        """Returns the CODE_* constant describing a single value.
+        """
+        try:
+            num = float(sample)
+            if num == 0 or num == 1:
+                return self.CODE_BINARY
+            return self.CODE_NUMERIC
+        except:
+            # Non-numeric
+            word_count = len(re.split("\s+", sample))
+            if word_count > self.text_words_threshold:
+                return self.CODE_TEXT
+            else:
+                return self.CODE_CATEGORICAL
+
+    def _guess_variable_type(self, samples):
+        codes = self._classify_column(samples)
+        if isinstance(codes, list):
+            code_counts = [0, 0, 0, 0]
+            for code in codes:
+                code_counts[code] += 1
+        else:
+            code_counts = numpy.bincount(codes, minlength=4).tolist()
+        return self._guess_variable_type_from_counts(code_counts)
+
+    def _classify_column(self, samples):
+        """Returns the CODE_* constants describing each of the samples.
+        """
+        if not self.vectorize or len(samples) < 64:
+            return [self._classify_sample(sample) for sample in samples]
+        # Most columns repeat a few values (categories, flags, missing value
+        # markers), and then only the distinct values need classifying.
+        if len(set(samples[:64])) <= 48:
+            distinct = list(set(samples))
+            if len(distinct) * 4 <= len(samples):
+                code_of = dict(zip(distinct, numpy.asarray(
+                    self._classify_column(distinct)).tolist()))
+                return numpy.frombuffer(
+                    bytearray(map(code_of.__getitem__, samples)),
+                    dtype=numpy.uint8)
+        codes = numpy.empty(len(samples), dtype=numpy.uint8)
+        try:
+            # Usually a column is entirely numeric or entirely not.
+            numbers = numpy.array(samples, dtype=numpy.float64)
+            codes[:] = numpy.where((numbers == 0) | (numbers == 1),
+                                   self.CODE_BINARY, self.CODE_NUMERIC)
+            return codes
+        except (ValueError, TypeError):
+            pass
+        values = numpy.array(samples)
+        if values.dtype.kind not in ('S', 'U'):
+            return [self._classify_sample(sample) for sample in samples]
+        return self._classify_column_vectorized(samples, values, codes)
+
+    def _classify_column_vectorized(self, samples, values, codes):
+        """Same as classifying each sample with _classify_sample, but works
+        on a numpy array of strings as a whole.  Fills in and returns codes.
+
+        The strings are viewed as a matrix of character codes (one row per
+        sample), which is enough to rule out most non-numeric values and
+        to count whitespace-separated words without a per-value regex.
+        """
+        if values.dtype.kind == 'U':
+            chars = numpy.minimum(values.view(numpy.uint32), 255)
+            chars = chars.astype(numpy.uint8).tobytes()
+            table = _UNICODE_CHAR_FLAGS
+        else:
+            chars = values.tobytes()
+            table = _BYTE_CHAR_FLAGS
+        # bytes.translate is a much faster lookup table than numpy.take
+        flags = numpy.frombuffer(chars.translate(table), dtype=numpy.uint8)
+        flags = flags.reshape(len(values), -1)
+
+        numeric, numbers = self._parse_numeric_column(samples, values, flags)
+        numbers = numbers[numeric]
+        codes[numeric] = numpy.where((numbers == 0) | (numbers == 1),
+                                     self.CODE_BINARY, self.CODE_NUMERIC)
+
+        other = numpy.flatnonzero(~numeric)
+        if len(other) == len(values):
+            other_flags = flags
+        else:
+            other_flags = flags[other]
+        if len(other):
+            word_counts = self._count_words_column(samples, other, other_flags)
+            codes[other] = numpy.where(
+                word_counts > self.text_words_threshold,
+                self.CODE_TEXT, self.CODE_CATEGORICAL)
+        return codes
+
+    def _parse_numeric_column(self, samples, values, flags):
+        """Returns a boolean array of which values parse as floats, and the
+        parsed numbers for those values.
+        """
+        numeric = numpy.zeros(len(values), dtype=bool)
+        numbers = numpy.zeros(len(values))
+        # Most values that can't be numbers give themselves away in their
+        # first few characters, so only scan the rest of the others.
+        plausible = numpy.flatnonzero(
+            (flags[:, :8] & _CHAR_NUMERIC).all(axis=1))
+        plausible = plausible[
+            (flags[plausible, 8:] & _CHAR_NUMERIC).all(axis=1)]
+        plausible_flags = flags[plausible]
+        has_digit = (plausible_flags & _CHAR_DIGIT).any(axis=1)
+        # Without digits, only nan and inf (with a sign) can be floats, and
+        # both of those contain an "n".
+        words = numpy.flatnonzero(
+            ~has_digit & (plausible_flags & _CHAR_LETTER_N).any(axis=1))
+        for i in words:
+            word = samples[plausible[i]].strip().lower()
+            has_digit[i] = word.lstrip('+-') in _NON_FINITE_WORDS
+        _parse_float_range(values, plausible[has_digit], numbers, numeric)
+        return numeric, numbers
+
+    def _count_words_column(self, samples, idx, flags):
+        """Returns len(re.split("\\s+", sample)) for each of samples[idx],
+        given the _CHAR_* flags of their characters.
+        """
+        space = flags & _CHAR_SPACE
+        # One more word than there are runs of whitespace.
+        word_counts = (numpy.count_nonzero(space[:, 1:] > space[:, :-1],
+                                           axis=1) +
+                       (space[:, 0] > 0) + 1)
+        if isinstance(samples[0], type(u'')):
+            # Unicode has whitespace outside of ASCII, so leave samples
+            # with non-ASCII characters to the regex.
+            non_ascii = (flags & _CHAR_NON_ASCII).any(axis=1)
+            for j in numpy.flatnonzero(non_ascii):
+                word_counts[j] = len(re.split("\s+", samples[idx[j]]))
+        return word_counts
+
+    def _guess_variable_type_from_counts(self, code_counts):
+        """Picks the variable type given how many samples of each
+        CODE_* were seen.
+        """
+        counts = {
+            "NUMERIC": code_counts[self.CODE_NUMERIC] +
+            code_counts[self.CODE_BINARY],
+            "BINARY": code_counts[self.CODE_BINARY],
+            "TEXT": code_counts[self.CODE_TEXT],
+            "CATEGORICAL": code_counts[self.CODE_CATEGORICAL],
+        }
+        return max(counts, key=counts.get)
+
+    def _name_attributes(self, header_line):
+        digits = int(math.floor(math.log10(self.num_attributes))) + 1
+        for idx, name in enumerate(self.first_row):
+            if header_line:
+                self.schema.set_variable_name(idx, name)
+            else:
+                name = "Var{number:0{width}d}".format(width=digits, number = idx + 1)
+                self.schema.set_variable_name(idx, name)
+
+    def _guess_if_header_line_present(self):
+        header_row = self.first_row
+        has_header_line = self._guess_variable_type(
+            header_row) == "CATEGORICAL"
+        self.schema.set_header_line(has_header_line)
+        return has_header_line
+
+    def _read_first_row(self, csvreader):
+        self.first_row = next(csvreader, None)
+        if not self.first_row:
+            raise SchemaException("No records found")
+        self.num_attributes = len(self.first_row)
+
+    def _load_csv_data(self, csvfile, num_lines_to_use):
+        """Classifies at most num_lines_to_use records from the open file
+        with csv data, and keeps their TypeCountSummary.
+        """
+        csvreader = csv.reader(csvfile)
+        self._read_first_row(csvreader)
+        num_to_sample = max(1, num_lines_to_use - 1)
+        self.summary = self._sample_records(
+            itertools.islice(csvreader, num_to_sample), num_to_sample)
+        self.num_records = self.summary.records_seen + 1
+
+    def _classify_row(self, record):
+        """Reduces a record to a bytearray of CODE_* values, one per
+        attribute.  Short rows are padded with 0xFF, which is not counted.
+        """
+        codes = bytearray(b'\xff' * self.num_attributes)
+        for i in xrange(min(len(record), self.num_attributes)):
+            codes[i] = self._classify_sample(record[i])
+        return codes
+
+    def _classify_rows(self, records):
+        """Same as _classify_row for each record, but returns a 2-D numpy
+        array of codes when vectorizing.
+
+        The records are transposed into columns, and each column is
+        classified on its own.  With too few records for that to pay for
+        numpy's per-call overhead, columns whose first values look alike
+        are classified together as one flat sample instead, so that very
+        wide tables stay fast without a run of text columns spoiling the
+        fast path of numeric ones.  Values missing from short records are
+        coded 0xFF, and values past the last attribute are ignored.
+        """
+        if not self.vectorize:
+            return [self._classify_row(record) for record in records]
+        num_attributes = self.num_attributes
+        short = [(i, len(record)) for i, record in enumerate(records)
+                 if len(record) < num_attributes]
+        if short:
+            records = list(records)
+            for i, length in short:
+                records[i] = records[i] + [''] * (num_attributes - length)
+        columns = list(zip(*records))[:num_attributes]
+
+        codes = numpy.empty((num_attributes, len(records)), dtype=numpy.uint8)
+        if len(records) >= self.COLUMN_MIN_RECORDS:
+            for idx, column in enumerate(columns):
+                codes[idx] = self._classify_column(column)
+        else:
+            groups = collections.defaultdict(list)
+            for idx, column in enumerate(columns):
+                kind = self._classify_sample(column[0])
+                if kind == self.CODE_BINARY:
+                    kind = self.CODE_NUMERIC
+                groups[kind].append(idx)
+            step = max(1, 65536 // len(records))
+            for group in groups.values():
+                for start in xrange(0, len(group), step):
+                    run = group[start:start + step]
+                    samples = list(itertools.chain.from_iterable(
+                        columns[idx] for idx in run))
+                    codes[run] = numpy.asarray(
+                        self._classify_column(samples),
+                        dtype=numpy.uint8).reshape(len(run), len(records))
+        codes = codes.T
+        for i, length in short:
+            codes[i, length:] = 0xFF
+        return codes
+
+    def _stream_csv_data(self, csvfile, reservoir_size):
+        """Reads every record from the open file with csv data, keeping a
+        uniform random sample of reservoir_size records after the first.
+        """
+        csvreader = csv.reader(csvfile)
+        self._read_first_row(csvreader)
+        self.summary = self._sample_records(csvreader, reservoir_size)
+        self.num_records = self.summary.records_seen + 1
+
+    def _sample_records(self, records, reservoir_size):
+        """Returns a TypeCountSummary of a uniform random sample of
+        reservoir_size of the given records.
+
+        Sampled records are only kept in their classified form, and the
+        per-attribute type counters are updated as records enter and leave
+        the reservoir.  Uses Li's "Algorithm L" so that records which will
+        not be sampled are skipped without being classified.  Newly
+        sampled records are classified in blocks, in _replace_samples.
+        """
+        summary = TypeCountSummary(
+            self.num_attributes,
+            track_distinct=self.id_distinct_ratio is not None)
+        if self.vectorize:
+            reservoir = numpy.empty((reservoir_size, self.num_attributes),
+                                    dtype=numpy.uint8)
+            reservoir.fill(0xFF)
+        else:
+            reservoir = [None] * reservoir_size
+        pending = {}  # Reservoir slot -> record not classified yet
+        block_size = max(1, self.BLOCK_VALUES // self.num_attributes)
+        num_seen = 0
+        next_sample = None
+        w = 1.0
+        for record in records:
+            num_seen += 1
+            if num_seen <= reservoir_size:
+                pending[num_seen - 1] = record
+                if num_seen == reservoir_size:
+                    w = math.exp(math.log(random.random()) / reservoir_size)
+                    next_sample = num_seen + self._reservoir_skip(w) + 1
+            elif num_seen < next_sample:
+                continue
+            else:
+                pending[random.randrange(reservoir_size)] = record
+                w *= math.exp(math.log(random.random()) / reservoir_size)
+                next_sample = num_seen + self._reservoir_skip(w) + 1
+            if len(pending) >= block_size:
+                self._replace_samples(summary, reservoir, pending)
+                pending = {}
+        self._replace_samples(summary, reservoir, pending)
+        summary.records_seen = num_seen
+        summary.records_sampled = min(num_seen, reservoir_size)
+        return summary
+
+    def _replace_samples(self, summary, reservoir, pending):
+        """Classifies the pending records and puts them in their reservoir
+        slots, moving the counts of the records they replace out of summary.
+        """
+        if not pending:
+            return
+        slots = list(pending)
+        records = [pending[slot] for slot in slots]
+        codes = self._classify_rows(records)
+        if summary.distinct is not None:
+            summary.add_distinct(records, codes, self.CODE_CATEGORICAL,
+                                 self.CODE_NUMERIC, self.id_distinct_ratio)
+        if isinstance(reservoir, list):
+            for slot, row in zip(slots, codes):
+                if reservoir[slot] is not None:
+                    summary.add(reservoir[slot], -1)
+                reservoir[slot] = row
+            summary.add_rows(codes)
+        else:
+            summary.add_rows(reservoir[slots], -1)
+            reservoir[slots] = codes
+            summary.add_rows(codes)
+
+    def _reservoir_skip(self, w):
+        """Number of records to pass over before the next one is sampled.
+        """
+        return int(math.floor(math.log(random.random()) / math.log(1 - w)))
+
+
+def _flatten_json(obj, prefix=''):
+    """Flattens nested JSON objects into one dict, joining the keys on the
+    way down with dots, so {"r": {"sid": 1}} becomes {"r.sid": 1}.
+    """
+    flat = collections.OrderedDict()
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            flat.update(_flatten_json(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def _json_record(line, line_number):
+    """Parses one line of a JSON lines file into a flattened record.
+    Raises SchemaException for a line that isn't valid JSON or isn't an
+    object, since there are no field names to give its values.
+    """
+    try:
+        obj = json.loads(line, object_pairs_hook=collections.OrderedDict)
+    except ValueError as e:
+        raise SchemaException("Line %d is not valid JSON: %s"
+                              % (line_number, e))
+    if not isinstance(obj, dict):
+        raise SchemaException("Line %d is a JSON %s, not an object"
+                              % (line_number, type(obj).__name__))
+    return _flatten_json(obj)
+
+
+def _json_cell(value):
+    """Converts a flattened JSON value to the string that goes in its CSV
+    cell, or None for null.  Lists become their items separated by spaces.
+    """
+    if value is None:
+        return None
+    if isinstance(value, type(u'')) or isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, list):
+        cells = [_json_cell(item) for item in value]
+        return u' '.join(cell for cell in cells if cell is not None)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return str(value)  # ints and booleans
+
+
+class JsonLinesSchemaGuesser(SchemaGuesser):
+
+    """Guesses a Schema for a file with one JSON object per line, such as
+    the tweets written by social-media/gather-data.py.  Nested objects are
+    flattened into dotted attribute names, and the attributes are the
+    union of the fields of all records, in the order they first appear.
+    write_csv converts the file to a CSV file that matches the schema.
+    """
+
+    def __init__(self):
+        super(JsonLinesSchemaGuesser, self).__init__()
+        self.field_names = []
+
+    def from_file(self, filename, target_variable=None,
+                  num_lines_to_use=None):
+        """Returns a Schema object guessed from the records of the given
+        JSON lines file, read once from start to end (or just the first
+        num_lines_to_use lines).  Every non-blank line must be a JSON
+        object, or SchemaException is raised.
+
+        Records are classified a block at a time and only their type
+        counts are kept, so memory use depends on the number of fields
+        and not on the size of the file.
+        """
+        self.field_names = []
+        self.summary = TypeCountSummary(
+            0, track_distinct=self.id_distinct_ratio is not None)
+        field_index = {}
+        block = []
+        f = open(filename)
+        try:
+            for line_number, line in enumerate(
+                    itertools.islice(f, num_lines_to_use), 1):
+                if not line.strip():
+                    continue
+                record = _json_record(line, line_number)
+                for name in record:
+                    if name not in field_index:
+                        field_index[name] = len(self.field_names)
+                        self.field_names.append(name)
+                block.append(record)
+                if len(block) * len(self.field_names) >= self.BLOCK_VALUES:
+                    self._add_records(block)
+                    block = []
+            self._add_records(block)
+        finally:
+            f.close()
+        if not self.field_names:
+            raise SchemaException("No records found")
+        self.first_row = self.field_names
+        self.num_records = self.summary.records_seen
+        self.summary.records_sampled = self.summary.records_seen
+        self.schema.set_header_line(True)
+        return self._finish_schema(True, target_variable)
+
+    def _add_records(self, records):
+        """Classifies flattened records into the summary.  Fields that are
+        null or missing from a record are not counted.
+        """
+        if not records:
+            return
+        self.num_attributes = len(self.field_names)
+        self.summary.resize(self.num_attributes)
+        rows = []
+        missing = []
+        for i, record in enumerate(records):
+            row = [_json_cell(record.get(name))
+                   for name in self.field_names]
+            for j, cell in enumerate(row):
+                if cell is None:
+                    row[j] = u''
+                    missing.append((i, j))
+            rows.append(row)
+        codes = self._classify_rows(rows)
+        if isinstance(codes, list):
+            for i, j in missing:
+                codes[i][j] = 0xFF
+        elif missing:
+            codes[tuple(zip(*missing))] = 0xFF
+        if self.summary.distinct is not None:
+            self.summary.add_distinct(rows, codes, self.CODE_CATEGORICAL,
+                                      self.CODE_NUMERIC,
+                                      self.id_distinct_ratio)
+        self.summary.add_rows(codes)
+        self.summary.records_seen += len(records)
+
+    def write_csv(self, json_filename, csv_filename):
+        """Writes the records of a JSON lines file as a CSV file with a
+        header line and one column per attribute of the guessed schema.
+        Newlines inside values are replaced by spaces, and fields that
+        were not seen while guessing are left out.
+        """
+        fin = open(json_filename)
+        fout = open(csv_filename, 'wb')
+        try:
+            writer = csv.writer(fout)
+            writer.writerow([name.encode('utf-8') for name in self.field_names])
+            for line_number, line in enumerate(fin, 1):
+                if not line.strip():
+                    continue
+                record = _json_record(line, line_number)
+                row = []
+                for name in self.field_names:
+                    cell = _json_cell(record.get(name))
+                    if cell is None:
+                        cell = u''
+                    cell = cell.replace(u'\r\n', u' ').replace(
+                        u'\n', u' ').replace(u'\r', u' ')
+                    row.append(cell.encode('utf-8'))
+                writer.writerow(row)
+        finally:
+            fin.close()
+            fout.close()
+
+
+def _hash64(value):
+    """Returns a 64-bit hash of a string that is the same in every process
+    (unlike hash()), so sketches built in different processes can merge.
+    """
+    if isinstance(value, type(u'')):
+        value = value.encode('utf-8')
+    return struct.unpack('<Q', hashlib.md5(value).digest()[:8])[0]
+
+
+class HyperLogLog(object):
+
+    """Estimates the number of distinct values added, using 2^p one-byte
+    registers (about 1.04 / sqrt(2^p) relative error).  Sketches with the
+    same p can be merged.
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, value):
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        merged = HyperLogLog(self.p)
+        merged.registers = bytearray(
+            max(a, b) for a, b in zip(self.registers, other.registers))
+        return merged
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction (linear counting)
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+
+class TDigest(object):
+
+    """Estimates quantiles of the numbers added, keeping at most about
+    `compression` weighted centroids.  Centroids are kept small near the
+    tails, so extreme quantiles are estimated more accurately than the
+    median.  Digests can be merged.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []  # Sorted [mean, weight] pairs
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        self._buffer.append([value, weight])
+        self.count += weight
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self._buffer) >= 10 * self.compression:
+            self._compress()
+
+    def add_array(self, values):
+        """Adds the finite numbers in a numpy array.  They are sorted and
+        summarized as at most 10 * compression equal-count centroids first,
+        so adding a large block costs about as much as sorting it.
+        """
+        values = numpy.sort(values[numpy.isfinite(values)])
+        if not len(values):
+            return
+        num_groups = min(len(values), 10 * self.compression)
+        bounds = numpy.linspace(0, len(values), num_groups + 1).astype(int)
+        weights = numpy.diff(bounds)
+        means = numpy.add.reduceat(values, bounds[:-1]) / weights
+        self._buffer.extend(
+            [mean, weight] for mean, weight in zip(means.tolist(),
+                                                   weights.tolist()))
+        self.count += len(values)
+        if self.min is None or values[0] < self.min:
+            self.min = float(values[0])
+        if self.max is None or values[-1] > self.max:
+            self.max = float(values[-1])
+        self._compress()
+
+    def merge(self, other):
+        merged = TDigest(self.compression)
+        merged._buffer = (self.centroids + self._buffer +
+                          other.centroids + other._buffer)
+        merged.count = self.count + other.count
+        mins = [m for m in (self.min, other.min) if m is not None]
+        maxes = [m for m in (self.max, other.max) if m is not None]
+        merged.min = min(mins) if mins else None
+        merged.max = max(maxes) if maxes else None
+        merged._compress()
+        return merged
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q_limit(self, q):
+        """The largest q that a centroid starting at q may extend to."""
+        k = self._k(q) + 1
+        if k >= self.compression / 4.0:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        if not points:
+            return
+        total = float(sum(w for m, w in points))
+        merged = [list(points[0])]
+        q_start = 0.0
+        q_limit = self._q_limit(q_start)
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            if q_start + (current[1] + weight) / total <= q_limit:
+                current[0] += (mean - current[0]) * weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                q_start += current[1] / total
+                q_limit = self._q_limit(q_start)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        """Returns the estimated q-th quantile (0 <= q <= 1), or None if no
+        numbers have been added.
+        """
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = q * self.count
+        # Interpolate between the centers of neighboring centroids, and
+        # between the outer centroids and the min and max.
+        previous_center, previous_mean = 0.0, self.min
+        cumulative = 0.0
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2.0
+            if target < center:
+                fraction = (target - previous_center) / (center - previous_center)
+                return previous_mean + fraction * (mean - previous_mean)
+            previous_center, previous_mean = center, mean
+            cumulative += weight
+        if self.count == previous_center:
+            return self.max
+        fraction = (target - previous_center) / (self.count - previous_center)
+        return previous_mean + fraction * (self.max - previous_mean)
+
+
+class TopK(object):
+
+    """Finds the most frequent values using the Misra-Gries summary, which
+    keeps at most `capacity` counters.  Reported counts can be low by up
+    to `error`, which is at most (total count) / (capacity + 1).  Summaries
+    can be merged.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = {}
+        self.error = 0
+
+    def update(self, value_counts):
+        """Adds the counts from a dict of value -> count.
+        """
+        counts = self.counts
+        for value, count in value_counts.items():
+            counts[value] = counts.get(value, 0) + count
+        self._prune()
+
+    def merge(self, other):
+        merged = TopK(self.capacity)
+        merged.counts = dict(self.counts)
+        merged.error = self.error + other.error
+        merged.update(other.counts)
+        return merged
+
+    def _prune(self):
+        if len(self.counts) <= self.capacity:
+            return
+        # Subtract the (capacity + 1)th largest count from every counter,
+        # and drop those that reach zero.
+        threshold = sorted(self.counts.values(), reverse=True)[self.capacity]
+        self.counts = dict((value, count - threshold)
+                           for value, count in self.counts.items()
+                           if count > threshold)
+        self.error += threshold
+
+    def top(self, k):
+        """Returns the k most frequent [value, count] pairs.
+        """
+        ranked = sorted(self.counts.items(), key=lambda vc: (-vc[1], vc[0]))
+        return [list(vc) for vc in ranked[:k]]
+
+
+class LatencyHistogram(object):
+
+    """Counts latencies in microseconds, like HdrHistogram: every value up
+    to max_value is kept to significant_digits significant digits, in a
+    fixed number of log-linear buckets, so percentiles out in the tail are
+    as accurate as the median.  Histograms can be merged.
+    """
+
+    def __init__(self, significant_digits=3, max_value=3600 * 1000000):
+        self.significant_digits = significant_digits
+        self.max_value = max_value
+        sub_bucket_count = 1 << int(math.ceil(
+            math.log(2 * 10 ** significant_digits, 2)))
+        self._half_shift = int(math.log(sub_bucket_count, 2)) - 1
+        self._half = sub_bucket_count >> 1
+        self._mask = sub_bucket_count - 1
+        self.counts = [0] * (self._index(max_value) + 1)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        bucket = (value | self._mask).bit_length() - self._half_shift - 1
+        return ((bucket + 1) << self._half_shift) + \
+            (value >> bucket) - self._half
+
+    def _highest_value(self, index):
+        """Returns the largest value counted at index.
+        """
+        bucket = (index >> self._half_shift) - 1
+        sub_bucket = (index & (self._half - 1)) + self._half
+        if bucket < 0:
+            sub_bucket -= self._half
+            bucket = 0
+        return ((sub_bucket + 1) << bucket) - 1
+
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        merged = LatencyHistogram(self.significant_digits, self.max_value)
+        merged.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        merged.total = self.total + other.total
+        merged.sum = self.sum + other.sum
+        mins = [m for m in (self.min, other.min) if m is not None]
+        merged.min = min(mins) if mins else None
+        merged.max = max(self.max, other.max)
+        return merged
+
+    def percentile(self, percent):
+        """Returns the value that percent of the recorded values are at or
+        below.
+        """
+        if not self.total:
+            return 0
+        target = max(1, int(math.ceil(percent / 100.0 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / float(self.total) if self.total else 0.0
+
+
+class ColumnProfile(object):
+
+    """Mergeable statistics of one column: missing (empty) values, numeric
+    range and quantiles, distinct values and most frequent values.
+    """
+
+    QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+    def __init__(self, name, top_k=10):
+        self.name = name
+        self.top_k = top_k
+        self.count = 0
+        self.missing = 0
+        self.numeric = 0
+        self.total = 0.0
+        self.distinct = HyperLogLog()
+        self.digest = TDigest()
+        self.frequent = TopK(capacity=10 * top_k)
+
+    def add_values(self, values):
+        """Adds a block of string values from this column.
+        """
+        value_counts = {}
+        for value in values:
+            value_counts[value] = value_counts.get(value, 0) + 1
+        self.count += len(values)
+        # Every statistic only needs each distinct value once per block.
+        for value, count in value_counts.items():
+            if not value.strip():
+                self.missing += count
+                continue
+            self.distinct.add(value)
+            try:
+                number = float(value)
+            except ValueError:
+                continue
+            if number != number or number in (float('inf'), float('-inf')):
+                continue  # nan and inf don't have quantiles
+            self.numeric += count
+            self.total += number * count
+            self.digest.add(number, count)
+        self.frequent.update(value_counts)
+
+    def merge(self, other):
+        merged = ColumnProfile(self.name, self.top_k)
+        merged.count = self.count + other.count
+        merged.missing = self.missing + other.missing
+        merged.numeric = self.numeric + other.numeric
+        merged.total = self.total + other.total
+        merged.distinct = self.distinct.merge(other.distinct)
+        merged.digest = self.digest.merge(other.digest)
+        merged.frequent = self.frequent.merge(other.frequent)
+        return merged
+
+    def as_obj(self):
+        obj = {
+            "attributeName": self.name,
+            "count": self.count,
+            "missing": self.missing,
+            "missingFraction": self.missing / float(max(1, self.count)),
+            "numeric": self.numeric,
+            "distinctEstimate": self.distinct.estimate(),
+            "mostFrequent": [[value, count] for value, count in
+                             self.frequent.top(self.top_k) if value.strip()],
+            "mostFrequentMaxError": self.frequent.error,
+        }
+        if self.numeric:
+            obj["min"] = self.digest.min
+            obj["max"] = self.digest.max
+            obj["mean"] = self.total / self.numeric
+            obj["quantiles"] = dict(("%g" % q, self.digest.quantile(q))
+                                    for q in self.QUANTILES)
+        return obj
+
+
+def _profile_byte_range(task):
+    """Worker for DataProfiler.from_file.  Returns ColumnProfiles for the
+    records of one newline-aligned byte range.
+    """
+    filename, start, end, skip_first_record, names, top_k = task
+    profiles = [ColumnProfile(name, top_k) for name in names]
+    block_size = max(1, SchemaGuesser.BLOCK_VALUES // len(names))
+    f = open(filename, 'rb')
+    try:
+        records = csv.reader(_byte_range_lines(f, start, end))
+        if skip_first_record:
+            next(records, None)
+        num_records = 0
+        while True:
+            block = list(itertools.islice(records, block_size))
+            if not block:
+                break
+            num_records += len(block)
+            for i, record in enumerate(block):
+                if len(record) != len(names):
+                    # Short rows' missing values count as empty.
+                    block[i] = (record + [''] * len(names))[:len(names)]
+            for profile, values in zip(profiles, zip(*block)):
+                profile.add_values(values)
+        return num_records, profiles
+    finally:
+        f.close()
+
+
+class DataProfile(JsonConfiguration):
+
+    """The statistics DataProfiler found for each column of a data set.
+    Written as JSON with sorted keys, so reports from different runs can
+    be compared with diff.
+    """
+
+    def __init__(self, path, num_records, column_profiles):
+        self.column_profiles = column_profiles
+        self._obj = {
+            "dataLocation": path,
+            "numRecords": num_records,
+            "attributes": [profile.as_obj() for profile in column_profiles],
+        }
+
+    def _json_kwargs(self, dense):
+        kwargs = super(DataProfile, self)._json_kwargs(dense)
+        kwargs["sort_keys"] = True
+        return kwargs
+
+
+class DataProfiler(object):
+
+    """Profiles every column of a CSV file (or a directory of CSV shard
+    files) in one pass, as a local preview of what creating a data source
+    with ComputeStatistics would show.
+
+    The file is split into newline-aligned byte ranges that are profiled in
+    separate processes, and the per-range sketches are merged.
+    """
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+
+    def from_file(self, path, header_line='auto', processes=None,
+                  bytes_per_task=64 * 1024 * 1024):
+        """Returns a DataProfile of the data at path.
+        Can set header_line to true or false if known, otherwise, it guesses.
+        """
+        filenames = _data_files(path)
+        guesser = SchemaGuesser()
+        f = open(filenames[0], 'rb')
+        try:
+            guesser._read_first_row(csv.reader(f))
+        finally:
+            f.close()
+        if header_line == 'auto':
+            header_line = guesser._guess_if_header_line_present()
+        guesser._name_attributes(header_line)
+        names = [var["attributeName"] for var in guesser.schema.attributes()]
+
+        tasks = [(fn, start, end, start == 0 and header_line, names,
+                  self.top_k)
+                 for fn, start, end in _byte_ranges(filenames, bytes_per_task)]
+        if processes == 1 or len(tasks) == 1:
+            results = [_profile_byte_range(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_profile_byte_range, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        num_records, profiles = results[0]
+        for more_records, more_profiles in results[1:]:
+            num_records += more_records
+            profiles = [a.merge(b) for a, b in zip(profiles, more_profiles)]
+        return DataProfile(path, num_records, profiles)
+
+
+# Values the service accepts for a BINARY attribute, in any case.
+_BINARY_TRUE_VALUES = frozenset(['1', 'y', 'yes', 't', 'true'])
+_BINARY_VALUES = _BINARY_TRUE_VALUES | frozenset(
+    ['0', 'n', 'no', 'f', 'false'])
+
+
+def _validate_byte_range(task):
+    """Worker for DataValidator.validate_file.  Checks the records of one
+    newline-aligned byte range, and returns the number of lines and
+    records in it, and a dict of error class -> [count, line numbers]
+    with line numbers counted from the start of the range.
+    """
+    (filename, start, end, header, types, target_idx, max_samples) = task
+    errors = {}
+
+    def error(kind, line_numbers):
+        entry = errors.setdefault(kind, [0, []])
+        entry[0] += len(line_numbers)
+        entry[1].extend(line_numbers[:max_samples - len(entry[1])])
+
+    numeric = [i for i, typ in enumerate(types) if typ == "NUMERIC"]
+    binary = [i for i, typ in enumerate(types) if typ == "BINARY"]
+    # Small blocks keep transposing them into columns cache friendly.
+    block_size = max(1, 65536 // len(types))
+    f = open(filename, 'rb')
+    try:
+        records = csv.reader(_byte_range_lines(f, start, end))
+        num_records = 0
+        if header is not None:
+            record = next(records, None)
+            if record is not None and record != header:
+                error("headerMismatch", [records.line_num])
+        while True:
+            first_line = records.line_num + 1
+            block = list(itertools.islice(records, block_size))
+            if not block:
+                break
+            if records.line_num - first_line + 1 == len(block):
+                line_numbers = range(first_line, records.line_num + 1)
+            else:
+                # Some values have newlines, so count them.
+                line_numbers = []
+                line = first_line
+                for record in block:
+                    line_numbers.append(line)
+                    line += 1 + sum(value.count('\n') for value in record)
+            if [] in block:
+                # Blank lines
+                line_numbers = [line for line, record in
+                                zip(line_numbers, block) if record]
+                block = [record for record in block if record]
+                if not block:
+                    continue
+            num_records += len(block)
+
+            wrong = [i for i, record in enumerate(block)
+                     if len(record) != len(types)]
+            if wrong:
+                error("wrongColumnCount", [line_numbers[i] for i in wrong])
+                for i in reversed(wrong):
+                    del block[i]
+                    del line_numbers[i]
+                if not block:
+                    continue
+            columns = list(zip(*block))
+
+            if target_idx is not None:
+                missing = [line for line, value in
+                           zip(line_numbers, columns[target_idx]) if not value]
+                if missing:
+                    error("missingTarget", missing)
+            for idx in numeric:
+                if _all_numeric(columns[idx]):
+                    continue
+                bad = []
+                for line, value in zip(line_numbers, columns[idx]):
+                    if value:
+                        try:
+                            float(value)
+                        except ValueError:
+                            bad.append(line)
+                if bad:
+                    error("notNumeric", bad)
+            for idx in binary:
+                distinct = set(columns[idx])
+                distinct.discard('')
+                if all(value.lower() in _BINARY_VALUES for value in distinct):
+                    continue
+                error("notBinary",
+                      [line for line, value in zip(line_numbers, columns[idx])
+                       if value and value.lower() not in _BINARY_VALUES])
+        return records.line_num, num_records, errors
+    finally:
+        f.close()
+
+
+def _all_numeric(values):
+    """True if every non-empty value parses as a number.  Checked a whole
+    column at a time with numpy when it is installed.
+    """
+    values = [value for value in values if value]
+    if numpy is not None:
+        try:
+            numpy.array(values, dtype=numpy.float64)
+            return True
+        except ValueError:
+            return False
+    try:
+        for value in values:
+            float(value)
+        return True
+    except ValueError:
+        return False
+
+
+class ValidationReport(JsonConfiguration):
+
+    """What DataValidator found wrong with a data set: for each class of
+    error, how many records have it and the line numbers of a few.
+    """
+
+    def __init__(self, path, num_records, errors):
+        self.errors = errors
+        self._obj = {
+            "dataLocation": path,
+            "numRecords": num_records,
+            "errors": dict(
+                (kind, {"count": count, "sampleLines": lines})
+                for kind, (count, lines) in errors.items()),
+        }
+
+    def _json_kwargs(self, dense):
+        kwargs = super(ValidationReport, self)._json_kwargs(dense)
+        kwargs["sort_keys"] = True
+        return kwargs
+
+    def is_valid(self):
+        return not self.errors
+
+
+class DataValidator(object):
+
+    """Checks a CSV file (or a directory of CSV shard files) against a
+    Schema before a data source is created from it, so that problems are
+    found in seconds rather than after the service has read all of it.
+
+    Checks that every record has one value per attribute, that NUMERIC
+    and BINARY values parse as such, that the target is never missing,
+    and that each file's header line matches the attribute names.  The
+    files are split into newline-aligned byte ranges that are checked in
+    separate processes.
+    """
+
+    def __init__(self, schema, max_samples=5):
+        self.schema = schema
+        self.max_samples = max_samples
+
+    def validate_file(self, path, processes=None,
+                      bytes_per_task=64 * 1024 * 1024):
+        """Returns a ValidationReport for the data at path.  Line numbers
+        in it are 1-based.  For a directory of shard files they are given
+        as "filename:line".
+        """
+        obj = self.schema.as_obj()
+        names = [var["attributeName"] for var in obj["attributes"]]
+        types = [var["attributeType"] for var in obj["attributes"]]
+        target_idx = None
+        if obj["targetAttributeName"]:
+            if obj["targetAttributeName"] not in names:
+                raise SchemaException("Target %s is not an attribute" %
+                                      obj["targetAttributeName"])
+            target_idx = names.index(obj["targetAttributeName"])
+        header = names if obj["dataFileContainsHeader"] else None
+
+        filenames = _data_files(path)
+        ranges = list(_byte_ranges(filenames, bytes_per_task))
+        tasks = [(fn, start, end, header if start == 0 else None, types,
+                  target_idx, self.max_samples)
+                 for fn, start, end in ranges]
+        if processes == 1 or len(tasks) == 1:
+            results = [_validate_byte_range(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_validate_byte_range, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        num_records = 0
+        errors = {}
+        lines_before = 0
+        for (fn, start, end), (num_lines, more_records, more_errors) in zip(
+                ranges, results):
+            if start == 0:
+                lines_before = 0
+            num_records += more_records
+            for kind, (count, lines) in more_errors.items():
+                entry = errors.setdefault(kind, [0, []])
+                entry[0] += count
+                for line in lines[:self.max_samples - len(entry[1])]:
+                    line += lines_before
+                    if os.path.isdir(path):
+                        line = "%s:%d" % (os.path.basename(fn), line)
+                    entry[1].append(line)
+            lines_before += num_lines
+        return ValidationReport(path, num_records, errors)
+
+
+# Characters that no_punct removes.
+_PUNCTUATION = '!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'
+_UNICODE_PUNCTUATION = dict((ord(c), None) for c in _PUNCTUATION)
+
+
+def _parse_numbers(values):
+    """Parses a numpy array of strings into floats, with nan for values
+    that are empty or aren't numbers.
+    """
+    numbers = numpy.empty(len(values))
+    numbers.fill(numpy.nan)
+    present = numpy.flatnonzero(values != values.dtype.type())
+    _parse_float_range(values, present, numbers)
+    return numbers
+
+
+def _parse_binary(values):
+    """Parses a numpy array of strings into 1.0, 0.0, or nan for values
+    that are empty or aren't binary.
+    """
+    lowered = numpy.char.lower(values)
+    true = numpy.array(sorted(_BINARY_TRUE_VALUES), dtype=lowered.dtype)
+    known = numpy.array(sorted(_BINARY_VALUES), dtype=lowered.dtype)
+    binary = numpy.in1d(lowered, true).astype(numpy.float64)
+    binary[~numpy.in1d(lowered, known)] = numpy.nan
+    return binary
+
+
+def csv_column_blocks(path, schema, block_size=65536):
+    """Reads a CSV file (or a directory of CSV shard files) described by
+    schema, and yields blocks of up to block_size records as dicts of
+    attribute name -> numpy array.  NUMERIC and BINARY values are floats,
+    with nan when missing, and CATEGORICAL and TEXT values are strings.
+    """
+    obj = schema.as_obj()
+    names = [var["attributeName"] for var in obj["attributes"]]
+    types = [var["attributeType"] for var in obj["attributes"]]
+    for filename in _data_files(path):
+        f = open(filename, 'rb')
+        try:
+            records = csv.reader(f)
+            if obj["dataFileContainsHeader"]:
+                next(records, None)
+            while True:
+                block = list(itertools.islice(records, block_size))
+                if not block:
+                    break
+                # Leave out blank lines, which may be the whole block.
+                block = [record for record in block if record]
+                if block:
+                    yield _column_arrays(block, names, types)
+        finally:
+            f.close()
+
+
+def _column_arrays(block, names, types):
+    """Turns a block of CSV records into a dict of attribute name -> numpy
+    array, as described in csv_column_blocks.
+    """
+    for i, record in enumerate(block):
+        if len(record) != len(names):
+            block[i] = (record + [''] * len(names))[:len(names)]
+    columns = {}
+    for name, typ, values in zip(names, types, zip(*block)):
+        values = numpy.array(values)
+        if typ == "NUMERIC":
+            values = _parse_numbers(values)
+        elif typ == "BINARY":
+            values = _parse_binary(values)
+        columns[name] = values
+    return columns
+
+
+def record_columns(records, schema):
+    """Turns a list of records, as passed to predict (dicts of attribute
+    name -> value), into a dict of attribute name -> numpy array, as
+    described in csv_column_blocks.
+    """
+    obj = schema.as_obj()
+    names = [var["attributeName"] for var in obj["attributes"]]
+    types = [var["attributeType"] for var in obj["attributes"]]
+    block = []
+    for record in records:
+        row = []
+        for name in names:
+            value = record.get(name)
+            if value is None:
+                value = ''
+            elif isinstance(value, unicode):
+                value = value.encode('utf-8')
+            else:
+                value = str(value)
+            row.append(value)
+        block.append(row)
+    return _column_arrays(block, names, types)
+
+
+class RecipeOutput(object):
+
+    """One variable produced by a recipe for a block of records.
+
+    NUMERIC and BINARY values are a float array (nan when missing),
+    CATEGORICAL values a string array ('' when missing), and TEXT values
+    either a string array or, after ngram, osb or cartesian, a list with
+    each record's tokens.
+    """
+
+    def __init__(self, name, attribute_type, values):
+        self.name = name
+        self.attribute_type = attribute_type
+        self.values = values
+
+    def tokens(self):
+        """Returns the list of each record's TEXT tokens.
+        """
+        if isinstance(self.values, list):
+            return self.values
+        return [value.split() for value in self.values.tolist()]
+
+
+class _RecipeVariable(object):
+
+    def __init__(self, name, attribute_type):
+        self.name = name
+        self.attribute_type = attribute_type
+
+    def variables(self):
+        return [self]
+
+    def output_types(self):
+        return [self.attribute_type]
+
+    def evaluate(self, recipe, columns):
+        return [RecipeOutput(self.name, self.attribute_type,
+                             columns[self.name])]
+
+
+class _RecipeGroup(object):
+
+    def __init__(self, variables):
+        self._variables = variables
+
+    def variables(self):
+        return self._variables
+
+    def output_types(self):
+        return [var.attribute_type for var in self._variables]
+
+    def evaluate(self, recipe, columns):
+        return [output for var in self._variables
+                for output in var.evaluate(recipe, columns)]
+
+
+class _RecipeTransform(object):
+
+    def __init__(self, function, args, params):
+        self.function = function
+        self.args = args
+        self.params = params
+        types = [arg.output_types() for arg in args]
+        allowed = Recipe.TRANSFORMATIONS[function][0]
+        for arg, arg_types in zip(args, types):
+            for typ in arg_types:
+                if typ not in allowed:
+                    raise SchemaException("%s can't be applied to %s values" %
+                                          (function, typ))
+        if function == "cartesian":
+            self._output_types = [
+                "TEXT" if "TEXT" in (a, b) else "CATEGORICAL"
+                for a in types[0] for b in types[1]]
+        elif function in ("lowercase", "no_punct"):
+            self._output_types = types[0]
+        else:
+            self._output_types = [Recipe.TRANSFORMATIONS[function][1]] * \
+                len(types[0])
+
+    def variables(self):
+        raise SchemaException("%s can't be used as a group" % self.function)
+
+    def output_types(self):
+        return self._output_types
+
+    def evaluate(self, recipe, columns):
+        inputs = [arg.evaluate(recipe, columns) for arg in self.args]
+        if self.function == "cartesian":
+            return [recipe._cartesian(a, b)
+                    for a in inputs[0] for b in inputs[1]]
+        return [recipe._apply(self.function, output, self.params)
+                for output in inputs[0]]
+
+
+class FeatureSpace(JsonConfiguration):
+
+    """How many features each output of a recipe expands to, as the model
+    sees them: one for a NUMERIC or BINARY variable, and one for each
+    distinct category or token of a CATEGORICAL or TEXT variable.
+    """
+
+    def __init__(self, num_records, outputs):
+        self._obj = {
+            "numRecords": num_records,
+            "outputs": [
+                {"name": name, "attributeType": typ, "numFeatures": count}
+                for name, typ, count in outputs],
+            "numFeatures": sum(count for name, typ, count in outputs),
+        }
+
+    def _json_kwargs(self, dense):
+        kwargs = super(FeatureSpace, self)._json_kwargs(dense)
+        kwargs["sort_keys"] = True
+        return kwargs
+
+
+class Recipe(object):
+
+    """A data transformation recipe, as passed to create_ml_model, compiled
+    against a Schema so it can be evaluated locally on blocks of columns
+    (see csv_column_blocks).
+
+    Supports the groups ALL_TEXT, ALL_NUMERIC, ALL_CATEGORICAL, ALL_BINARY
+    and ALL_INPUTS, group() and group_remove(), and the transformations
+    lowercase, no_punct, ngram, osb, quantile_bin, normalize and
+    cartesian.  quantile_bin and normalize have to be fit() first, in one
+    pass over the data.
+    """
+
+    GROUPS = ["ALL_TEXT", "ALL_NUMERIC", "ALL_CATEGORICAL", "ALL_BINARY",
+              "ALL_INPUTS"]
+
+    # Transformation -> (types of variable it takes, type it makes,
+    #                    number of int params)
+    TRANSFORMATIONS = {
+        "lowercase": (("TEXT", "CATEGORICAL"), None, 0),
+        "no_punct": (("TEXT", "CATEGORICAL"), None, 0),
+        "ngram": (("TEXT",), "TEXT", 1),
+        "osb": (("TEXT",), "TEXT", 1),
+        "quantile_bin": (("NUMERIC",), "CATEGORICAL", 1),
+        "normalize": (("NUMERIC",), "NUMERIC", 0),
+        "cartesian": (("TEXT", "CATEGORICAL", "BINARY"), None, 0),
+    }
+
+    _TOKENS = re.compile(r"""\s*(?:'([^']*)'|"([^"]*)"|([^\s(),'"]+)|([(),]))""")
+
+    def __init__(self, recipe, schema):
+        if numpy is None:
+            raise AWSPyMLException("Evaluating recipes requires numpy")
+        if not isinstance(recipe, dict):
+            recipe = json.loads(recipe)
+        self.schema = schema
+        obj = schema.as_obj()
+        self._types = dict((var["attributeName"], var["attributeType"])
+                           for var in obj["attributes"])
+        not_inputs = set(obj["excludedAttributeNames"])
+        not_inputs.update([obj["targetAttributeName"], obj["rowId"]])
+        inputs = [_RecipeVariable(var["attributeName"], var["attributeType"])
+                  for var in obj["attributes"]
+                  if var["attributeName"] not in not_inputs]
+        self._names = {"ALL_INPUTS": _RecipeGroup(inputs)}
+        for typ in ["TEXT", "NUMERIC", "CATEGORICAL", "BINARY"]:
+            self._names["ALL_" + typ] = _RecipeGroup(
+                [var for var in inputs if var.attribute_type == typ])
+
+        self._digests = {}  # Variable name -> TDigest, for quantile_bin
+        self._moments = {}  # Variable name -> [count, sum, sum of squares]
+        self._edges = {}  # (Variable name, bins) -> quantile_bin edges
+        for name, text in recipe.get("groups", {}).items():
+            self._names[name] = _RecipeGroup(
+                self._compile(self._parse(text)).variables())
+        for name, text in recipe.get("assignments", {}).items():
+            self._names[name] = self._compile(self._parse(text))
+        self.outputs = [self._compile(self._parse(text))
+                        for text in recipe.get("outputs", [])]
+        if not self.outputs:
+            raise SchemaException("Recipe has no outputs")
+
+    @classmethod
+    def read_from_file(cls, filename, schema):
+        f = open(filename)
+        try:
+            return cls(json.load(f), schema)
+        finally:
+            f.close()
+
+    def _parse(self, text):
+        """Parses a recipe expression into a tree of ("name", name) and
+        ("call", function, [arguments]) tuples.
+        """
+        tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = self._TOKENS.match(text, position)
+            if not match:
+                raise SchemaException("Can't parse recipe expression %s" %
+                                      text)
+            quoted = match.group(1) if match.group(1) is not None else \
+                match.group(2)
+            if quoted is not None:
+                tokens.append(("name", quoted))
+            elif match.group(3) is not None:
+                tokens.append(("name", match.group(3)))
+            else:
+                tokens.append(("punct", match.group(4)))
+            position = match.end()
+        tree, position = self._parse_tokens(tokens, 0, text)
+        if position != len(tokens):
+            raise SchemaException("Can't parse recipe expression %s" % text)
+        return tree
+
+    def _parse_tokens(self, tokens, position, text):
+        if position >= len(tokens) or tokens[position][0] != "name":
+            raise SchemaException("Can't parse recipe expression %s" % text)
+        name = tokens[position][1]
+        position += 1
+        if position >= len(tokens) or tokens[position] != ("punct", "("):
+            return ("name", name), position
+        args = []
+        position += 1
+        while True:
+            arg, position = self._parse_tokens(tokens, position, text)
+            args.append(arg)
+            if position < len(tokens) and tokens[position] == ("punct", ","):
+                position += 1
+            elif position < len(tokens) and tokens[position] == ("punct", ")"):
+                return ("call", name, args), position + 1
+            else:
+                raise SchemaException("Can't parse recipe expression %s" %
+                                      text)
+
+    def _compile(self, tree):
+        if tree[0] == "name":
+            name = tree[1]
+            if name in self._names:
+                return self._names[name]
+            if name in self._types:
+                return _RecipeVariable(name, self._types[name])
+            raise SchemaException("Undefined variable %s in recipe" % name)
+
+        function, args = tree[1], tree[2]
+        if function in ("group", "group_remove"):
+            groups = [self._compile(arg).variables() for arg in args]
+            if function == "group":
+                return _RecipeGroup([var for group in groups for var in group])
+            removed = set(var.name for group in groups[1:] for var in group)
+            return _RecipeGroup([var for var in groups[0]
+                                 if var.name not in removed])
+        if function not in self.TRANSFORMATIONS:
+            raise SchemaException("Unknown recipe function %s" % function)
+        num_params = self.TRANSFORMATIONS[function][2]
+        num_args = 2 if function == "cartesian" else 1
+        if len(args) != num_args + num_params:
+            raise SchemaException("%s takes %d arguments" %
+                                  (function, num_args + num_params))
+        try:
+            params = [int(arg[1]) for arg in args[num_args:]]
+        except (ValueError, IndexError):
+            raise SchemaException("%s needs a number as its last argument" %
+                                  function)
+        nodes = [self._compile(arg) for arg in args[:num_args]]
+        if function in ("quantile_bin", "normalize"):
+            # These are fit to the data, so must apply to input variables.
+            for var in nodes[0].variables():
+                if var.attribute_type != "NUMERIC":
+                    raise SchemaException(
+                        "%s expects NUMERIC variables, not %s (%s)" %
+                        (function, var.name, var.attribute_type))
+                if function == "quantile_bin":
+                    self._digests[var.name] = TDigest()
+                    self._edges[(var.name, params[0])] = None
+                else:
+                    self._moments[var.name] = [0, 0.0, 0.0]
+        return _RecipeTransform(function, nodes, params)
+
+    def fit(self, blocks):
+        """Computes quantile_bin edges and normalize means and deviations
+        in one pass over blocks of columns.  Returns self.
+        """
+        for columns in blocks:
+            for name, digest in self._digests.items():
+                digest.add_array(columns[name])
+            for name, moments in self._moments.items():
+                values = columns[name]
+                values = values[numpy.isfinite(values)]
+                moments[0] += len(values)
+                moments[1] += float(values.sum())
+                moments[2] += float(numpy.dot(values, values))
+        for name, bins in self._edges:
+            digest = self._digests[name]
+            edges = [digest.quantile(i / float(bins)) for i in xrange(1, bins)]
+            if digest.count:
+                self._edges[(name, bins)] = numpy.unique(edges)
+            else:
+                self._edges[(name, bins)] = numpy.array([])
+        return self
+
+    def transform(self, columns):
+        """Returns the RecipeOutputs of every output of the recipe, for a
+        block of columns.
+        """
+        return [output for node in self.outputs
+                for output in node.evaluate(self, columns)]
+
+    def feature_space(self, blocks):
+        """Returns a FeatureSpace counting the features each output expands
+        to over blocks of columns.  Distinct categories and tokens are kept
+        in sets, so this uses memory in proportion to the vocabulary.
+        """
+        num_records = 0
+        names = []
+        counts = {}
+        for columns in blocks:
+            num_records += len(next(iter(columns.values())))
+            for output in self.transform(columns):
+                if output.name not in counts:
+                    names.append((output.name, output.attribute_type))
+                    counts[output.name] = set()
+                if output.attribute_type == "CATEGORICAL":
+                    values = output.values
+                    values = values[values != values.dtype.type()]
+                    counts[output.name].update(numpy.unique(values).tolist())
+                elif output.attribute_type == "TEXT":
+                    distinct = counts[output.name]
+                    for tokens in output.tokens():
+                        distinct.update(tokens)
+        return FeatureSpace(num_records, [
+            (name, typ, len(counts[name]) if typ in ("CATEGORICAL", "TEXT")
+             else 1)
+            for name, typ in names])
+
+    def _apply(self, function, output, params):
+        name = "%s(%s)" % (function, ",".join(
+            [output.name] + [str(param) for param in params]))
+        values = output.values
+        if function == "lowercase":
+            if isinstance(values, list):
+                values = [[token.lower() for token in tokens]
+                          for tokens in values]
+            else:
+                values = numpy.char.lower(values)
+            return RecipeOutput(name, output.attribute_type, values)
+        if function == "no_punct":
+            if isinstance(values, list):
+                values = [[t for t in (token.translate(None, _PUNCTUATION)
+                                       if isinstance(token, str) else
+                                       token.translate(_UNICODE_PUNCTUATION)
+                                       for token in tokens) if t]
+                          for tokens in values]
+            elif values.dtype.kind == 'S':
+                values = numpy.char.translate(values, None, _PUNCTUATION)
+            else:
+                values = numpy.char.translate(values, _UNICODE_PUNCTUATION)
+            return RecipeOutput(name, output.attribute_type, values)
+        if function == "ngram":
+            size = params[0]
+            grams = []
+            for tokens in output.tokens():
+                record = []
+                for n in xrange(1, size + 1):
+                    record.extend("_".join(tokens[i:i + n])
+                                  for i in xrange(len(tokens) - n + 1))
+                grams.append(record)
+            return RecipeOutput(name, "TEXT", grams)
+        if function == "osb":
+            window = params[0]
+            pairs = []
+            for tokens in output.tokens():
+                record = []
+                for i, token in enumerate(tokens):
+                    for j in xrange(i + 1, min(i + window, len(tokens))):
+                        record.append(token + "_" * (j - i) + tokens[j])
+                pairs.append(record)
+            return RecipeOutput(name, "TEXT", pairs)
+        if function == "quantile_bin":
+            edges = self._edges[(output.name, params[0])]
+            if edges is None:
+                raise AWSPyMLException("Recipe must be fit() before use")
+            bins = numpy.searchsorted(edges, values, side='right')
+            labels = numpy.char.add("b", bins.astype(str))
+            labels[~numpy.isfinite(values)] = ""
+            return RecipeOutput(name, "CATEGORICAL", labels)
+        # normalize
+        count, total, squares = self._moments[output.name]
+        if not count:
+            raise AWSPyMLException("Recipe must be fit() before use")
+        mean = total / count
+        deviation = math.sqrt(max(squares / count - mean * mean, 0)) or 1.0
+        return RecipeOutput(name, "NUMERIC", (values - mean) / deviation)
+
+    def _cartesian(self, a, b):
+        name = "cartesian(%s,%s)" % (a.name, b.name)
+        if a.attribute_type != "TEXT" and b.attribute_type != "TEXT":
+            values = [self._categories(a), self._categories(b)]
+            crossed = numpy.char.add(numpy.char.add(values[0], "_"),
+                                     values[1])
+            crossed[(values[0] == "") | (values[1] == "")] = ""
+            return RecipeOutput(name, "CATEGORICAL", crossed)
+        tokens = [self._categories(output).tolist()
+                  if output.attribute_type != "TEXT" else output.tokens()
+                  for output in (a, b)]
+        crossed = []
+        for first, second in zip(*tokens):
+            if not isinstance(first, list):
+                first = [first] if first else []
+            if not isinstance(second, list):
+                second = [second] if second else []
+            crossed.append([x + "_" + y for x in first for y in second])
+        return RecipeOutput(name, "TEXT", crossed)
+
+    def _categories(self, output):
+        """The values of a CATEGORICAL or BINARY output as strings."""
+        if output.attribute_type == "CATEGORICAL":
+            return output.values
+        values = output.values
+        with numpy.errstate(invalid='ignore'):
+            categories = numpy.where(values > 0.5, "1", "0")
+        categories[~numpy.isfinite(values)] = ""
+        return categories
+
+
+def _load_columnar_byte_range(task):
+    """Worker for ColumnarDataset.from_csv.  Returns a list of the
+    categories seen in one newline-aligned byte range, and a dict of
+    attribute name -> array of its values, with CATEGORICAL values coded
+    as positions in that list (-1 when missing).
+    """
+    filename, start, end, skip_first_record, names, types = task
+    empty = {"NUMERIC": numpy.float64, "BINARY": numpy.float64,
+             "CATEGORICAL": numpy.int32, "TEXT": 'S1'}
+    codes_of = {}
+    blocks = dict((name, [numpy.zeros(0, dtype=empty[typ])])
+                  for name, typ in zip(names, types))
+    block_size = max(1, 65536 // len(names))
+    f = open(filename, 'rb')
+    try:
+        records = csv.reader(_byte_range_lines(f, start, end))
+        if skip_first_record:
+            next(records, None)
+        while True:
+            block = list(itertools.islice(records, block_size))
+            if not block:
+                break
+            block = [record for record in block if record]
+            if not block:
+                continue
+            columns = _column_arrays(block, names, types)
+            for name, typ in zip(names, types):
+                values = columns[name]
+                if typ == "CATEGORICAL":
+                    categories, inverse = numpy.unique(values,
+                                                       return_inverse=True)
+                    mapping = numpy.array(
+                        [codes_of.setdefault(category, len(codes_of))
+                         if category else -1
+                         for category in categories.tolist()],
+                        dtype=numpy.int32)
+                    values = mapping[inverse]
+                blocks[name].append(values)
+    finally:
+        f.close()
+    vocabulary = [None] * len(codes_of)
+    for category, code in codes_of.items():
+        vocabulary[code] = category
+    return vocabulary, dict((name, numpy.concatenate(blocks[name]))
+                            for name in names)
+
+
+class ColumnarDataset(object):
+
+    """A CSV data set loaded into one numpy array per attribute, typed by
+    its Schema:
+
+        NUMERIC      float64, nan when missing
+        BINARY       bool, with missing values flagged in missing[name]
+        CATEGORICAL  int32 codes into the vocabulary shared by all
+                     CATEGORICAL attributes, -1 when missing
+        TEXT         byte strings
+
+    With a ColumnarCache, the arrays are saved as .npy files the first
+    time a file is loaded, and later loads memory-map them instead of
+    parsing the CSV again.
+    """
+
+    def __init__(self, names, types, columns, vocabulary, missing):
+        self.names = names
+        self.types = types
+        self.columns = columns
+        self.vocabulary = vocabulary
+        self.missing = missing
+        self.num_records = len(columns[names[0]]) if names else 0
+
+    @classmethod
+    def from_csv(cls, path, schema, cache=None, processes=None,
+                 bytes_per_task=64 * 1024 * 1024):
+        """Loads a CSV file (or a directory of CSV shard files), or memory
+        maps it from the cache if it was loaded before and hasn't changed.
+
+        The files are split into newline-aligned byte ranges that are
+        parsed by separate processes, each with its own vocabulary, and
+        the codes are then mapped into the shared vocabulary.
+        """
+        if cache is not None:
+            dataset = cache.get(path, schema)
+            if dataset is not None:
+                return dataset
+        obj = schema.as_obj()
+        names = [var["attributeName"] for var in obj["attributes"]]
+        types = [var["attributeType"] for var in obj["attributes"]]
+        tasks = [(fn, start, end, start == 0 and obj["dataFileContainsHeader"],
+                  names, types)
+                 for fn, start, end in _byte_ranges(_data_files(path),
+                                                    bytes_per_task)]
+        if processes == 1 or len(tasks) == 1:
+            results = [_load_columnar_byte_range(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_load_columnar_byte_range, tasks,
+                                   chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        codes_of = {}  # Category -> code in the shared vocabulary
+        for local_vocabulary, range_columns in results:
+            mapping = numpy.array(
+                [codes_of.setdefault(category, len(codes_of))
+                 for category in local_vocabulary] + [-1], dtype=numpy.int32)
+            for name, typ in zip(names, types):
+                if typ == "CATEGORICAL":
+                    # Missing values are -1, which maps to the last entry.
+                    range_columns[name] = mapping[range_columns[name]]
+        columns = {}
+        missing = {}
+        for name, typ in zip(names, types):
+            values = numpy.concatenate(
+                [range_columns[name] for local, range_columns in results])
+            if typ == "BINARY":
+                missing[name] = numpy.isnan(values)
+                values = values == 1
+            columns[name] = values
+        del results
+        vocabulary = [None] * len(codes_of)
+        for category, code in codes_of.items():
+            vocabulary[code] = category
+        vocabulary = numpy.array(vocabulary or [''])[:len(vocabulary)]
+        dataset = cls(names, types, columns, vocabulary, missing)
+        if cache is not None:
+            cache.put(path, schema, dataset)
+        return dataset
+
+    def categories(self, name):
+        """Returns a CATEGORICAL attribute's values as strings, with ''
+        for missing values.
+        """
+        return self._decode(self.columns[name])
+
+    def _decode(self, codes):
+        if not len(self.vocabulary):
+            return numpy.zeros(len(codes), dtype='S1')  # All missing
+        values = self.vocabulary[numpy.maximum(codes, 0)]
+        values[codes < 0] = ''
+        return values
+
+    def column_blocks(self, block_size=65536, first=0, last=None):
+        """Yields blocks of records as dicts of attribute name -> numpy
+        array, in the same form as csv_column_blocks, for Recipe.  Only
+        records first up to (not including) last are included.
+        """
+        if last is None or last > self.num_records:
+            last = self.num_records
+        for start in xrange(first, last, block_size):
+            end = min(start + block_size, last)
+            block = {}
+            for name, typ in zip(self.names, self.types):
+                values = self.columns[name][start:end]
+                if typ == "CATEGORICAL":
+                    values = self._decode(values)
+                elif typ == "BINARY":
+                    values = values.astype(numpy.float64)
+                    values[self.missing[name][start:end]] = numpy.nan
+                block[name] = values
+            yield block
+
+
+class ColumnarCache(object):
+
+    """On-disk cache of ColumnarDataset arrays as .npy files, one
+    directory per data set, keyed by the data files' names, sizes, mtimes
+    and file_fingerprint()s and by the schema.  Once the cache holds more
+    than max_bytes, the least recently used data sets are deleted.
+    """
+
+    def __init__(self, directory=None, max_bytes=4 * 1024 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.awspyml',
+                                     'columnar-cache')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, path, schema):
+        files = []
+        for filename in _data_files(path):
+            stat = os.stat(filename)
+            files.append([os.path.abspath(filename), stat.st_size,
+                          stat.st_mtime,
+                          file_fingerprint(filename, stat.st_size)])
+        key = json.dumps([files, schema.as_obj()], sort_keys=True)
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, path, schema):
+        """Returns the cached ColumnarDataset, memory-mapped, or None.
+        """
+        entry = self._entry_path(path, schema)
+        try:
+            f = open(os.path.join(entry, 'meta.json'))
+            try:
+                meta = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return None
+        columns = {}
+        missing = {}
+        for i, (name, typ) in enumerate(zip(meta["names"], meta["types"])):
+            columns[name] = numpy.load(os.path.join(entry, '%d.npy' % i),
+                                       mmap_mode='r')
+            if typ == "BINARY":
+                missing[name] = numpy.load(
+                    os.path.join(entry, '%d.missing.npy' % i), mmap_mode='r')
+        # The vocabulary is small, and is indexed, so it isn't mapped.
+        vocabulary = numpy.load(os.path.join(entry, 'vocabulary.npy'))
+        os.utime(entry, None)  # Mark as recently used
+        return ColumnarDataset(meta["names"], meta["types"], columns,
+                               vocabulary, missing)
+
+    def put(self, path, schema, dataset):
+        entry = self._entry_path(path, schema)
+        tmp_entry = '%s.%d.tmp' % (entry, os.getpid())
+        os.makedirs(tmp_entry)
+        for i, (name, typ) in enumerate(zip(dataset.names, dataset.types)):
+            numpy.save(os.path.join(tmp_entry, '%d.npy' % i),
+                       dataset.columns[name])
+            if typ == "BINARY":
+                numpy.save(os.path.join(tmp_entry, '%d.missing.npy' % i),
+                           dataset.missing[name])
+        numpy.save(os.path.join(tmp_entry, 'vocabulary.npy'),
+                   dataset.vocabulary)
+        # Written last, so an entry without it is incomplete.
+        f = open(os.path.join(tmp_entry, 'meta.json'), 'w')
+        try:
+            json.dump({"names": dataset.names, "types": dataset.types}, f)
+        finally:
+            f.close()
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.rename(tmp_entry, entry)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for fn in os.listdir(self.directory):
+            path = os.path.join(self.directory, fn)
+            if fn.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, part))
+                       for part in os.listdir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path)
+            total -= size
+
+
+def auc(scores, labels):
+    """Returns the area under the ROC curve of scores for binary labels,
+    from the rank sum of the positive examples (ties count half).
+    """
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    labels = numpy.asarray(labels, dtype=bool)
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    if not positives or not negatives:
+        return None
+    distinct, inverse, counts = numpy.unique(scores, return_inverse=True,
+                                             return_counts=True)
+    # Tied scores share the average of the ranks they span.
+    ends = numpy.cumsum(counts)
+    ranks = (ends - (counts - 1) / 2.0)[inverse]
+    rank_sum = ranks[labels].sum()
+    return (rank_sum - positives * (positives + 1) / 2.0) / \
+        (positives * float(negatives))
+
+
+class TrainingReport(JsonConfiguration):
+
+    """How well a model that SGDTrainer trained does on the evaluation
+    records held out from training.
+    """
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def _json_kwargs(self, dense):
+        kwargs = super(TrainingReport, self)._json_kwargs(dense)
+        kwargs["sort_keys"] = True
+        return kwargs
+
+
+class SGDTrainer(object):
+
+    """Trains a binary logistic regression model locally, to screen recipes
+    and training parameters before creating an ML model with them.
+
+    Takes the same parameters map as create_ml_model, with the same
+    defaults: sgd.maxPasses, sgd.l1RegularizationAmount,
+    sgd.l2RegularizationAmount, sgd.maxMLModelSizeInBytes and
+    sgd.shuffleType.  Features are the recipe's outputs, one-hot encoded;
+    NUMERIC outputs are scaled to unit variance.  When the features would
+    take more than sgd.maxMLModelSizeInBytes (counting 8 bytes per weight
+    plus the length of the feature's name), the least frequent ones are
+    dropped, like the service does.
+
+    Training streams mini-batches from a ColumnarDataset, one block at a
+    time, with AdaGrad step sizes.  This won't reproduce the service's
+    model exactly, but it ranks recipes and parameters the same way often
+    enough to skip the ones that won't help.
+    """
+
+    DEFAULT_PARAMETERS = {
+        "sgd.maxPasses": "10",
+        "sgd.l1RegularizationAmount": "0",
+        "sgd.l2RegularizationAmount": "1e-6",
+        "sgd.maxMLModelSizeInBytes": "33554432",
+        "sgd.shuffleType": "none",
+    }
+
+    def __init__(self, recipe, parameters=None, batch_size=256,
+                 learning_rate=0.5):
+        self.recipe = recipe
+        self.parameters = dict(self.DEFAULT_PARAMETERS)
+        self.parameters.update(parameters or {})
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.features = {}  # Output name -> {value: feature index}
+        self.scales = {}  # NUMERIC output name -> (feature, mean, deviation)
+        self.weights = None
+        self.bias = 0.0
+        self.target = recipe.schema.as_obj()["targetAttributeName"]
+        if not self.target:
+            raise SchemaException("Schema has no target attribute")
+        target = recipe.schema.get_variable_by_name(self.target)
+        if target is None or target["attributeType"] != "BINARY":
+            raise SchemaException("Target attribute %s is not BINARY" %
+                                  self.target)
+
+    def train(self, dataset, train_percent=70):
+        """Trains on the first train_percent of the records of a
+        ColumnarDataset, and returns a TrainingReport with the AUC on the
+        rest, like build_model.py's split of the data into data sources.
+        """
+        split = dataset.num_records * train_percent // 100
+
+        def training_blocks():
+            return dataset.column_blocks(last=split)
+
+        self.recipe.fit(training_blocks())
+        self._choose_features(training_blocks())
+        num_features = len(self.weights)
+        squared_gradients = numpy.zeros(num_features)
+        l1 = float(self.parameters["sgd.l1RegularizationAmount"])
+        l2 = float(self.parameters["sgd.l2RegularizationAmount"])
+        shuffle = self.parameters["sgd.shuffleType"] == "auto"
+        passes = int(self.parameters["sgd.maxPasses"])
+        bias_squared_gradient = 0.0
+        for i in xrange(passes):
+            for columns in training_blocks():
+                rows, cols, values, labels = self._encode(columns)
+                order = numpy.flatnonzero(numpy.isfinite(labels))
+                if shuffle:
+                    numpy.random.shuffle(order)
+                # Sort the block's entries by their record's place in the
+                # order, so each batch's entries are one slice.
+                position = numpy.empty(len(labels), dtype=numpy.int64)
+                position.fill(-1)
+                position[order] = numpy.arange(len(order))
+                entry_positions = position[rows]
+                kept = numpy.flatnonzero(entry_positions >= 0)
+                by_position = kept[numpy.argsort(entry_positions[kept],
+                                                 kind="mergesort")]
+                rows = entry_positions[by_position]
+                cols = cols[by_position]
+                values = values[by_position]
+                offsets = numpy.zeros(len(order) + 1, dtype=numpy.int64)
+                numpy.cumsum(numpy.bincount(rows, minlength=len(order)),
+                             out=offsets[1:])
+                labels = labels[order]
+                for start in xrange(0, len(order), self.batch_size):
+                    end = min(start + self.batch_size, len(order))
+                    batch_labels = labels[start:end]
+                    # Renumber the batch's records 0..n-1.
+                    r = rows[offsets[start]:offsets[end]] - start
+                    c = cols[offsets[start]:offsets[end]]
+                    v = values[offsets[start]:offsets[end]]
+                    margins = numpy.bincount(
+                        r, weights=self.weights[c] * v,
+                        minlength=len(batch_labels)) + self.bias
+                    errors = 1 / (1 + numpy.exp(-margins)) - batch_labels
+                    if num_features <= 16 * len(c):
+                        # Cheaper than sorting the batch's features.
+                        present = numpy.bincount(
+                            c, minlength=num_features) > 0
+                        touched = numpy.flatnonzero(present)
+                        where = (numpy.cumsum(present) - 1)[c]
+                    else:
+                        touched, where = numpy.unique(c, return_inverse=True)
+                    gradient = numpy.bincount(
+                        where, weights=errors[r] * v,
+                        minlength=len(touched)) / len(batch_labels)
+                    gradient += l2 * self.weights[touched]
+                    squared_gradients[touched] += gradient * gradient
+                    step = self.learning_rate / numpy.sqrt(
+                        squared_gradients[touched] + 1e-8)
+                    updated = self.weights[touched] - step * gradient
+                    if l1:
+                        # Truncate towards zero, without crossing it.
+                        updated = numpy.sign(updated) * numpy.maximum(
+                            numpy.abs(updated) - step * l1, 0)
+                    self.weights[touched] = updated
+                    bias_gradient = errors.mean()
+                    bias_squared_gradient += bias_gradient * bias_gradient
+                    self.bias -= self.learning_rate * bias_gradient / \
+                        math.sqrt(bias_squared_gradient + 1e-8)
+
+        scores = []
+        labels = []
+        for columns in dataset.column_blocks(first=split):
+            target = columns[self.target]
+            known = numpy.isfinite(target)
+            scores.append(self.predict(columns)[known])
+            labels.append(target[known] > 0.5)
+        scores = numpy.concatenate(scores) if scores else numpy.zeros(0)
+        labels = numpy.concatenate(labels) if labels else numpy.zeros(0)
+        return TrainingReport({
+            "auc": auc(scores, labels),
+            "parameters": self.parameters,
+            "numFeatures": num_features,
+            "numNonZeroWeights": int(numpy.count_nonzero(self.weights)),
+            "trainingRecords": split,
+            "evaluationRecords": len(labels),
+        })
+
+    def predict(self, columns):
+        """Returns the predicted probability of a 1 for each record in a
+        block of columns.
+        """
+        rows, cols, values, labels = self._encode(columns)
+        margins = numpy.bincount(rows, weights=self.weights[cols] * values,
+                                 minlength=len(labels)) + self.bias
+        return 1 / (1 + numpy.exp(-margins))
+
+    def predict_records(self, records, threshold=0.5):
+        """Returns a prediction for each of a list of records, in the form
+        the Predict API returns them.
+        """
+        columns = record_columns(records, self.recipe.schema)
+        return [binary_prediction(score, threshold)
+                for score in self.predict(columns).tolist()]
+
+    def _choose_features(self, blocks):
+        """Counts how often each feature occurs, and numbers the most
+        frequent ones that fit in sgd.maxMLModelSizeInBytes.
+        """
+        counts = {}
+        moments = {}
+        for columns in blocks:
+            for output in self.recipe.transform(columns):
+                key = output.name
+                if output.attribute_type in ("NUMERIC", "BINARY"):
+                    values = output.values[numpy.isfinite(output.values)]
+                    total = moments.setdefault(key, [0, 0.0, 0.0])
+                    total[0] += len(values)
+                    total[1] += float(values.sum())
+                    total[2] += float(numpy.dot(values, values))
+                    continue
+                feature_counts = counts.setdefault(key, {})
+                if output.attribute_type == "CATEGORICAL":
+                    values = output.values
+                    values = values[values != values.dtype.type()]
+                    distinct, frequency = numpy.unique(values,
+                                                       return_counts=True)
+                    for value, count in zip(distinct.tolist(),
+                                            frequency.tolist()):
+                        feature_counts[value] = \
+                            feature_counts.get(value, 0) + count
+                else:
+                    for tokens in output.tokens():
+                        for token in set(tokens):
+                            feature_counts[token] = \
+                                feature_counts.get(token, 0) + 1
+
+        ranked = sorted(
+            ((count, key, value) for key, feature_counts in counts.items()
+             for value, count in feature_counts.items()),
+            key=lambda ckv: -ckv[0])
+        budget = int(self.parameters["sgd.maxMLModelSizeInBytes"])
+        budget -= sum(8 + len(key) for key in moments)
+        self.scales = {}
+        for key, (count, total, squares) in moments.items():
+            mean = total / count if count else 0.0
+            variance = squares / count - mean * mean if count else 0.0
+            self.scales[key] = (len(self.scales), mean,
+                                math.sqrt(max(variance, 0)) or 1.0)
+        self.features = {}
+        num_features = len(self.scales)
+        for count, key, value in ranked:
+            budget -= 8 + len(key) + 1 + len(value)
+            if budget < 0:
+                break
+            self.features.setdefault(key, {})[value] = num_features
+            num_features += 1
+        self.weights = numpy.zeros(num_features)
+        self.bias = 0.0
+
+    def _encode(self, columns):
+        """Returns the recipe's features for a block of columns as sparse
+        (record, feature, value) arrays, and the block's labels.  Records
+        with a missing target are left out.
+        """
+        labels = columns.get(self.target)
+        if labels is None:  # Records to predict have no target
+            labels = numpy.repeat(numpy.nan, len(next(iter(columns.values()))))
+        rows = []
+        cols = []
+        values = []
+        for output in self.recipe.transform(columns):
+            key = output.name
+            if key in self.scales:
+                feature, mean, deviation = self.scales[key]
+                scaled = (output.values - mean) / deviation
+                scaled[~numpy.isfinite(scaled)] = 0  # Missing is average
+                rows.append(numpy.arange(len(scaled)))
+                cols.append(numpy.repeat(feature, len(scaled)))
+                values.append(scaled)
+                continue
+            features = self.features.get(key)
+            if not features:
+                continue
+            if output.attribute_type == "CATEGORICAL":
+                distinct, inverse = numpy.unique(output.values,
+                                                 return_inverse=True)
+                mapping = numpy.array([features.get(value, -1)
+                                       for value in distinct.tolist()],
+                                      dtype=numpy.int64)
+                feature_of = mapping[inverse]
+                present = numpy.flatnonzero(feature_of >= 0)
+                rows.append(present)
+                cols.append(feature_of[present])
+            else:
+                r = []
+                c = []
+                for i, tokens in enumerate(output.tokens()):
+                    for token in set(tokens):
+                        feature = features.get(token)
+                        if feature is not None:
+                            r.append(i)
+                            c.append(feature)
+                rows.append(numpy.array(r, dtype=numpy.int64))
+                cols.append(numpy.array(c, dtype=numpy.int64))
+            values.append(numpy.ones(len(rows[-1])))
+        rows = numpy.concatenate(rows) if rows else numpy.zeros(0, int)
+        cols = numpy.concatenate(cols) if cols else numpy.zeros(0, int)
+        values = numpy.concatenate(values) if values else numpy.zeros(0)
+        return rows, cols, values, labels
+
+
+def binary_prediction(score, threshold=0.5):
+    """Returns a binary model's score as the Predict API returns it.
+    """
+    return {
+        "predictedLabel": "1" if score >= threshold else "0",
+        "predictedScores": {"1": score},
+        "details": {"Algorithm": "SGD", "PredictiveModelType": "BINARY"},
+    }
+
+
+class _BatchedRequest(object):
+
+    def __init__(self, record):
+        self.record = record
+        self.prediction = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher(object):
+
+    """Coalesces predictions requested from many threads at once into
+    batches, so a vectorized model scores them in one call.
+
+    predict_batch is called from a single worker thread with a list of
+    records, and returns a list with their predictions.  A batch is sent
+    when it has max_batch_size records, or max_wait_ms after its first
+    record arrived.  While a batch is being scored, new requests queue up
+    for the next one, so batches grow with the load on their own.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=32, max_wait_ms=2.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.num_batches = 0
+        self.num_records = 0
+        self.batch_sizes = collections.Counter()
+        self._queue = Queue.Queue()
+        self._worker = threading.Thread(target=self._run)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def predict(self, record):
+        """Returns the prediction for record, once its batch is scored.
+        Raises whatever predict_batch raised for the batch.
+        """
+        request = _BatchedRequest(record)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.prediction
+
+    def close(self):
+        """Scores the requests already queued, then stops the worker.
+        """
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.time() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.time()
+                try:
+                    if remaining > 0:
+                        request = self._queue.get(timeout=remaining)
+                    else:
+                        request = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self._score(batch)
+
+    def _score(self, batch):
+        try:
+            predictions = self.predict_batch(
+                [request.record for request in batch])
+            if len(predictions) != len(batch):
+                raise AWSPyMLException(
+                    "Model returned %d predictions for %d records" %
+                    (len(predictions), len(batch)))
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        else:
+            for request, prediction in zip(batch, predictions):
+                request.prediction = prediction
+        self.num_batches += 1
+        self.num_records += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        for request in batch:
+            request.done.set()
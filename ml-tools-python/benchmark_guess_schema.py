@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Compares the speed of SchemaGuesser's vectorized (numpy) classification of
+sampled records with classifying one value at a time, on a synthetic
+sample with a mix of numeric, binary, categorical, text and mostly-numeric
+columns.  Both go through _classify_rows, which is what from_file and the
+other guessing methods use.  Also checks that both produce the same codes.
+
+Numeric columns of distinct values gain the least, since parsing each
+value as a float is most of the work either way.
+
+Usage:
+    python benchmark_guess_schema.py [num_rows] [num_columns]
+"""
+import random
+import sys
+import time
+import awspyml
+
+
+def make_column(kind, num_rows):
+    if kind == "NUMERIC":
+        return ["%.4f" % random.gauss(0, 100) for i in range(num_rows)]
+    if kind == "BINARY":
+        return [random.choice(["0", "1"]) for i in range(num_rows)]
+    if kind == "CATEGORICAL":
+        return [random.choice(["red", "green", "blue", "light blue"])
+                for i in range(num_rows)]
+    if kind == "TEXT":
+        return [" ".join(["word"] * random.randint(5, 40))
+                for i in range(num_rows)]
+    # Mostly numeric, with some missing-value markers mixed in.
+    return [random.choice(["NA", "", str(random.randint(0, 99))])
+            for i in range(num_rows)]
+
+
+def time_classify(guesser, records, vectorize, repeats=3):
+    """Returns the codes of the records, and the best of repeats times.
+    """
+    guesser.vectorize = vectorize
+    guesser.num_attributes = len(records[0])
+    best = None
+    for i in range(repeats):
+        start = time.time()
+        codes = guesser._classify_rows(records)
+        secs = time.time() - start
+        best = secs if best is None else min(best, secs)
+    return [list(row) for row in codes], best
+
+
+def speedup(guesser, records):
+    scalar_codes, scalar_secs = time_classify(guesser, records, False, 1)
+    vector_codes, vector_secs = time_classify(guesser, records, True)
+    return scalar_codes == vector_codes, scalar_secs, vector_secs
+
+
+if __name__ == "__main__":
+    try:
+        num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+        num_columns = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    except:
+        print(__doc__)
+        sys.exit(-1)
+    if awspyml.numpy is None:
+        print("numpy is not installed, so there is nothing to compare")
+        sys.exit(-1)
+    random.seed(0)
+    kinds = ["NUMERIC", "BINARY", "CATEGORICAL", "TEXT", "MIXED"]
+    columns = [make_column(kinds[i % len(kinds)], num_rows)
+               for i in range(num_columns)]
+
+    guesser = awspyml.SchemaGuesser()
+    records = [list(record) for record in zip(*columns)]
+    same, scalar_secs, vector_secs = speedup(guesser, records)
+    print("%d x %d sample" % (num_rows, num_columns))
+    print("One value at a time: %.3fs" % scalar_secs)
+    print("Vectorized:          %.3fs" % vector_secs)
+    print("Speedup:             %.1fx" % (scalar_secs / vector_secs))
+    for kind in kinds:
+        kind_columns = columns[kinds.index(kind)::len(kinds)]
+        kind_records = [list(record) for record in zip(*kind_columns)]
+        kind_same, scalar_secs, vector_secs = speedup(guesser, kind_records)
+        same = same and kind_same
+        print("  %-12s %.1fx" % (kind, scalar_secs / vector_secs))
+    if not same:
+        print("MISMATCH in classified values")
+        sys.exit(1)
@@ -18,23 +18,76 @@ data type each column is.  Then produces a valid JSON schema that
 can be passed to create_data_source_from_s3 method.
 
 Usage:
-    python guess_schema.py data_file.csv [target_variable_name] > data_file.csv.schema
+    python guess_schema.py [--streaming] [--processes N] [--cache] [--detect-ids] data_file.csv [target_variable_name] > data_file.csv.schema
+    python guess_schema.py --jsonl [--csv data_file.csv] data_file.json [target_variable_name] > data_file.csv.schema
 
 If specified, target_variable_name should match one of the variables
 in the file's header.
+
+data_file.csv can also be an s3://bucket/key URL.  Then only the head of
+the object and a few randomly placed blocks are fetched, concurrently, so
+even a very large object is guessed in about a second without being
+downloaded.
+
+With --streaming the whole file is read, and the guess is based on a
+random sample of records from all of it instead of the first 1,000.
+
+With --processes, or when data_file.csv is a directory of CSV shards,
+the data is split into byte ranges which are sampled in parallel by
+N worker processes (default: one per CPU).
+
+With --cache, what was learned about the file is kept in
+~/.awspyml/schema-cache, so guessing the same file again is nearly free,
+and with --streaming only lines appended since the last run are read.
+
+With --detect-ids, columns that look like ids rather than features are
+taken out of the model: CATEGORICAL or integer NUMERIC columns whose values
+are nearly all distinct (at least 95% by default, set with --id-threshold),
+and that are named like keys (e.g. "customer_id" or "sid"), or have only
+single-word values or integers that never repeat.  TEXT columns are always
+kept.  The first id becomes the schema's rowId, and the rest are excluded.
+
+With --jsonl, the data file has one JSON object per line instead, like
+social-media's line_separated_tweets_json.txt.  Nested objects become
+dotted attribute names (e.g. "r.sid"), and every field seen in any record
+is an attribute.  --csv also writes the records out as a CSV file with
+the columns in schema order, ready to upload.
 """
-import sys
+import argparse
+import os
 import awspyml
 
 
 if __name__ == "__main__":
-    try:
-        data_fn = sys.argv[1]
-        target = None
-        if len(sys.argv) > 2:
-            target = sys.argv[2]
-    except:
-        print(__doc__)
-        sys.exit(-1)
-    schema = awspyml.SchemaGuesser().from_file(data_fn, target_variable=target)
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("data_fn")
+    parser.add_argument("target", nargs="?", default=None)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--id-threshold", type=float, default=0.95)
+    parser.add_argument("--detect-ids", action="store_true")
+    parser.add_argument("--jsonl", action="store_true")
+    parser.add_argument("--csv", default=None)
+    args = parser.parse_args()
+
+    if args.jsonl:
+        guesser = awspyml.JsonLinesSchemaGuesser()
+    else:
+        guesser = awspyml.SchemaGuesser()
+    guesser.id_distinct_ratio = args.id_threshold if args.detect_ids else None
+    if args.jsonl:
+        schema = guesser.from_file(args.data_fn, target_variable=args.target)
+        if args.csv:
+            guesser.write_csv(args.data_fn, args.csv)
+    elif args.data_fn.startswith("s3://"):
+        schema = guesser.from_object(args.data_fn, target_variable=args.target)
+    elif args.processes or os.path.isdir(args.data_fn):
+        schema = guesser.from_file_parallel(args.data_fn,
+                                            target_variable=args.target,
+                                            processes=args.processes)
+    else:
+        cache = awspyml.SchemaGuessCache() if args.cache else None
+        schema = guesser.from_file(args.data_fn, target_variable=args.target,
+                                   streaming=args.streaming, cache=cache)
     print(schema.as_json_string())
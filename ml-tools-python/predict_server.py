@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Local stand-in for an Amazon Machine Learning realtime endpoint.
+Answers Predict (and GetMLModel) requests in the same JSON shape as the
+service, for any ML model id, so realtime prediction code and load tests
+can run offline and without paying for an endpoint.
+
+It serves either a model trained at startup like train_local.py does, or
+with --stub a model whose scores are a hash of the record, taking a
+simulated --stub-batch-ms per batch plus --stub-record-ms per record.
+Concurrent requests are coalesced into batches of up to --max-batch-size
+records, waiting at most --max-wait-ms for a batch to fill; compare
+throughput with --max-batch-size 1 to see what batching buys.
+GET /stats returns how many batches of each size were scored.
+
+Point boto at it with:
+    ml = boto.connect_machinelearning(host="localhost", port=8080,
+                                      is_secure=False)
+    ml.predict("ml-local", record, predict_endpoint="http://localhost:8080")
+(boto still signs requests, so it needs some AWS credentials to be set, but
+they are not checked.)
+
+Usage:
+    python predict_server.py [--port 8080] [--max-batch-size 32]
+        [--max-wait-ms 2] [--param name=value ...]
+        data_file.csv data_file.csv.schema recipe.json
+or:
+    python predict_server.py [--port 8080] [--max-batch-size 32]
+        [--max-wait-ms 2] --stub [--stub-batch-ms 5] [--stub-record-ms 0.05]
+"""
+import argparse
+import BaseHTTPServer
+import hashlib
+import json
+import SocketServer
+import time
+import awspyml
+
+
+class StubModel(object):
+
+    """Scores records with a hash of their contents, so the same record
+    always gets the same score, after sleeping like a model would.
+    """
+
+    def __init__(self, batch_ms, record_ms):
+        self.batch_ms = batch_ms
+        self.record_ms = record_ms
+
+    def predict_records(self, records):
+        time.sleep((self.batch_ms + self.record_ms * len(records)) / 1000.0)
+        predictions = []
+        for record in records:
+            digest = hashlib.md5(json.dumps(record, sort_keys=True))
+            score = int(digest.hexdigest()[:8], 16) / float(1 << 32)
+            predictions.append(awspyml.binary_prediction(score))
+        return predictions
+
+
+class PredictServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    # Don't drop the connections of many clients starting at once.
+    request_queue_size = 128
+
+    def __init__(self, address, batcher, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, PredictHandler)
+        self.batcher = batcher
+        self.verbose = verbose
+
+    def endpoint_url(self):
+        return "http://%s:%d" % self.server_address[:2]
+
+
+class PredictHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # Keep connections alive, like the service does.
+    protocol_version = "HTTP/1.1"
+    # Send each response in one write, or the client's delayed ACK of the
+    # headers holds the body back for tens of milliseconds.
+    wbufsize = -1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        action = self.headers.get("X-Amz-Target", "").split(".")[-1]
+        try:
+            params = json.loads(body)
+        except ValueError:
+            return self.send_json(400, {"__type": "InvalidInputException",
+                                        "message": "Malformed JSON body"})
+        if action == "DescribeMLModels":
+            # Clients check their credentials with this.
+            return self.send_json(200, {"Results": []})
+        ml_model_id = params.get("MLModelId")
+        if not ml_model_id:
+            return self.send_json(400, {"__type": "InvalidInputException",
+                                        "message": "MLModelId is required"})
+        if action == "Predict":
+            record = params.get("Record")
+            if not isinstance(record, dict):
+                return self.send_json(400, {
+                    "__type": "InvalidInputException",
+                    "message": "Record must be a map of strings"})
+            try:
+                prediction = self.server.batcher.predict(record)
+            except Exception as e:
+                return self.send_json(500, {"__type": "InternalServerException",
+                                            "message": str(e)})
+            self.send_json(200, {"Prediction": prediction})
+        elif action == "GetMLModel":
+            self.send_json(200, {
+                "MLModelId": ml_model_id,
+                "MLModelType": "BINARY",
+                "Status": "COMPLETED",
+                "EndpointInfo": {
+                    "EndpointStatus": "READY",
+                    "EndpointUrl": self.server.endpoint_url(),
+                    "PeakRequestsPerSecond": 200,
+                },
+            })
+        else:
+            self.send_json(400, {"__type": "UnknownOperationException",
+                                 "message": "%s is not supported" % action})
+
+    def do_GET(self):
+        if self.path != "/stats":
+            return self.send_json(404, {"message": "Not found"})
+        batcher = self.server.batcher
+        self.send_json(200, {
+            "numBatches": batcher.num_batches,
+            "numRecords": batcher.num_records,
+            "batchSizes": dict((str(size), count) for size, count
+                               in batcher.batch_sizes.items()),
+        })
+
+    def send_json(self, status, obj):
+        body = json.dumps(obj)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("training_fns", nargs="*")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--param", action="append", default=[])
+    parser.add_argument("--stub", action="store_true")
+    parser.add_argument("--stub-batch-ms", type=float, default=5.0)
+    parser.add_argument("--stub-record-ms", type=float, default=0.05)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.stub:
+        model = StubModel(args.stub_batch_ms, args.stub_record_ms)
+    else:
+        if len(args.training_fns) != 3:
+            parser.error("Give a data file, schema and recipe, or --stub")
+        data_fn, schema_fn, recipe_fn = args.training_fns
+        parameters = dict(param.split("=", 1) for param in args.param)
+        schema = awspyml.Schema.read_from_file(schema_fn)
+        recipe = awspyml.Recipe.read_from_file(recipe_fn, schema)
+        dataset = awspyml.ColumnarDataset.from_csv(data_fn, schema)
+        model = awspyml.SGDTrainer(recipe, parameters)
+        report = model.train(dataset, train_percent=100)
+        print("Trained on %d records" % report.as_obj()["trainingRecords"])
+
+    batcher = awspyml.MicroBatcher(model.predict_records, args.max_batch_size,
+                                   args.max_wait_ms)
+    server = PredictServer(("localhost", args.port), batcher, args.verbose)
+    print("Serving predictions at %s" % server.endpoint_url())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+    print("Scored %d records in %d batches" % (batcher.num_records,
+                                               batcher.num_batches))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Recipe preview utility for Amazon Machine Learning.
+Evaluates a recipe's transformations locally on a CSV file, and reports
+how many features each of the recipe's outputs expands to: one for a
+NUMERIC or BINARY variable, and one per distinct category (including
+quantile bins) or text token otherwise.  This shows the size of the
+feature space a model would be trained on, without creating one.
+
+Usage:
+    python preview_recipe.py data_file.csv data_file.csv.schema recipe.json
+
+Requires numpy.
+"""
+import argparse
+import awspyml
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("data_fn")
+    parser.add_argument("schema_fn")
+    parser.add_argument("recipe_fn")
+    args = parser.parse_args()
+
+    schema = awspyml.Schema.read_from_file(args.schema_fn)
+    recipe = awspyml.Recipe.read_from_file(args.recipe_fn, schema)
+    recipe.fit(awspyml.csv_column_blocks(args.data_fn, schema))
+    feature_space = recipe.feature_space(
+        awspyml.csv_column_blocks(args.data_fn, schema))
+    print(feature_space.as_json_string())
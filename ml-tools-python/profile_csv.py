@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Column profiling utility for Amazon Machine Learning.
+Reads a CSV file (or a directory of CSV shard files) once, and reports for
+each column how many values are missing, approximately how many distinct
+values there are, quantiles of its numeric values and its most frequent
+values.  This previews what a data source created with ComputeStatistics
+would show, before uploading anything.
+
+The report is JSON with sorted keys, so reports from different runs can
+be compared with diff.
+
+Usage:
+    python profile_csv.py [--processes N] data_file.csv [report.json]
+
+Without report.json the report is printed.
+"""
+import argparse
+import awspyml
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("data_fn")
+    parser.add_argument("report_fn", nargs="?", default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    profile = awspyml.DataProfiler().from_file(args.data_fn,
+                                               processes=args.processes)
+    if args.report_fn:
+        profile.write_to_file(args.report_fn)
+    else:
+        print(profile.as_json_string())
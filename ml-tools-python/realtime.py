@@ -20,12 +20,46 @@ or:
 
 Multi-word text attributes can be specified like:
     python realtime.py ml-12345678901 "textVar=Multiple words grouped together" numericVar=123
+
+To score many records, one JSON object per line or a CSV file (with a header
+line, or with --schema naming its columns), from a file or stdin:
+    python realtime.py ml_model_id --bulk [records.jsonl | records.csv]
+        [--format jsonl|csv] [--schema records.csv.schema] [--threads 16]
+        [--output predictions.jsonl] [--service http://localhost:8080]
+        [--cache-ttl 300] [--shadow ml_model_id2 ... --shadow-log shadow.jsonl]
+Predictions are written as one JSON object per line, in the order of the
+records, followed by a latency summary on stderr.  With --cache-ttl,
+repeated records are only sent once, and their predictions reused for
+that many seconds.  --service sends the requests somewhere other than
+Amazon Machine Learning, like predict_server.py.  Each --shadow model
+also scores every record, in the background, and how often it agrees with
+ml_model_id is reported; --shadow-log writes every record's predictions.
+
+To load test an endpoint by replaying the records in a file, either at a
+fixed rate (open loop) or with a fixed number of requests outstanding
+(closed loop):
+    python realtime.py ml_model_id --loadtest records.jsonl
+        [--rate 200 | --concurrency 16] [--duration 30] [--format jsonl|csv]
+        [--schema records.csv.schema] [--report report.json]
+        [--service http://localhost:8080]
+In open loop, latency is measured from when each request should have been
+sent, so a slow endpoint can't hide its queueing by holding the load
+generator back (coordinated omission); up to --concurrency requests are in
+flight, and how late each one was sent is reported as its send lag.  A
+table of latency percentiles is printed, and --report writes them, with
+the throughput and error count, as JSON.
 """
 
-import boto
+import argparse
+import awspyml
+import itertools
 import json
+import Queue
 import sys
+import threading
 import time
+import urlparse
+from multiprocessing.pool import ThreadPool
 
 
 def parse_args_to_dict(argv):
@@ -51,15 +85,15 @@ def realtime_predict(ml_model_id, record):
     If the ML Model doesn't have a realtime endpoint, it creates one instead
     of calling predict()
     """
-    ml = boto.connect_machinelearning()
-    model = ml.get_ml_model(ml_model_id)
-    endpoint = model.get('EndpointInfo', {}).get('EndpointUrl', '')
+    ml = awspyml.aml_connection()
+    endpoint = awspyml.endpoint_cache.endpoint_url(ml_model_id, ml)
     #endpoint = endpoint.replace("https://", "")  # This shouldn't be needed
     if endpoint:
         print('ml.predict("%s", %s, "%s") # returns...' % (ml_model_id,
                                                            json.dumps(record, indent=2), endpoint))
         start = time.time()
-        prediction = ml.predict(ml_model_id, record, predict_endpoint=endpoint)
+        # awspyml.predict forgets the cached endpoint if the call fails.
+        prediction = awspyml.predict(ml_model_id, record, ml)
         latency_ms = (time.time() - start)*1000
         print(json.dumps(prediction, indent=2))
         print("Latency: %.2fms" % latency_ms)
@@ -74,15 +108,474 @@ def realtime_predict(ml_model_id, record):
     python realtime.py %s --deleteEndpoint""" % ml_model_id)
 
 
+class FanOutPredictor(object):
+
+    """Scores each record with a primary model, and also sends it to
+    shadow models, to compare a candidate model with the one in production
+    on live traffic.
+
+    predict() calls the primary model's endpoint itself and returns as soon
+    as its prediction arrives.  The shadow calls are queued for a separate
+    pool of threads, and dropped (and counted) when more than max_pending
+    are waiting, so shadows never hold up the primary path.  A background
+    thread matches each record's predictions, keeps per-model latency and
+    agreement statistics, and writes them to shadow_log, if given, as a
+    line of JSON per record.
+    """
+
+    def __init__(self, shadow_ids, shadow_log=None, shadow_threads=8,
+                 max_pending=1000, service=None):
+        self.shadow_ids = list(shadow_ids)
+        self.shadow_log = shadow_log
+        self.service = service
+        self._stats = {}
+        self._shadow_queue = Queue.Queue(max_pending)
+        self._log_queue = Queue.Queue()
+        self._next_id = itertools.count()
+        self._shadow_workers = [threading.Thread(target=self._shadow_worker)
+                                for i in range(shadow_threads)]
+        self._log_worker = threading.Thread(target=self._log_worker)
+        for worker in self._shadow_workers + [self._log_worker]:
+            worker.daemon = True
+            worker.start()
+
+    def _call(self, ml_model_id, record, ml=None):
+        start = time.time()
+        try:
+            prediction = awspyml.predict(
+                ml_model_id, record, ml or service_connection(self.service))
+            error = None
+        except Exception as e:
+            prediction = None
+            error = e
+        return prediction, error, (time.time() - start) * 1000
+
+    def predict(self, ml_model_id, record, ml=None):
+        """Returns ml_model_id's prediction for record, after queueing it
+        for the shadow models.
+        """
+        request_id = next(self._next_id)
+        for shadow_id in self.shadow_ids:
+            try:
+                self._shadow_queue.put_nowait((request_id, shadow_id, record))
+            except Queue.Full:
+                self._log_queue.put((request_id, shadow_id, None, None, None))
+        prediction, error, latency_ms = self._call(ml_model_id, record, ml)
+        self._log_queue.put((request_id, ml_model_id, record,
+                             (prediction, error, latency_ms), True))
+        if error is not None:
+            raise error
+        return prediction
+
+    def _shadow_worker(self):
+        while True:
+            request_id, shadow_id, record = self._shadow_queue.get()
+            self._log_queue.put((request_id, shadow_id, None,
+                                 self._call(shadow_id, record), False))
+            self._shadow_queue.task_done()
+
+    def _model_stats(self, ml_model_id):
+        stats = self._stats.get(ml_model_id)
+        if stats is None:
+            stats = self._stats[ml_model_id] = {
+                "latency": awspyml.LatencyHistogram(),
+                "requests": 0, "errors": 0, "dropped": 0,
+                "compared": 0, "agreed": 0,
+            }
+        return stats
+
+    def _log_worker(self):
+        pending = {}  # Request id -> {"primary": ..., "shadows": [...]}
+        while True:
+            message = self._log_queue.get()
+            if message is None:
+                self._log_queue.task_done()
+                return
+            request_id, ml_model_id, record, result, primary = message
+            entry = pending.setdefault(request_id, {"shadows": []})
+            stats = self._model_stats(ml_model_id)
+            if result is None:
+                stats["dropped"] += 1
+                item = {"mlModelId": ml_model_id, "dropped": True}
+            else:
+                prediction, error, latency_ms = result
+                stats["requests"] += 1
+                stats["latency"].record(latency_ms * 1000)
+                item = {"mlModelId": ml_model_id, "latencyMs": latency_ms}
+                if error is not None:
+                    stats["errors"] += 1
+                    item["error"] = str(error)
+                else:
+                    item["prediction"] = prediction
+            if primary:
+                entry["record"] = record
+                entry["primary"] = item
+            else:
+                entry["shadows"].append(item)
+            if "primary" in entry and \
+                    len(entry["shadows"]) == len(self.shadow_ids):
+                del pending[request_id]
+                self._compare(entry)
+            self._log_queue.task_done()
+
+    def _compare(self, entry):
+        primary = entry["primary"].get("prediction")
+        if primary is not None:
+            primary = primary.get("Prediction", primary)
+        for shadow in entry["shadows"]:
+            prediction = shadow.get("prediction")
+            if primary is None or prediction is None:
+                continue
+            prediction = prediction.get("Prediction", prediction)
+            stats = self._model_stats(shadow["mlModelId"])
+            stats["compared"] += 1
+            if "predictedLabel" in primary:
+                agrees = (primary["predictedLabel"] ==
+                          prediction.get("predictedLabel"))
+            else:
+                # Regression: agree when within 1% of each other.
+                a = primary.get("predictedValue", 0)
+                b = prediction.get("predictedValue", 0)
+                agrees = abs(a - b) <= 0.01 * max(abs(a), abs(b))
+            stats["agreed"] += agrees
+            shadow["agrees"] = agrees
+        if self.shadow_log:
+            self.shadow_log.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        """Waits for the queued shadow predictions to be made and logged.
+        """
+        self._shadow_queue.join()
+        self._log_queue.put(None)
+        self._log_worker.join()
+        if self.shadow_log:
+            self.shadow_log.flush()
+
+    def stats(self):
+        """Returns the requests, errors, dropped shadow calls, latency
+        percentiles and (for shadows) agreement rate of each model.  Only
+        complete after close().
+        """
+        result = {}
+        for ml_model_id, stats in self._stats.items():
+            latency = stats["latency"]
+            result[ml_model_id] = {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "dropped": stats["dropped"],
+                "p50LatencyMs": latency.percentile(50) / 1000.0,
+                "p99LatencyMs": latency.percentile(99) / 1000.0,
+            }
+            if ml_model_id in self.shadow_ids and stats["compared"]:
+                result[ml_model_id]["agreement"] = \
+                    stats["agreed"] / float(stats["compared"])
+        return result
+
+
+def service_connection(url=None):
+    """Returns the calling thread's connection to the service, or to the
+    service at url.
+    """
+    if not url:
+        return awspyml.aml_connection()
+    parts = urlparse.urlsplit(url)
+    return awspyml.aml_connection(parts.hostname, parts.port,
+                                  parts.scheme == "https")
+
+
+def percentile(sorted_values, percent):
+    """Returns the nearest-rank percentile of a sorted list.
+    """
+    if not sorted_values:
+        return 0
+    rank = int(round(percent / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+def bulk_predict(ml_model_id, records, output, threads=16, service=None,
+                 cache=None, fan_out=None):
+    """Scores records (an iterable of dicts) with threads concurrent
+    predict calls, writing each prediction to output as a line of JSON in
+    the order of the records.  Records that fail get an "Error" instead.
+    Predictions go through cache, an awspyml.PredictionCache, and then
+    fan_out, a FanOutPredictor, when they are given.
+    Returns the list of latencies in milliseconds, and how many failed.
+    """
+    if cache:
+        predict_function = cache.predict
+    elif fan_out:
+        predict_function = fan_out.predict
+    else:
+        predict_function = awspyml.predict
+    if not awspyml.endpoint_cache.endpoint_url(ml_model_id,
+                                               service_connection(service)):
+        raise RuntimeError("ML model %s has no realtime endpoint.  Create one "
+                           "with: python realtime.py %s" %
+                           (ml_model_id, ml_model_id))
+    # Only read ahead a few records per thread, so that large inputs
+    # aren't loaded into memory.
+    window = threading.Semaphore(threads * 4)
+
+    def throttled(records):
+        for record in records:
+            window.acquire()
+            yield record
+
+    def predict(record):
+        start = time.time()
+        try:
+            result = predict_function(ml_model_id, record,
+                                      service_connection(service))
+        except Exception as e:
+            result = {"Error": str(e)}
+        return result, (time.time() - start) * 1000
+
+    latencies = []
+    errors = 0
+    pool = ThreadPool(threads)
+    try:
+        for result, latency_ms in pool.imap(predict, throttled(records)):
+            window.release()
+            output.write(json.dumps(result) + "\n")
+            latencies.append(latency_ms)
+            errors += "Error" in result
+    finally:
+        pool.terminate()
+    return latencies, errors
+
+
+def print_latency_summary(latencies, seconds, errors, out=sys.stderr):
+    latencies = sorted(latencies)
+    out.write("Scored %d records (%d failed) in %.2fs, %.1f records/s\n" %
+              (len(latencies), errors, seconds,
+               len(latencies) / seconds if seconds else 0))
+    out.write("Latency: p50 %.2fms  p95 %.2fms  p99 %.2fms  max %.2fms\n" %
+              (percentile(latencies, 50), percentile(latencies, 95),
+               percentile(latencies, 99), latencies[-1] if latencies else 0))
+
+
+def main_bulk(ml_model_id, argv):
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("input_fn", nargs="?", default="-")
+    parser.add_argument("--format", choices=["jsonl", "csv"])
+    parser.add_argument("--schema")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--output", default="-")
+    parser.add_argument("--service")
+    parser.add_argument("--cache-ttl", type=float)
+    parser.add_argument("--shadow", action="append", default=[])
+    parser.add_argument("--shadow-log")
+    args = parser.parse_args(argv)
+
+    data_format = args.format
+    if data_format is None:
+        data_format = "csv" if args.input_fn.endswith(".csv") else "jsonl"
+    schema = None
+    if args.schema:
+        schema = awspyml.Schema.read_from_file(args.schema)
+    infile = sys.stdin if args.input_fn == "-" else open(args.input_fn, "rb")
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    records = awspyml.prediction_records(infile, data_format, schema)
+
+    fan_out = None
+    if args.shadow:
+        shadow_log = open(args.shadow_log, "w") if args.shadow_log else None
+        fan_out = FanOutPredictor(args.shadow, shadow_log,
+                                  service=args.service)
+    cache = None
+    if args.cache_ttl:
+        cache = awspyml.PredictionCache(
+            args.cache_ttl, predict_function=fan_out and fan_out.predict)
+    start = time.time()
+    latencies, errors = bulk_predict(ml_model_id, records, output,
+                                     args.threads, args.service, cache,
+                                     fan_out)
+    output.flush()
+    print_latency_summary(latencies, time.time() - start, errors)
+    if cache:
+        sys.stderr.write("Cache: %(hits)d hits, %(coalesced)d coalesced, "
+                         "%(misses)d misses\n" % cache.stats())
+    if fan_out:
+        fan_out.close()
+        for model_id, stats in sorted(fan_out.stats().items()):
+            sys.stderr.write("%s: %s\n" % (model_id,
+                                            json.dumps(stats, sort_keys=True)))
+
+
+REPORTED_PERCENTILES = [50, 75, 90, 95, 99, 99.9, 99.99, 100]
+
+
+def load_test(ml_model_id, records, duration, rate=None, concurrency=16,
+              service=None):
+    """Sends predictions for records (a list, replayed from the start when
+    it runs out) for duration seconds, at rate requests per second with up
+    to concurrency in flight, or as fast as concurrency requests at a time
+    allow if rate is None.  Returns a dict with the latency histograms
+    (awspyml.LatencyHistogram, in microseconds), and the counts of requests
+    and errors.  In open loop, the "sendLag" histogram has how long after
+    its scheduled time each request was sent.
+    """
+    if not awspyml.endpoint_cache.endpoint_url(ml_model_id,
+                                               service_connection(service)):
+        raise RuntimeError("ML model %s has no realtime endpoint" %
+                           ml_model_id)
+    result = {
+        "latency": awspyml.LatencyHistogram(),
+        "uncorrectedLatency": awspyml.LatencyHistogram(),
+        "sendLag": awspyml.LatencyHistogram(),
+        "requests": 0,
+        "errors": 0,
+    }
+    lock = threading.Lock()
+    replay = itertools.cycle(records)
+
+    def call(record, intended_start):
+        start = time.time()
+        try:
+            awspyml.predict(ml_model_id, record, service_connection(service))
+            failed = False
+        except Exception:
+            failed = True
+        end = time.time()
+        with lock:
+            result["latency"].record((end - intended_start) * 1000000)
+            result["uncorrectedLatency"].record((end - start) * 1000000)
+            result["sendLag"].record(max(start - intended_start, 0) * 1000000)
+            result["requests"] += 1
+            result["errors"] += failed
+
+    start = time.time()
+    deadline = start + duration
+    if rate:
+        pool = ThreadPool(concurrency)
+        slots = threading.BoundedSemaphore(concurrency)
+
+        def open_loop_call(record, intended_start):
+            try:
+                call(record, intended_start)
+            finally:
+                slots.release()
+
+        for i in itertools.count():
+            intended_start = start + i / float(rate)
+            if intended_start >= deadline:
+                break
+            delay = intended_start - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            # Wait for a free thread instead of queueing requests without
+            # bound.  The wait still counts in their latency, since that
+            # is measured from intended_start.
+            slots.acquire()
+            pool.apply_async(open_loop_call, (next(replay), intended_start))
+        pool.close()
+        pool.join()
+    else:
+        def closed_loop():
+            while time.time() < deadline:
+                with lock:
+                    record = next(replay)
+                call(record, time.time())
+        workers = [threading.Thread(target=closed_loop)
+                   for i in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    result["seconds"] = time.time() - start
+    return result
+
+
+def load_test_report(result, rate, concurrency):
+    """Returns the JSON report of a load_test, with latencies in ms.
+    """
+    def percentiles(histogram):
+        return dict(("p%g" % percent, histogram.percentile(percent) / 1000.0)
+                    for percent in REPORTED_PERCENTILES)
+
+    report = {
+        "mode": "open" if rate else "closed",
+        "targetRate": rate,
+        "concurrency": concurrency,
+        "seconds": result["seconds"],
+        "requests": result["requests"],
+        "errors": result["errors"],
+        "throughput": result["requests"] / result["seconds"],
+        "latencyMs": percentiles(result["latency"]),
+        "meanLatencyMs": result["latency"].mean() / 1000.0,
+    }
+    if rate:
+        report["uncorrectedLatencyMs"] = percentiles(
+            result["uncorrectedLatency"])
+        report["sendLagMs"] = percentiles(result["sendLag"])
+    return report
+
+
+def print_percentile_table(report, out=sys.stdout):
+    uncorrected = report.get("uncorrectedLatencyMs")
+    out.write("%d requests (%d failed) in %.2fs, %.1f requests/s\n" %
+              (report["requests"], report["errors"], report["seconds"],
+               report["throughput"]))
+    out.write("%10s %14s" % ("Percentile", "Latency (ms)"))
+    out.write(" %14s\n" % "Uncorrected" if uncorrected else "\n")
+    for percent in REPORTED_PERCENTILES:
+        key = "p%g" % percent
+        out.write("%10g %14.3f" % (percent, report["latencyMs"][key]))
+        out.write(" %14.3f\n" % uncorrected[key] if uncorrected else "\n")
+    if "sendLagMs" in report:
+        out.write("Send lag: p50 %.3fms  p99 %.3fms  max %.3fms\n" %
+                  (report["sendLagMs"]["p50"], report["sendLagMs"]["p99"],
+                   report["sendLagMs"]["p100"]))
+
+
+def main_load_test(ml_model_id, argv):
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("input_fn")
+    parser.add_argument("--rate", type=float)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--format", choices=["jsonl", "csv"])
+    parser.add_argument("--schema")
+    parser.add_argument("--report")
+    parser.add_argument("--service")
+    args = parser.parse_args(argv)
+
+    data_format = args.format
+    if data_format is None:
+        data_format = "csv" if args.input_fn.endswith(".csv") else "jsonl"
+    schema = None
+    if args.schema:
+        schema = awspyml.Schema.read_from_file(args.schema)
+    with open(args.input_fn, "rb") as f:
+        records = list(awspyml.prediction_records(f, data_format, schema))
+    if not records:
+        parser.error("%s has no records" % args.input_fn)
+
+    result = load_test(ml_model_id, records, args.duration, args.rate,
+                       args.concurrency, args.service)
+    report = load_test_report(result, args.rate, args.concurrency)
+    print_percentile_table(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
 def delete_realtime_endpoint(ml_model_id):
-    ml = boto.connect_machinelearning()
+    ml = awspyml.aml_connection()
     print('# Deleting realtime endpoint\nml.delete_realtime_endpoint("%s")' %
           ml_model_id)
     result = ml.delete_realtime_endpoint(ml_model_id)
+    awspyml.endpoint_cache.invalidate(ml_model_id)
     print(json.dumps(result, indent=2))
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[2] == "--bulk":
+        main_bulk(sys.argv[1], sys.argv[3:])
+        sys.exit(0)
+    if len(sys.argv) > 2 and sys.argv[2] == "--loadtest":
+        main_load_test(sys.argv[1], sys.argv[3:])
+        sys.exit(0)
     try:
         ml_model_id = sys.argv[1]
         delete_endpoint = (sys.argv[2] == "--deleteEndpoint")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Scores a backlog of records with realtime predictions or a batch
+prediction, whichever suits it.
+
+Realtime predictions are charged and rate limited per request, so a large
+backlog is cheaper and often faster to score with a batch prediction: the
+records are written to a CSV file in S3, scored the way use_model.py does
+it, and the results are matched back to the records by a row id.  Records
+that must be scored before a batch prediction could finish, and backlogs
+too small to be worth one, go to the realtime endpoint instead.
+
+A record goes to the realtime endpoint if its deadline is less than
+--batch-turnaround seconds away.  The rest are spilled to a batch
+prediction if there are at least --spill-threshold of them, and would take
+longer than --batch-turnaround to score at --realtime-rate records per
+second.
+
+Usage:
+    python route_predictions.py ml_model_id records.jsonl batch.csv.schema
+        s3://bucket/staging-prefix [--deadline-field deadline]
+        [--spill-threshold 20000] [--batch-turnaround 1200]
+        [--realtime-rate 200] [--threads 16] [--output predictions.jsonl]
+
+Each record's deadline, if it has one, is read from --deadline-field as
+seconds since the epoch (and isn't sent to the model).  Predictions are
+written as JSON lines in the order of the records, with a "Route" of
+"realtime" or "batch".
+"""
+import argparse
+import awspyml
+import boto
+import csv
+import datetime
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+ROW_ID = "routedRecordId"
+
+
+class RoutingPolicy(object):
+
+    """Decides which records of a backlog are scored in realtime, and which
+    are spilled to a batch prediction.
+    """
+
+    def __init__(self, spill_threshold=20000, batch_turnaround=1200,
+                 realtime_rate=200):
+        self.spill_threshold = spill_threshold
+        self.batch_turnaround = batch_turnaround
+        self.realtime_rate = realtime_rate
+
+    def route(self, deadlines, now=None):
+        """Takes the deadline (or None) of each record in a backlog, and
+        returns the lists of indexes of the records to score in realtime,
+        and with a batch prediction.
+        """
+        now = now or time.time()
+        urgent = []
+        rest = []
+        for idx, deadline in enumerate(deadlines):
+            if deadline is not None and \
+                    deadline < now + self.batch_turnaround:
+                urgent.append(idx)
+            else:
+                rest.append(idx)
+        realtime_seconds = len(rest) / float(self.realtime_rate)
+        if len(rest) >= self.spill_threshold and \
+                realtime_seconds > self.batch_turnaround:
+            return urgent, rest
+        return urgent + rest, []
+
+
+def batch_prediction_row(row):
+    """Turns a row of a batch prediction's results into a prediction in the
+    form the Predict API returns.
+    """
+    scores = dict((name, float(value)) for name, value in row.items()
+                  if name not in ("tag", "bestAnswer", "trueLabel") and value)
+    if "bestAnswer" not in row:
+        return {"predictedValue": scores.get("score"),
+                "details": {"PredictiveModelType": "REGRESSION"}}
+    if list(scores) == ["score"]:
+        return {"predictedLabel": row["bestAnswer"],
+                "predictedScores": {row["bestAnswer"]: scores["score"]},
+                "details": {"PredictiveModelType": "BINARY"}}
+    return {"predictedLabel": row["bestAnswer"], "predictedScores": scores,
+            "details": {"PredictiveModelType": "MULTICLASS"}}
+
+
+class HybridRouter(object):
+
+    """Scores records with a model's realtime endpoint, a batch prediction,
+    or both, as the policy decides.
+    """
+
+    def __init__(self, ml_model_id, schema, staging_s3url, policy=None,
+                 threads=16):
+        self.ml_model_id = ml_model_id
+        self.schema = schema
+        self.staging_s3url = staging_s3url.rstrip("/")
+        self.policy = policy or RoutingPolicy()
+        self.threads = threads
+
+    def score(self, records, deadlines=None):
+        """Returns the predictions for a list of records, in order.
+        Predictions that failed are {"Error": message}.
+        """
+        if deadlines is None:
+            deadlines = [None] * len(records)
+        realtime_idxs, batch_idxs = self.policy.route(deadlines)
+        log("Scoring %d records in realtime and %d in a batch prediction" %
+            (len(realtime_idxs), len(batch_idxs)))
+        results = [None] * len(records)
+        pool = ThreadPool(self.threads)
+        try:
+            # The realtime predictions run while the batch prediction does.
+            realtime = pool.map_async(
+                self._predict, [records[idx] for idx in realtime_idxs],
+                chunksize=1)
+            if batch_idxs:
+                batch = self._batch_predict([records[idx]
+                                             for idx in batch_idxs])
+                for idx, prediction in zip(batch_idxs, batch):
+                    results[idx] = prediction
+            for idx, prediction in zip(realtime_idxs, realtime.get()):
+                results[idx] = prediction
+        finally:
+            pool.terminate()
+        return results
+
+    def _predict(self, record):
+        try:
+            result = awspyml.predict(self.ml_model_id, record)
+            result["Route"] = "realtime"
+        except Exception as e:
+            result = {"Error": str(e), "Route": "realtime"}
+        return result
+
+    def _batch_schema(self):
+        """Returns the schema of the batch file: the attributes of schema,
+        and a row id to match the results to the records.
+        """
+        schema = self.schema.copy()
+        idx = schema.num_attributes()
+        schema.set_variable_name(idx, ROW_ID)
+        schema.set_variable_type(idx, "CATEGORICAL")
+        schema.set_row_id(ROW_ID)
+        schema.set_header_line(True)
+        return schema
+
+    def _batch_predict(self, records):
+        schema = self._batch_schema()
+        names = [var["attributeName"] for var in schema.attributes()]
+        run_id = awspyml.Identifiers._new()
+        data_s3url = "%s/%s/records.csv" % (self.staging_s3url, run_id)
+        output_s3url = "%s/%s/output/" % (self.staging_s3url, run_id)
+
+        f = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+        try:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for row_id, record in enumerate(records):
+                record = dict(record, **{ROW_ID: str(row_id)})
+                writer.writerow([_csv_value(record.get(name, ""))
+                                 for name in names])
+            f.close()
+            data_size = os.path.getsize(f.name)
+            bucket, key = awspyml._parse_s3_url(data_s3url)
+            s3 = boto.connect_s3()
+            s3.get_bucket(bucket).new_key(key).set_contents_from_filename(
+                f.name)
+        finally:
+            os.unlink(f.name)
+        log("Uploaded %d records to %s" % (len(records), data_s3url))
+
+        ml = awspyml.aml_connection()
+        ds_id = awspyml.Identifiers.new_data_source_id()
+        ml.create_data_source_from_s3(
+            data_source_id=ds_id,
+            data_spec={"DataLocationS3": data_s3url,
+                       "DataSchema": schema.as_json_string()},
+            data_source_name="DS for routed batch prediction %s" % run_id,
+            compute_statistics=False)
+        bp_id = awspyml.Identifiers.new_batch_prediction_id()
+        ml.create_batch_prediction(
+            batch_prediction_id=bp_id, ml_model_id=self.ml_model_id,
+            batch_prediction_data_source_id=ds_id, output_uri=output_s3url,
+            batch_prediction_name="Routed batch prediction %s" % run_id)
+        log("Created Batch Prediction %s" % bp_id)
+        poll_until_completed(ml, bp_id, data_size)
+
+        results = [{"Error": "Missing from batch prediction results",
+                    "Route": "batch"} for record in records]
+        bucket, prefix = awspyml._parse_s3_url(
+            output_s3url + "batch-prediction/result/" + bp_id)
+        for key in s3.get_bucket(bucket).list(prefix=prefix):
+            if not key.name.endswith(".gz"):
+                continue
+            f = tempfile.NamedTemporaryFile(suffix=".gz", delete=False)
+            try:
+                key.get_contents_to_file(f)
+                f.close()
+                with gzip.open(f.name) as results_file:
+                    for row in csv.DictReader(results_file):
+                        row_id = int(row.pop("tag", row.pop(ROW_ID, -1)))
+                        if 0 <= row_id < len(results):
+                            prediction = batch_prediction_row(row)
+                            results[row_id] = {"Prediction": prediction,
+                                               "Route": "batch"}
+            finally:
+                f.close()
+                os.unlink(f.name)
+        return results
+
+
+def log(message):
+    # stdout has the predictions.
+    sys.stderr.write(message + "\n")
+
+
+def _csv_value(value):
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+
+def poll_until_completed(ml, bp_id, input_size=None):
+    def poll():
+        bp = ml.get_batch_prediction(bp_id)
+        now = str(datetime.datetime.now().time())
+        log("Batch Prediction %s is %s (%s) at %s" % (
+            bp_id, bp['Status'], bp.get('Message', ''), now))
+        return bp
+
+    # Polls around when past batch predictions of this size finished.
+    bp = awspyml.poll_until_terminal(poll, 'bp', input_size)
+    if bp['Status'] != 'COMPLETED':
+        raise RuntimeError("Batch Prediction %s is %s: %s" %
+                           (bp_id, bp['Status'], bp.get('Message', '')))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("ml_model_id")
+    parser.add_argument("records_fn")
+    parser.add_argument("schema_fn")
+    parser.add_argument("staging_s3url")
+    parser.add_argument("--deadline-field")
+    parser.add_argument("--spill-threshold", type=int, default=20000)
+    parser.add_argument("--batch-turnaround", type=float, default=1200)
+    parser.add_argument("--realtime-rate", type=float, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--output", default="-")
+    args = parser.parse_args()
+    if not args.staging_s3url.startswith("s3://"):
+        parser.error("The staging location must be an s3:// url")
+
+    with open(args.records_fn, "rb") as f:
+        records = list(awspyml.prediction_records(f))
+    deadlines = None
+    if args.deadline_field:
+        deadlines = []
+        for record in records:
+            deadline = record.pop(args.deadline_field, None)
+            deadlines.append(float(deadline) if deadline else None)
+
+    policy = RoutingPolicy(args.spill_threshold, args.batch_turnaround,
+                           args.realtime_rate)
+    schema = awspyml.Schema.read_from_file(args.schema_fn)
+    router = HybridRouter(args.ml_model_id, schema, args.staging_s3url,
+                          policy, args.threads)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    for prediction in router.score(records, deadlines):
+        output.write(json.dumps(prediction) + "\n")
+    output.flush()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Simulates a day of realtime prediction traffic against a fake service, in
+simulated time, to show what awspyml.EndpointManager does: when endpoints
+are created and deleted, how long predictions wait for them, and how many
+endpoint-hours are paid for compared with leaving every endpoint running.
+
+Model ml-scheduled gets a burst of traffic every 6 hours, which is
+scheduled ahead so its endpoint is warmed up in time.  Model ml-adhoc gets
+a burst at random times, so its first predictions wait for the endpoint.
+With --min-rate, endpoints are deleted as soon as their traffic over the
+last 5 minutes falls below that many predictions per second, instead of
+after --idle-seconds without any.
+
+Usage:
+    python simulate_endpoints.py [--creation-seconds 300]
+        [--idle-seconds 1800] [--min-rate 0] [--seed 0]
+"""
+import argparse
+import random
+import awspyml
+
+
+class SimulatedClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("--creation-seconds", type=float, default=300)
+    parser.add_argument("--idle-seconds", type=float, default=1800)
+    parser.add_argument("--min-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    clock = SimulatedClock()
+    service = awspyml.FakeMLService(args.creation_seconds, clock.time)
+    manager = awspyml.EndpointManager(service, args.idle_seconds,
+                                      min_rate=args.min_rate,
+                                      clock=clock.time, sleep=clock.sleep)
+    day = 24 * 3600
+    bursts = [(hour * 3600, "ml-scheduled") for hour in range(1, 24, 6)]
+    bursts += [(random.uniform(0, day - 3600), "ml-adhoc") for i in range(4)]
+    bursts.sort()
+    for start, model_id in bursts:
+        if model_id == "ml-scheduled":
+            manager.schedule(model_id, start)
+
+    endpoint_seconds = 0
+    waits = []
+    next_burst = 0
+    while clock.now < day:
+        for action, model_id in manager.tick():
+            print("%6.2fh  %s endpoint of %s" % (clock.now / 3600, action,
+                                                 model_id))
+        while next_burst < len(bursts) and bursts[next_burst][0] <= clock.now:
+            model_id = bursts[next_burst][1]
+            started = clock.now
+            manager.predict(model_id, {"x": "1"})
+            waits.append((model_id, clock.now - started))
+            print("%6.2fh  burst for %s waited %ds for its endpoint" %
+                  (started / 3600, model_id, clock.now - started))
+            # The rest of the burst: 10 minutes of predictions.
+            for i in range(600):
+                manager.predict(model_id, {"x": str(i)})
+                clock.sleep(1)
+            next_burst += 1
+        before = clock.now
+        clock.sleep(60)
+        for model_id in ("ml-scheduled", "ml-adhoc"):
+            if service._info(model_id)["EndpointStatus"] != "NONE":
+                endpoint_seconds += clock.now - before
+
+    print("Endpoint-hours: %.1f (%.1f if both ran all day)" %
+          (endpoint_seconds / 3600, 2 * day / 3600))
+    print("Service calls: %s" % dict(service.calls))
@@ -0,0 +1,277 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+# async_predict.py needs Python 3.7, unlike the rest of the tools, so these
+# tests are skipped under Python 2.  Run them with:
+#     python3 -m unittest discover -s tests -p test_async_predict.py
+# They are written without async syntax, so Python 2 can still load them.
+import datetime
+import io
+import json
+import sys
+import threading
+import time
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+if sys.version_info >= (3, 7):
+    import asyncio
+    import async_predict
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["content-length"]))
+        action = self.headers["x-amz-target"].split(".")[-1]
+        with self.server.lock:
+            self.server.calls.append(action)
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight,
+                                            self.server.in_flight)
+        try:
+            status, obj, style = self.server.respond(
+                action, json.loads(body.decode("utf-8")))
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+        out = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        if style == "chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in (out[:5], out[5:]):
+                self.wfile.write(b"%x\r\n" % len(part) + part + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        elif style == "close":
+            # No length, so the body runs to the end of the connection.
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(out)
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeService(ThreadingMixIn, HTTPServer):
+
+    """Answers GetMLModel and Predict, as respond() says to.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server_address[1]
+        self.lock = threading.Lock()
+        self.calls = []
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0
+        self.predict_responses = []  # Before answering normally
+
+    def handle_error(self, request, client_address):
+        pass  # Clients that time out close their connections.
+
+    def respond(self, action, params):
+        if action == "GetMLModel":
+            time.sleep(0.05)
+            return 200, {"EndpointInfo": {"EndpointUrl": self.url}}, None
+        with self.lock:
+            response = self.predict_responses.pop(0) \
+                if self.predict_responses else None
+        time.sleep(self.delay)
+        if response is not None:
+            return response
+        label = params["Record"].get("x", "")
+        return 200, {"Prediction": {"predictedLabel": label}}, None
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "needs Python 3.7")
+class AsyncPredictClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeService()
+        self.thread = threading.Thread(target=self.service.serve_forever,
+                                       args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # Cleanups, so clients added by the tests are closed first.
+        self.addCleanup(self.close)
+
+    def close(self):
+        self.service.shutdown()
+        self.service.server_close()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def client(self, **kwargs):
+        client = async_predict.AsyncPredictClient(
+            "ml-a", credentials=("key", "secret", None),
+            service_url=self.service.url, **kwargs)
+        self.addCleanup(lambda: self.loop.run_until_complete(client.close()))
+        return client
+
+    def run_all(self, coroutines):
+        return self.loop.run_until_complete(
+            asyncio.gather(*coroutines, return_exceptions=True))
+
+    def test_predict(self):
+        client = self.client(max_connections=4)
+        results = self.run_all([client.predict({"x": str(i)})
+                                for i in range(50)])
+        self.assertEqual(results, [{"predictedLabel": str(i)}
+                                   for i in range(50)])
+        # One lookup, shared by the predictions waiting for it.
+        self.assertEqual(self.service.calls.count("GetMLModel"), 1)
+        # Connections are kept alive and reused.
+        self.assertLessEqual(self.service.connections, 5)
+
+    def test_max_in_flight(self):
+        self.service.delay = 0.01
+        client = self.client(max_in_flight=3)
+        self.run_all([client.predict({"x": "1"}) for i in range(20)])
+        self.assertEqual(self.service.max_in_flight, 3)
+
+    def test_retries(self):
+        self.service.predict_responses = [
+            (500, {"__type": "InternalServerException"}, None),
+            (400, {"__type": "com.amazonaws#ThrottlingException",
+                   "message": "Slow down"}, None),
+        ]
+        client = self.client()
+        result = self.loop.run_until_complete(client.predict({"x": "1"}))
+        self.assertEqual(result, {"predictedLabel": "1"})
+        self.assertEqual(client.num_retries, 2)
+
+    def test_errors_that_retrying_wont_fix(self):
+        self.service.predict_responses = [
+            (400, {"__type": "ValidationException",
+                   "message": "Bad record"}, None)]
+        client = self.client()
+        with self.assertRaises(async_predict.PredictError) as raised:
+            self.loop.run_until_complete(client.predict({"x": "1"}))
+        self.assertEqual(raised.exception.status, 400)
+        self.assertEqual(raised.exception.error_type, "ValidationException")
+        self.assertEqual(client.num_retries, 0)
+
+    def test_retries_run_out(self):
+        self.service.predict_responses = [
+            (503, {}, None) for i in range(3)]
+        client = self.client(retries=2)
+        with self.assertRaises(async_predict.PredictError):
+            self.loop.run_until_complete(client.predict({"x": "1"}))
+        self.assertEqual(client.num_retries, 2)
+
+    def test_timeout(self):
+        self.service.delay = 0.3
+        client = self.client(timeout=0.1, retries=1)
+        with self.assertRaises(async_predict.PredictError) as raised:
+            self.loop.run_until_complete(client.predict({"x": "1"}))
+        self.assertEqual(raised.exception.error_type, "TimeoutError")
+
+    def test_response_framing(self):
+        self.service.predict_responses = [
+            (200, {"Prediction": {"predictedLabel": "chunked"}}, "chunked"),
+            (200, {"Prediction": {"predictedLabel": "close"}}, "close"),
+        ]
+        client = self.client(max_connections=1)
+        results = [self.loop.run_until_complete(client.predict({"x": "1"}))
+                   for i in range(3)]
+        self.assertEqual([result["predictedLabel"] for result in results],
+                         ["chunked", "close", "1"])
+        self.assertEqual(self.service.connections, 2)
+
+    def test_no_endpoint(self):
+        responses = [(200, {"EndpointInfo": {}}, None)]
+        respond = self.service.respond
+
+        def no_endpoint_once(action, params):
+            if action == "GetMLModel" and responses:
+                return responses.pop()
+            return respond(action, params)
+
+        self.service.respond = no_endpoint_once
+        client = self.client()
+        with self.assertRaises(async_predict.PredictError) as raised:
+            self.loop.run_until_complete(client.predict({"x": "1"}))
+        self.assertEqual(raised.exception.error_type, "NoEndpoint")
+        # The failed lookup isn't remembered.
+        self.assertEqual(
+            self.loop.run_until_complete(client.predict({"x": "1"})),
+            {"predictedLabel": "1"})
+
+    def test_score_file(self):
+        self.service.predict_responses = [
+            (400, {"__type": "ValidationException"}, None)]
+        client = self.client(max_in_flight=2)
+        records = io.StringIO(u'{"x": "a"}\n\n{"x": "b", "y": null}\n'
+                              u'{"x": "c", "z": 3}\n')
+        out = io.StringIO()
+        latencies = self.loop.run_until_complete(
+            async_predict.score_file(client, records, out))
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(latencies), 3)
+        self.assertIn("Error", lines[0])
+        self.assertEqual(lines[1:], [{"predictedLabel": "b"},
+                                     {"predictedLabel": "c"}])
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "needs Python 3.7")
+class SignedHeadersTest(unittest.TestCase):
+
+    def test_signed_headers(self):
+        headers = async_predict.signed_headers(
+            "machinelearning.us-east-1.amazonaws.com",
+            "AmazonML_20141212.Predict", b"{}", ("key", "secret", "token"),
+            "us-east-1", now=datetime.datetime(2015, 4, 9, 12, 30))
+        self.assertEqual(headers["x-amz-date"], "20150409T123000Z")
+        self.assertEqual(headers["content-length"], "2")
+        self.assertTrue(headers["authorization"].startswith(
+            "AWS4-HMAC-SHA256 Credential=key/20150409/us-east-1/"
+            "machinelearning/aws4_request, SignedHeaders=content-type;host;"
+            "x-amz-date;x-amz-security-token;x-amz-target, Signature="))
+        again = async_predict.signed_headers(
+            "machinelearning.us-east-1.amazonaws.com",
+            "AmazonML_20141212.Predict", b"{}", ("key", "secret", "token"),
+            "us-east-1", now=datetime.datetime(2015, 4, 9, 12, 30))
+        self.assertEqual(again, headers)
+        other = async_predict.signed_headers(
+            "machinelearning.us-east-1.amazonaws.com",
+            "AmazonML_20141212.Predict", b"{ }", ("key", "secret", "token"),
+            "us-east-1", now=datetime.datetime(2015, 4, 9, 12, 30))
+        self.assertNotEqual(other["authorization"], headers["authorization"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import io
+import json
+import random
+import threading
+import time
+import unittest
+
+import awspyml
+import realtime
+
+from test_recipe import make_schema
+
+
+class SlowService(awspyml.FakeMLService):
+
+    """A FakeMLService whose every connection is the same object, and
+    whose predictions take a few random milliseconds, and fail for
+    records with a "fail" attribute.
+    """
+
+    def __init__(self, max_delay_ms=3):
+        super(SlowService, self).__init__(creation_seconds=0)
+        self.max_delay_ms = max_delay_ms
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def describe_ml_models(self, limit=None):
+        return {'Results': []}
+
+    def predict(self, ml_model_id, record, predict_endpoint):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(random.uniform(0, self.max_delay_ms) / 1000.0)
+            if 'fail' in record:
+                raise awspyml.AWSPyMLException('Bad record')
+            return super(SlowService, self).predict(
+                ml_model_id, record, predict_endpoint)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class ServiceTestCase(unittest.TestCase):
+
+    """Connects every aml_connection to self.service, which has a READY
+    endpoint for ml-a.
+    """
+
+    def setUp(self):
+        random.seed(0)
+        self.service = SlowService()
+        self.service.create_realtime_endpoint('ml-a')
+        self.connect = awspyml.boto.connect_machinelearning
+        awspyml.boto.connect_machinelearning = \
+            lambda **kwargs: self.service
+        self.reset()
+
+    def tearDown(self):
+        awspyml.boto.connect_machinelearning = self.connect
+        self.reset()
+
+    def reset(self):
+        awspyml._connections.__dict__.clear()
+        awspyml._validated_hosts.clear()
+        awspyml.endpoint_cache.invalidate()
+
+    def expected(self, record, ml_model_id='ml-a'):
+        return awspyml.FakeMLService.predict(self.service, ml_model_id,
+                                             record, None)
+
+
+class BulkPredictTest(ServiceTestCase):
+
+    def test_predictions_are_in_order(self):
+        records = [{'x': str(i)} for i in xrange(200)]
+        output = io.BytesIO()
+        latencies, errors = realtime.bulk_predict('ml-a', iter(records),
+                                                  output, threads=8)
+        lines = output.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [self.expected(record) for record in records])
+        self.assertEqual(len(latencies), 200)
+        self.assertEqual(errors, 0)
+        self.assertGreater(self.service.max_in_flight, 1)
+        self.assertLessEqual(self.service.max_in_flight, 8)
+
+    def test_errors(self):
+        records = [{'x': '1'}, {'fail': '1'}, {'x': '2'}]
+        output = io.BytesIO()
+        latencies, errors = realtime.bulk_predict('ml-a', records, output)
+        results = [json.loads(line)
+                   for line in output.getvalue().splitlines()]
+        self.assertEqual(errors, 1)
+        self.assertEqual(results[1], {'Error': 'Bad record'})
+        self.assertEqual(results[2], self.expected({'x': '2'}))
+
+    def test_no_endpoint(self):
+        self.assertRaises(RuntimeError, realtime.bulk_predict, 'ml-b',
+                          [{'x': '1'}], io.BytesIO())
+
+    def test_records_are_read_a_few_at_a_time(self):
+        read = [0]
+
+        def records():
+            for i in xrange(300):
+                read[0] += 1
+                yield {'x': str(i)}
+
+        class Output(object):
+            def __init__(self):
+                self.lines = 0
+                self.max_ahead = 0
+
+            def write(self, line):
+                self.lines += 1
+                self.max_ahead = max(self.max_ahead, read[0] - self.lines)
+
+        output = Output()
+        realtime.bulk_predict('ml-a', records(), output, threads=4)
+        self.assertEqual(output.lines, 300)
+        # Four per thread, and one waiting for a slot.
+        self.assertLessEqual(output.max_ahead, 4 * 4 + 1)
+
+    def test_cache(self):
+        records = [{'x': str(i % 10)} for i in xrange(100)]
+        cache = awspyml.PredictionCache(60)
+        output = io.BytesIO()
+        realtime.bulk_predict('ml-a', records, output, threads=4,
+                              cache=cache)
+        self.assertEqual(self.service.calls['predict'], 10)
+        self.assertEqual([json.loads(line)
+                          for line in output.getvalue().splitlines()],
+                         [self.expected(record) for record in records])
+
+
+class PredictionRecordsTest(unittest.TestCase):
+
+    def records(self, text, data_format='jsonl', schema=None):
+        return list(awspyml.prediction_records(io.BytesIO(text),
+                                               data_format, schema))
+
+    def test_json_lines(self):
+        self.assertEqual(
+            self.records('{"a": 1, "b": "", "c": [1, 2], "d": null}\n\n'
+                         '{"a": 2.5, "e": true}\n'),
+            [{'a': '1', 'c': '1 2'}, {'a': '2.5', 'e': 'True'}])
+        self.assertRaisesRegexp(awspyml.AWSPyMLException, 'Line 2',
+                                self.records, '{"a": 1}\n[1]\n')
+
+    def test_csv(self):
+        self.assertEqual(self.records('a,b\n1,\n\n2,x\n', 'csv'),
+                         [{'a': '1'}, {'a': '2', 'b': 'x'}])
+        schema = make_schema()
+        self.assertEqual(
+            self.records('id,amount,kind,text,flag,y\nr1,1,a,,yes,\n',
+                         'csv', schema),
+            [{'id': 'r1', 'amount': '1', 'kind': 'a', 'flag': 'yes'}])
+        schema.set_header_line(False)
+        self.assertEqual(self.records('r1,2\n', 'csv', schema),
+                         [{'id': 'r1', 'amount': '2'}])
+
+    def test_unknown_format(self):
+        self.assertRaises(awspyml.AWSPyMLException, self.records, '', 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
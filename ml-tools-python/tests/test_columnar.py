@@ -0,0 +1,171 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import csv
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import awspyml
+
+from test_recipe import make_schema
+
+
+def write_rows(filename, rows):
+    f = open(filename, 'wb')
+    writer = csv.writer(f)
+    writer.writerow(['id', 'amount', 'kind', 'text', 'flag', 'y'])
+    writer.writerows(rows)
+    f.close()
+
+
+class ColumnarDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data.csv')
+        self.schema = make_schema()
+        self.rows = [['r%d' % i, '' if i % 7 == 0 else str(i * 0.5),
+                      'k%d' % (i % 11) if i % 5 else '', 'word %d' % i,
+                      ['yes', 'no', ''][i % 3], str(i % 2)]
+                     for i in xrange(300)]
+        write_rows(self.filename, self.rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameDataset(self, a, b):
+        self.assertEqual(a.names, b.names)
+        self.assertEqual(a.num_records, b.num_records)
+        for name in a.names:
+            self.assertEqual(a.columns[name].dtype, b.columns[name].dtype)
+        for x, y in zip(a.column_blocks(), b.column_blocks()):
+            for name in a.names:
+                numpy.testing.assert_array_equal(x[name], y[name])
+
+    def test_types(self):
+        dataset = awspyml.ColumnarDataset.from_csv(self.filename,
+                                                   self.schema)
+        self.assertEqual(dataset.num_records, 300)
+        self.assertEqual(dataset.columns['amount'].dtype, numpy.float64)
+        self.assertTrue(math.isnan(dataset.columns['amount'][0]))
+        self.assertEqual(dataset.columns['amount'][3], 1.5)
+        self.assertEqual(dataset.columns['kind'].dtype, numpy.int32)
+        self.assertEqual(dataset.columns['kind'][0], -1)
+        self.assertEqual(dataset.categories('kind')[:3].tolist(),
+                         ['', 'k1', 'k2'])
+        # The vocabulary is shared by all CATEGORICAL attributes.
+        self.assertEqual(dataset.categories('id')[2], 'r2')
+        self.assertEqual(dataset.columns['flag'][:3].tolist(),
+                         [True, False, False])
+        self.assertEqual(dataset.missing['flag'][:3].tolist(),
+                         [False, False, True])
+        self.assertEqual(dataset.columns['text'][5], 'word 5')
+
+    def test_column_blocks_match_csv(self):
+        dataset = awspyml.ColumnarDataset.from_csv(self.filename,
+                                                   self.schema)
+        blocks = list(dataset.column_blocks(block_size=100))
+        self.assertEqual(len(blocks), 3)
+        expected = list(awspyml.csv_column_blocks(self.filename,
+                                                  self.schema,
+                                                  block_size=100))
+        for block, csv_block in zip(blocks, expected):
+            for name in dataset.names:
+                numpy.testing.assert_array_equal(block[name],
+                                                 csv_block[name])
+        block = next(dataset.column_blocks(first=250, last=400))
+        self.assertEqual(block['id'].tolist(),
+                         ['r%d' % i for i in xrange(250, 300)])
+
+    def test_byte_ranges_give_the_same_dataset(self):
+        whole = awspyml.ColumnarDataset.from_csv(self.filename, self.schema)
+        for processes in [1, 2]:
+            split = awspyml.ColumnarDataset.from_csv(
+                self.filename, self.schema, processes=processes,
+                bytes_per_task=1000)
+            self.assertSameDataset(split, whole)
+
+    def test_directory_of_shards(self):
+        os.remove(self.filename)
+        write_rows(os.path.join(self.directory, 'part-0'), self.rows[:120])
+        write_rows(os.path.join(self.directory, 'part-1'), self.rows[120:])
+        sharded = awspyml.ColumnarDataset.from_csv(self.directory,
+                                                   self.schema)
+        write_rows(self.filename, self.rows)
+        self.assertSameDataset(
+            sharded, awspyml.ColumnarDataset.from_csv(self.filename,
+                                                      self.schema))
+
+
+class ColumnarCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = awspyml.ColumnarCache(
+            os.path.join(self.directory, 'cache'))
+        self.filename = os.path.join(self.directory, 'data.csv')
+        self.schema = make_schema()
+        write_rows(self.filename, [['r%d' % i, str(i), 'k%d' % (i % 3),
+                                    'w', 'yes', '1'] for i in xrange(100)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self):
+        return awspyml.ColumnarDataset.from_csv(self.filename, self.schema,
+                                                cache=self.cache)
+
+    def test_cached_dataset_is_memory_mapped(self):
+        loaded = self.load()
+        self.assertNotIsInstance(loaded.columns['amount'], numpy.memmap)
+        cached = self.load()
+        self.assertIsInstance(cached.columns['amount'], numpy.memmap)
+        for name in loaded.names:
+            numpy.testing.assert_array_equal(cached.columns[name],
+                                             loaded.columns[name])
+        numpy.testing.assert_array_equal(cached.missing['flag'],
+                                         loaded.missing['flag'])
+        self.assertEqual(cached.categories('kind').tolist(),
+                         loaded.categories('kind').tolist())
+
+    def test_changed_file_or_schema_is_loaded_again(self):
+        self.load()
+        write_rows(self.filename, [['r', '1', 'a', 'w', 'no', '0']])
+        dataset = self.load()
+        self.assertNotIsInstance(dataset.columns['amount'], numpy.memmap)
+        self.assertEqual(dataset.num_records, 1)
+        self.schema.set_variable_type(1, 'CATEGORICAL')
+        dataset = self.load()
+        self.assertNotIsInstance(dataset.columns['amount'], numpy.memmap)
+        self.assertEqual(dataset.categories('amount').tolist(), ['1'])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.load()
+        entry, = os.listdir(self.cache.directory)
+        path = os.path.join(self.cache.directory, entry)
+        size = sum(os.path.getsize(os.path.join(path, part))
+                   for part in os.listdir(path))
+        self.cache.max_bytes = int(size * 1.5)
+        self.schema.set_variable_type(1, 'CATEGORICAL')
+        self.load()
+        entries = os.listdir(self.cache.directory)
+        self.assertEqual(len(entries), 1)
+        self.assertNotEqual(entries[0], entry)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import os
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+
+def make_schema(header_line=True):
+    schema = awspyml.Schema()
+    for idx, (name, attribute_type) in enumerate([
+            ('amount', 'NUMERIC'), ('kind', 'CATEGORICAL'),
+            ('y', 'BINARY')]):
+        schema.set_variable_name(idx, name)
+        schema.set_variable_type(idx, attribute_type)
+    schema.set_target('y')
+    schema.set_header_line(header_line)
+    return schema
+
+
+class DataValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, lines, filename=None):
+        f = open(filename or self.filename, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+
+    def errors(self, report):
+        return dict((kind, (count, lines))
+                    for kind, (count, lines) in report.errors.items())
+
+    def test_valid_file(self):
+        self.write(['amount,kind,y', '1.5,a,1', ',b,no', '', '-2e3,,True'])
+        report = awspyml.DataValidator(make_schema()).validate_file(
+            self.filename)
+        self.assertTrue(report.is_valid())
+        self.assertEqual(report.as_obj()['numRecords'], 3)
+
+    def test_errors(self):
+        self.write(['amount,kind', '1,a,1', 'x,b,0', '2,c', '3,d,maybe',
+                    '4,e,', '5,"two\nlines",1', 'y,f,1'])
+        report = awspyml.DataValidator(make_schema()).validate_file(
+            self.filename)
+        self.assertFalse(report.is_valid())
+        self.assertEqual(self.errors(report), {
+            'headerMismatch': (1, [1]),
+            'notNumeric': (2, [3, 9]),
+            'wrongColumnCount': (1, [4]),
+            'notBinary': (1, [5]),
+            'missingTarget': (1, [6]),
+        })
+        self.assertEqual(report.as_obj()['errors']['notNumeric'],
+                         {'count': 2, 'sampleLines': [3, 9]})
+
+    def test_samples_are_limited(self):
+        self.write(['amount,kind,y'] + ['x,a,1'] * 20)
+        report = awspyml.DataValidator(make_schema(),
+                                       max_samples=3).validate_file(
+            self.filename)
+        self.assertEqual(self.errors(report),
+                         {'notNumeric': (20, [2, 3, 4])})
+
+    def test_byte_ranges_give_the_same_report(self):
+        lines = ['amount,kind,y']
+        for i in xrange(500):
+            lines.append('%s,k%d,%s' % ('x' if i % 37 == 0 else i, i % 3,
+                                        'maybe' if i % 101 == 0 else 1))
+        self.write(lines)
+        validator = awspyml.DataValidator(make_schema(), max_samples=100)
+        whole = validator.validate_file(self.filename)
+        for processes in [1, 2]:
+            split = validator.validate_file(self.filename,
+                                            processes=processes,
+                                            bytes_per_task=300)
+            self.assertEqual(split.as_obj(), whole.as_obj())
+        self.assertEqual(whole.errors['notNumeric'][1][:3], [2, 39, 76])
+
+    def test_directory_of_shards(self):
+        self.write(['amount,kind,y', '1,a,1', 'x,b,1'],
+                   os.path.join(self.directory, 'part-0'))
+        self.write(['amount,kind,y', 'x,a,1'],
+                   os.path.join(self.directory, 'part-1'))
+        report = awspyml.DataValidator(make_schema()).validate_file(
+            self.directory)
+        self.assertEqual(self.errors(report),
+                         {'notNumeric': (2, ['part-0:3', 'part-1:2'])})
+        self.assertEqual(report.as_obj()['numRecords'], 3)
+
+    def test_no_header_line(self):
+        self.write(['1,a,1', 'x,b,0'])
+        report = awspyml.DataValidator(
+            make_schema(header_line=False)).validate_file(self.filename)
+        self.assertEqual(self.errors(report), {'notNumeric': (1, [2])})
+
+
+if __name__ == '__main__':
+    unittest.main()
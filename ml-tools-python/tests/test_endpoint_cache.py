@@ -0,0 +1,171 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import threading
+import time
+import unittest
+
+import awspyml
+
+
+class FakeConnection(object):
+
+    """What aml_connection gets from boto.connect_machinelearning.
+    """
+
+    def __init__(self, host=None, port=None, is_secure=True, fail=False):
+        self.host = host
+        self.fail = fail
+        self.describe_calls = 0
+
+    def describe_ml_models(self, limit=None):
+        self.describe_calls += 1
+        if self.fail:
+            raise IOError('No credentials')
+        return {'Results': []}
+
+
+class AmlConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connections = []
+        self.fail = False
+        self.connect = awspyml.boto.connect_machinelearning
+        awspyml.boto.connect_machinelearning = self.fake_connect
+        self.reset()
+
+    def tearDown(self):
+        awspyml.boto.connect_machinelearning = self.connect
+        self.reset()
+
+    def reset(self):
+        awspyml._connections.__dict__.clear()
+        awspyml._validated_hosts.clear()
+
+    def fake_connect(self, **kwargs):
+        connection = FakeConnection(fail=self.fail, **kwargs)
+        self.connections.append(connection)
+        return connection
+
+    def connect_in_thread(self, **kwargs):
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(awspyml.aml_connection(**kwargs)))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_connection_per_thread_and_host(self):
+        ml = awspyml.aml_connection()
+        self.assertIs(awspyml.aml_connection(), ml)
+        local = awspyml.aml_connection(host='localhost', port=8080,
+                                       is_secure=False)
+        self.assertIsNot(local, ml)
+        self.assertEqual(local.host, 'localhost')
+        other = self.connect_in_thread()
+        self.assertIsNot(other, ml)
+        self.assertEqual(len(self.connections), 3)
+
+    def test_credentials_are_checked_once_per_host(self):
+        awspyml.aml_connection()
+        self.connect_in_thread()
+        awspyml.aml_connection(host='localhost')
+        self.assertEqual([ml.describe_calls for ml in self.connections],
+                         [1, 0, 1])
+
+    def test_bad_credentials(self):
+        self.fail = True
+        self.assertRaises(RuntimeError, awspyml.aml_connection)
+        # Not remembered, so the next call checks again.
+        self.fail = False
+        awspyml.aml_connection()
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(self.connections[1].describe_calls, 1)
+
+
+class EndpointCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = time.time()
+        self.service = awspyml.FakeMLService(10, lambda: self.clock)
+        awspyml.endpoint_cache.invalidate()
+
+    def tearDown(self):
+        awspyml.endpoint_cache.invalidate()
+
+    def test_ready_endpoints_are_cached(self):
+        cache = awspyml.EndpointCache(ttl=0.05)
+        self.service.create_realtime_endpoint('ml-a')
+        self.clock += 10
+        url = cache.endpoint_url('ml-a', self.service)
+        self.assertEqual(url, 'https://realtime.example.com/ml-a')
+        self.assertEqual(cache.endpoint_url('ml-a', self.service), url)
+        self.assertEqual(self.service.calls['get_ml_model'], 1)
+        time.sleep(0.06)
+        cache.endpoint_url('ml-a', self.service)
+        self.assertEqual(self.service.calls['get_ml_model'], 2)
+
+    def test_other_endpoints_are_not_cached(self):
+        cache = awspyml.EndpointCache()
+        self.assertEqual(cache.endpoint_url('ml-a', self.service), '')
+        self.service.create_realtime_endpoint('ml-a')
+        self.assertEqual(cache.endpoint_url('ml-a', self.service),
+                         'https://realtime.example.com/ml-a')
+        self.assertEqual(cache.endpoint_url('ml-a', self.service,
+                                            ready_only=True), '')
+        self.assertEqual(self.service.calls['get_ml_model'], 3)
+        self.clock += 10
+        cache.endpoint_url('ml-a', self.service, ready_only=True)
+        cache.endpoint_url('ml-a', self.service, ready_only=True)
+        self.assertEqual(self.service.calls['get_ml_model'], 4)
+
+    def test_invalidate(self):
+        cache = awspyml.EndpointCache()
+        for ml_model_id in ['ml-a', 'ml-b', 'ml-c']:
+            self.service.create_realtime_endpoint(ml_model_id)
+        self.clock += 10
+        for ml_model_id in ['ml-a', 'ml-b', 'ml-c']:
+            cache.endpoint_url(ml_model_id, self.service)
+        cache.invalidate('ml-a')
+        for ml_model_id in ['ml-a', 'ml-b']:
+            cache.endpoint_url(ml_model_id, self.service)
+        self.assertEqual(self.service.calls['get_ml_model'], 4)
+        cache.invalidate()
+        for ml_model_id in ['ml-b', 'ml-c']:
+            cache.endpoint_url(ml_model_id, self.service)
+        self.assertEqual(self.service.calls['get_ml_model'], 6)
+
+    def test_predict_uses_the_cache(self):
+        self.service.create_realtime_endpoint('ml-a')
+        self.clock += 10
+        for i in xrange(3):
+            prediction = awspyml.predict('ml-a', {'x': str(i)}, self.service)
+            self.assertIn('predictedLabel', prediction['Prediction'])
+        self.assertEqual(self.service.calls['get_ml_model'], 1)
+        self.assertEqual(self.service.calls['predict'], 3)
+
+    def test_failed_predict_invalidates(self):
+        self.service.create_realtime_endpoint('ml-a')
+        self.clock += 10
+        awspyml.predict('ml-a', {'x': '1'}, self.service)
+        self.service.delete_realtime_endpoint('ml-a')
+        self.assertRaises(awspyml.AWSPyMLException, awspyml.predict,
+                          'ml-a', {'x': '1'}, self.service)
+        self.assertRaisesRegexp(awspyml.AWSPyMLException,
+                                'has no realtime endpoint', awspyml.predict,
+                                'ml-a', {'x': '1'}, self.service)
+        self.assertEqual(self.service.calls['get_ml_model'], 2)
+        self.assertEqual(self.service.calls['predict'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import random
+import unittest
+
+import awspyml
+
+
+class SimulatedClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class EndpointManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        awspyml.endpoint_cache.invalidate()
+        self.clock = SimulatedClock()
+        self.service = awspyml.FakeMLService(300, self.clock.time)
+        self.manager = self.make_manager()
+
+    def tearDown(self):
+        awspyml.endpoint_cache.invalidate()
+
+    def make_manager(self, **kwargs):
+        return awspyml.EndpointManager(self.service, idle_seconds=1800,
+                                       clock=self.clock.time,
+                                       sleep=self.clock.sleep, **kwargs)
+
+    def status(self, ml_model_id):
+        return self.service._info(ml_model_id)['EndpointStatus']
+
+    def test_creates_on_demand(self):
+        prediction = self.manager.predict('ml-a', {'x': '1'})
+        self.assertIn('predictedLabel', prediction['Prediction'])
+        self.assertEqual(self.status('ml-a'), 'READY')
+        self.assertEqual(self.service.calls['create_realtime_endpoint'], 1)
+        # Waited for the endpoint, but not much longer.
+        waited = self.clock.now - 1000
+        self.assertGreaterEqual(waited, 300)
+        self.assertLess(waited, 360)
+        self.assertGreaterEqual(self.manager.warmup_seconds, 300)
+
+    def test_reuses_ready_endpoint(self):
+        self.manager.predict('ml-a', {'x': '1'})
+        created_at = self.clock.now
+        for i in range(10):
+            self.manager.predict('ml-a', {'x': str(i)})
+        self.assertEqual(self.clock.now, created_at)
+        self.assertEqual(self.service.calls['create_realtime_endpoint'], 1)
+        self.assertEqual(self.manager.request_rate('ml-a'), 11 / 300.0)
+
+    def test_waits_for_endpoint_created_elsewhere(self):
+        self.service.create_realtime_endpoint('ml-a')
+        self.manager.predict('ml-a', {'x': '1'})
+        self.assertGreaterEqual(self.clock.now - 1000, 300)
+        self.assertEqual(self.service.calls['create_realtime_endpoint'], 1)
+
+    def test_deletes_idle_endpoints(self):
+        self.manager.predict('ml-b', {'x': '1'})
+        self.manager.predict('ml-a', {'x': '1'})
+        self.clock.sleep(1000)
+        self.manager.predict('ml-b', {'x': '1'})
+        self.assertEqual(self.manager.tick(), [])
+        self.clock.sleep(1000)
+        self.assertEqual(self.manager.tick(), [('delete', 'ml-a')])
+        self.assertEqual(self.status('ml-a'), 'NONE')
+        self.assertEqual(self.status('ml-b'), 'READY')
+        # Used again, so created again.
+        self.manager.predict('ml-a', {'x': '1'})
+        self.assertEqual(self.service.calls['create_realtime_endpoint'], 3)
+
+    def test_deletes_endpoints_below_min_rate(self):
+        manager = self.make_manager(min_rate=0.5)
+        manager.predict('ml-a', {'x': '1'})
+        for i in range(300):
+            manager.predict('ml-a', {'x': str(i)})
+            self.clock.sleep(1)
+        self.assertEqual(manager.tick(), [])
+        self.clock.sleep(200)
+        self.assertEqual(manager.tick(), [('delete', 'ml-a')])
+
+    def test_warms_up_scheduled_endpoints(self):
+        start = self.clock.now + 3600
+        self.manager.schedule('ml-a', start)
+        self.assertEqual(self.manager.tick(), [])
+        self.clock.now = start - 300
+        self.assertEqual(self.manager.tick(), [('create', 'ml-a')])
+        self.clock.now = start
+        self.manager.predict('ml-a', {'x': '1'})
+        self.assertEqual(self.clock.now, start)
+
+    def test_recreates_failed_endpoints(self):
+        self.service.failed_creations = 1
+        self.manager.predict('ml-a', {'x': '1'})
+        self.assertEqual(self.status('ml-a'), 'READY')
+        self.assertEqual(self.service.calls['create_realtime_endpoint'], 2)
+        self.assertGreaterEqual(self.clock.now - 1000, 600)
+
+    def test_gives_up_after_timeout(self):
+        self.service.failed_creations = 100
+        self.assertRaises(awspyml.AWSPyMLException,
+                          self.manager.ensure_endpoint, 'ml-a', 1200)
+        self.assertLessEqual(self.clock.now - 1000, 1200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import collections
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+import awspyml
+import wait_for_entity
+
+from test_endpoint_manager import SimulatedClock
+
+
+class FakeEntityService(object):
+
+    """Answers the get and describe calls of wait_for_entity.ENTITY_TYPES
+    from a dict of entity id -> description, and counts them.
+    """
+
+    def __init__(self):
+        self.entities = {}
+        self.calls = collections.Counter()
+        for entity_type_str, (id_key, get_method, describe_method) in \
+                wait_for_entity.ENTITY_TYPES.items():
+            setattr(self, get_method, self._getter(get_method))
+            setattr(self, describe_method,
+                    self._describer(describe_method, entity_type_str))
+
+    def add(self, entity_id, status, name=''):
+        id_key = wait_for_entity.ENTITY_TYPES[entity_id[:2]][0]
+        self.entities[entity_id] = {id_key: entity_id, 'Status': status,
+                                    'Name': name}
+
+    def _getter(self, method):
+        def get(entity_id):
+            self.calls[method] += 1
+            return dict(self.entities[entity_id])
+        return get
+
+    def _describer(self, method, entity_type_str):
+        def describe(limit=100, next_token=None, filter_variable=None,
+                     eq=None, prefix=None):
+            self.calls[method] += 1
+            matches = []
+            for entity_id, entity in sorted(self.entities.items()):
+                if entity_id[:2] != entity_type_str:
+                    continue
+                value = entity.get(filter_variable, '')
+                if eq is not None and value != eq:
+                    continue
+                if prefix is not None and not value.startswith(prefix):
+                    continue
+                matches.append(dict(entity))
+            start = int(next_token or 0)
+            response = {'Results': matches[start:start + limit]}
+            if start + limit < len(matches):
+                response['NextToken'] = str(start + limit)
+            return response
+        return describe
+
+
+class EntityPollerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeEntityService()
+
+    def test_lists_the_unfinished_entities(self):
+        for i in xrange(10):
+            self.service.add('ev-%d' % i, ['PENDING', 'INPROGRESS'][i % 2])
+        self.service.add('ev-done', 'COMPLETED')
+        self.service.add('ev-other', 'INPROGRESS')
+        self.service.add('ml-0', 'PENDING')
+        poller = wait_for_entity.EntityPoller(self.service, 'ev')
+        waiting = ['ev-%d' % i for i in xrange(10)] + ['ev-done']
+        results = poller.poll(waiting)
+        self.assertEqual(sorted(results), sorted(waiting))
+        self.assertEqual(results['ev-3']['Status'], 'INPROGRESS')
+        self.assertEqual(results['ev-done']['Status'], 'COMPLETED')
+        # One listing per status, and a get for the one not listed.
+        self.assertEqual(self.service.calls, {'describe_evaluations': 2,
+                                              'get_evaluation': 1})
+        self.assertEqual(poller.num_calls, 3)
+
+    def test_pages(self):
+        for i in xrange(250):
+            self.service.add('ds-%03d' % i, 'PENDING')
+        poller = wait_for_entity.EntityPoller(self.service, 'ds')
+        results = poller.poll(['ds-%03d' % i for i in xrange(0, 250, 2)])
+        self.assertEqual(len(results), 125)
+        self.assertEqual(self.service.calls, {'describe_data_sources': 4})
+
+    def test_few_entities_are_fetched_one_at_a_time(self):
+        self.service.add('bp-1', 'PENDING')
+        self.service.add('bp-2', 'COMPLETED')
+        poller = wait_for_entity.EntityPoller(self.service, 'bp')
+        results = poller.poll(['bp-1', 'bp-2'])
+        self.assertEqual(results['bp-2']['Status'], 'COMPLETED')
+        self.assertEqual(self.service.calls, {'get_batch_prediction': 2})
+
+    def test_name_prefix(self):
+        for i in xrange(5):
+            self.service.add('ml-%d' % i, 'COMPLETED', 'fold-%d' % i)
+        self.service.add('ml-x', 'FAILED', 'other')
+        poller = wait_for_entity.EntityPoller(self.service, 'ml',
+                                              name_prefix='fold-')
+        results = poller.poll(['ml-0', 'ml-1', 'ml-2', 'ml-x'])
+        self.assertEqual(results['ml-x']['Status'], 'FAILED')
+        self.assertEqual(self.service.calls, {'describe_ml_models': 1,
+                                              'get_ml_model': 1})
+
+
+class TimedEntityService(FakeEntityService):
+
+    """Entities that are INPROGRESS until the clock reaches the time they
+    finish at, and records when each was polled.
+    """
+
+    def __init__(self, clock, finish_at):
+        super(TimedEntityService, self).__init__()
+        self.clock = clock
+        self.finish_at = finish_at
+        self.polled = collections.defaultdict(list)
+        for entity_id in finish_at:
+            self.add(entity_id, 'INPROGRESS')
+
+    def _getter(self, method):
+        get = super(TimedEntityService, self)._getter(method)
+
+        def timed_get(entity_id):
+            if self.clock.now >= self.finish_at[entity_id]:
+                self.entities[entity_id]['Status'] = 'COMPLETED'
+            self.polled[entity_id].append(self.clock.now)
+            return get(entity_id)
+        return timed_get
+
+
+class WaitForEntitiesTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.directory = tempfile.mkdtemp()
+        self.history = awspyml.JobHistory(
+            os.path.join(self.directory, 'job-history.json'))
+        self.clock = SimulatedClock()
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+
+    def wait(self, service, entity_ids):
+        return wait_for_entity.wait_for_entities(
+            entity_ids, ml=service, history=self.history,
+            clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_each_entity_has_its_own_schedule(self):
+        # Evaluations are known to take about 100 seconds, and are polled
+        # densely around then; the data source backs off on its own.
+        for seconds in [95, 100, 105]:
+            self.history.record('ev', None, seconds)
+        start = self.clock.now
+        service = TimedEntityService(self.clock, {'ev-1': start + 100,
+                                                  'ds-1': start + 600})
+        results = self.wait(service, ['ev-1', 'ds-1'])
+        self.assertEqual(results['ev-1']['Status'], 'COMPLETED')
+        self.assertEqual(results['ds-1']['Status'], 'COMPLETED')
+        ev_polls = [t - start for t in service.polled['ev-1']]
+        self.assertGreaterEqual(ev_polls[-1], 100)
+        self.assertLess(ev_polls[-1], 110)
+        ds_polls = service.polled['ds-1']
+        gaps = [b - a for a, b in zip(ds_polls, ds_polls[1:])]
+        # Backing off, and not woken up by the evaluation's polls.
+        self.assertEqual(gaps, sorted(gaps))
+        self.assertEqual(max(gaps), 60)
+        self.assertGreaterEqual(ds_polls[-1] - start, 600)
+        self.assertLess(ds_polls[-1] - start, 660)
+        self.assertLess(len(ds_polls), 20)
+        # The evaluation was seen running, so it was timed.
+        self.assertEqual(len(self.history.jobs('ev')), 4)
+
+    def test_finished_entities_are_not_polled_again(self):
+        start = self.clock.now
+        service = TimedEntityService(self.clock, {'ml-1': start,
+                                                  'ml-2': start + 300})
+        results = self.wait(service, ['ml-1', 'ml-2'])
+        self.assertEqual(service.polled['ml-1'], [start])
+        self.assertGreater(len(service.polled['ml-2']), 3)
+        self.assertEqual(results['ml-2']['Status'], 'COMPLETED')
+        # ml-1 had finished before the first poll, so it isn't timed.
+        jobs = self.history.jobs('ml')
+        self.assertEqual(len(jobs), 1)
+        self.assertGreaterEqual(jobs[0][1], 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
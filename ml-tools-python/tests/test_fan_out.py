@@ -0,0 +1,130 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import io
+import json
+import threading
+import unittest
+
+import realtime
+
+from test_bulk_predict import ServiceTestCase
+from test_prediction_cache import wait_until
+
+
+class FanOutPredictorTest(ServiceTestCase):
+
+    def setUp(self):
+        super(FanOutPredictorTest, self).setUp()
+        for ml_model_id in ['ml-b', 'ml-c']:
+            self.service.create_realtime_endpoint(ml_model_id)
+
+    def test_shadows_are_compared(self):
+        log = io.BytesIO()
+        fan_out = realtime.FanOutPredictor(['ml-b', 'ml-c'], log)
+        records = [{'x': str(i)} for i in xrange(40)]
+        for record in records:
+            self.assertEqual(fan_out.predict('ml-a', record),
+                             self.expected(record))
+        fan_out.close()
+        stats = fan_out.stats()
+        self.assertEqual(sorted(stats), ['ml-a', 'ml-b', 'ml-c'])
+        for ml_model_id in ['ml-a', 'ml-b', 'ml-c']:
+            self.assertEqual(stats[ml_model_id]['requests'], 40)
+            self.assertEqual(stats[ml_model_id]['errors'], 0)
+        agreed = sum(
+            self.expected(record)['Prediction']['predictedLabel'] ==
+            self.expected(record, 'ml-b')['Prediction']['predictedLabel']
+            for record in records)
+        self.assertEqual(stats['ml-b']['agreement'], agreed / 40.0)
+        self.assertNotIn('agreement', stats['ml-a'])
+
+        entries = [json.loads(line) for line in log.getvalue().splitlines()]
+        self.assertEqual(len(entries), 40)
+        entry = min(entries, key=lambda entry: int(entry['record']['x']))
+        self.assertEqual(entry['record'], {'x': '0'})
+        self.assertEqual(entry['primary']['prediction'],
+                         self.expected({'x': '0'}))
+        self.assertEqual(sorted(shadow['mlModelId']
+                                for shadow in entry['shadows']),
+                         ['ml-b', 'ml-c'])
+        for shadow in entry['shadows']:
+            self.assertIn('agrees', shadow)
+            self.assertIn('latencyMs', shadow)
+
+    def test_shadows_dont_hold_up_the_primary(self):
+        release = threading.Event()
+        predict = self.service.predict
+
+        def slow_shadows(ml_model_id, record, predict_endpoint):
+            if ml_model_id != 'ml-a':
+                release.wait()
+            return predict(ml_model_id, record, predict_endpoint)
+
+        self.service.predict = slow_shadows
+        fan_out = realtime.FanOutPredictor(['ml-b'], shadow_threads=2,
+                                           max_pending=5)
+        for i in xrange(20):
+            fan_out.predict('ml-a', {'x': str(i)})
+        release.set()
+        fan_out.close()
+        stats = fan_out.stats()
+        self.assertEqual(stats['ml-a']['requests'], 20)
+        # At most 2 taken by the threads and 5 queued, and the rest
+        # dropped.
+        self.assertLessEqual(stats['ml-b']['requests'], 7)
+        self.assertEqual(stats['ml-b']['requests'] +
+                         stats['ml-b']['dropped'], 20)
+
+    def test_errors(self):
+        log = io.BytesIO()
+        fan_out = realtime.FanOutPredictor(['ml-none'], log)
+        self.assertRaises(Exception, fan_out.predict, 'ml-a',
+                          {'fail': '1'})
+        fan_out.predict('ml-a', {'x': '1'})
+        fan_out.close()
+        stats = fan_out.stats()
+        self.assertEqual(stats['ml-a']['errors'], 1)
+        self.assertEqual(stats['ml-none']['errors'], 2)
+        self.assertNotIn('agreement', stats['ml-none'])
+        entries = [json.loads(line) for line in log.getvalue().splitlines()]
+        self.assertTrue(all('error' in entry['shadows'][0]
+                            for entry in entries))
+
+    def test_regression_agreement(self):
+        fan_out = realtime.FanOutPredictor(['ml-b'])
+        predictions = {'ml-a': 100.0, 'ml-b': 100.5}
+
+        def regression(ml_model_id, record, predict_endpoint):
+            return {'Prediction':
+                    {'predictedValue': predictions[ml_model_id]}}
+
+        self.service.predict = regression
+        fan_out.predict('ml-a', {'x': '1'})
+        wait_until(lambda: fan_out._shadow_queue.unfinished_tasks == 0)
+        predictions['ml-b'] = 102.0
+        fan_out.predict('ml-a', {'x': '2'})
+        fan_out.close()
+        self.assertEqual(fan_out.stats()['ml-b']['agreement'], 0.5)
+
+    def test_bulk_predict_with_shadows(self):
+        fan_out = realtime.FanOutPredictor(['ml-b'])
+        output = io.BytesIO()
+        realtime.bulk_predict('ml-a', [{'x': str(i)} for i in xrange(30)],
+                              output, threads=4, fan_out=fan_out)
+        fan_out.close()
+        self.assertEqual(fan_out.stats()['ml-b']['requests'], 30)
+        self.assertEqual(len(output.getvalue().splitlines()), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
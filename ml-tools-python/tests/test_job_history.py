@@ -0,0 +1,154 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+
+class JobHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = awspyml.JobHistory(
+            os.path.join(self.directory, 'awspyml', 'job-history.json'),
+            max_jobs=5)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record(self):
+        self.assertEqual(self.history.jobs('ds'), [])
+        self.assertIsNone(self.history.estimate('ds'))
+        for i in xrange(7):
+            self.history.record('ds', i * 100, 60 + i)
+        self.history.record('ml', None, 900)
+        # Only the last max_jobs of each type are kept.
+        self.assertEqual(self.history.jobs('ds'),
+                         [[i * 100, 60 + i] for i in xrange(2, 7)])
+        self.assertEqual(self.history.jobs('ml'), [[None, 900]])
+
+    def test_unreadable_file(self):
+        os.makedirs(os.path.dirname(self.history.path))
+        f = open(self.history.path, 'w')
+        f.write('{not json')
+        f.close()
+        self.assertEqual(self.history.jobs('ds'), [])
+        self.history.record('ds', None, 10)
+        self.assertEqual(self.history.jobs('ds'), [[None, 10]])
+
+    def test_estimate_fits_input_size(self):
+        # 30 seconds plus a second per MB
+        for size in (1, 5, 10, 20):
+            self.history.record('bp', size * 1000000, 30 + size)
+        seconds, spread = self.history.estimate('bp', 40 * 1000000)
+        self.assertAlmostEqual(seconds, 70)
+        # Never less than a tenth of the estimate.
+        self.assertAlmostEqual(spread, 7)
+
+    def test_estimate_without_sizes_is_the_median(self):
+        for seconds in (100, 120, 110, 400, 90):
+            self.history.record('ev', None, seconds)
+        seconds, spread = self.history.estimate('ev', 1000)
+        self.assertEqual(seconds, 110)
+        self.assertEqual(spread, 290)
+
+
+class PollScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+
+    def test_backoff_without_estimate(self):
+        schedule = awspyml.PollSchedule(min_delay=2, max_delay=60)
+        delays = [schedule.next_delay(0) for i in xrange(30)]
+        self.assertGreater(delays[0], 2)
+        self.assertEqual(delays, sorted(delays))
+        self.assertEqual(delays[-1], 60)
+
+    def test_polls_densely_around_the_estimate(self):
+        schedule = awspyml.PollSchedule((3600, 300), dense_polls=5)
+        # Before the window, every tenth of the expected time, but never
+        # past the start of the window.
+        self.assertEqual(schedule.next_delay(0), 360)
+        self.assertEqual(schedule.next_delay(3200), 100)
+        # Five polls across the window
+        self.assertEqual(schedule.next_delay(3300), 120)
+        self.assertEqual(schedule.next_delay(3850), 120)
+        # Backed off after it.
+        self.assertGreater(schedule.next_delay(3900), 120)
+
+    def test_delays_are_bounded(self):
+        schedule = awspyml.PollSchedule((100000, 100), min_delay=2,
+                                        max_delay=600)
+        self.assertEqual(schedule.next_delay(0), 600)
+        schedule = awspyml.PollSchedule((10, 1), min_delay=2)
+        self.assertEqual(schedule.next_delay(0), 2)
+        self.assertEqual(schedule.next_delay(9.5), 2)
+
+
+class PollUntilTerminalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = awspyml.JobHistory(
+            os.path.join(self.directory, 'job-history.json'))
+        self.now = 1000.0
+        self.sleeps = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def poll_statuses(self, statuses, **kwargs):
+        statuses = iter(statuses)
+        return awspyml.poll_until_terminal(
+            lambda: {'Status': next(statuses), 'CreatedAt': 1000},
+            'ds', clock=self.clock, sleep=self.sleep, **kwargs)
+
+    def test_records_completed_jobs(self):
+        entity = self.poll_statuses(['PENDING', 'INPROGRESS', 'COMPLETED'],
+                                    input_size=5, history=self.history)
+        self.assertEqual(entity['Status'], 'COMPLETED')
+        self.assertEqual(len(self.sleeps), 2)
+        [[size, seconds]] = self.history.jobs('ds')
+        self.assertEqual(size, 5)
+        self.assertAlmostEqual(seconds, sum(self.sleeps))
+
+    def test_only_jobs_seen_running_are_recorded(self):
+        self.poll_statuses(['COMPLETED'], history=self.history)
+        self.poll_statuses(['INPROGRESS', 'FAILED'], history=self.history)
+        self.assertEqual(self.history.jobs('ds'), [])
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_schedules_around_the_estimate(self):
+        for i in xrange(3):
+            self.history.record('ds', None, 600)
+        self.poll_statuses(['INPROGRESS'] * 20 + ['COMPLETED'],
+                           history=self.history)
+        # Every tenth of the expected time, then every few seconds.
+        self.assertEqual(self.sleeps[:5], [60] * 5)
+        self.assertEqual(self.sleeps[9:11], [24, 24])
+
+
+if __name__ == '__main__':
+    unittest.main()
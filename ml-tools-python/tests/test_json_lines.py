@@ -0,0 +1,101 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+
+class JsonLinesSchemaGuesserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data.json')
+        self.csv_filename = os.path.join(self.directory, 'data.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, lines):
+        f = open(self.filename, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+
+    def test_nested_objects_are_flattened(self):
+        self.write([
+            '{"a": 1, "b": {"c": "x", "d": {"e": 2.5}}}',
+            '',
+            '{"f": [1, 2], "b": {"c": "y"}, "a": null}',
+        ])
+        guesser = awspyml.JsonLinesSchemaGuesser()
+        schema = guesser.from_file(self.filename)
+        self.assertEqual(guesser.field_names, ['a', 'b.c', 'b.d.e', 'f'])
+        self.assertEqual(guesser.num_records, 2)
+        self.assertEqual(
+            [a['attributeName'] for a in schema.as_obj()['attributes']],
+            ['a', 'b.c', 'b.d.e', 'f'])
+
+    def test_write_csv(self):
+        self.write([
+            u'{"id": 1, "text": "one\\ntwo", "tags": ["a", null, "b"]}',
+            u'{"id": 2, "user": {"name": "Zo\\u00eb"}, "ok": true}',
+        ])
+        guesser = awspyml.JsonLinesSchemaGuesser()
+        guesser.from_file(self.filename)
+        guesser.write_csv(self.filename, self.csv_filename)
+        f = open(self.csv_filename, 'rb')
+        rows = list(csv.reader(f))
+        f.close()
+        self.assertEqual(rows, [
+            ['id', 'text', 'tags', 'user.name', 'ok'],
+            ['1', 'one two', 'a b', '', ''],
+            ['2', '', '', 'Zo\xc3\xab', 'True'],
+        ])
+
+    def test_fields_not_guessed_are_left_out(self):
+        self.write(['{"a": 1}', '{"a": 2, "b": 3}'])
+        guesser = awspyml.JsonLinesSchemaGuesser()
+        guesser.from_file(self.filename, num_lines_to_use=1)
+        guesser.write_csv(self.filename, self.csv_filename)
+        f = open(self.csv_filename, 'rb')
+        rows = list(csv.reader(f))
+        f.close()
+        self.assertEqual(rows, [['a'], ['1'], ['2']])
+
+    def test_lines_that_are_not_objects(self):
+        for line in ['[1, 2]', '"text"', '3', 'null']:
+            self.write(['{"a": 1}', line])
+            guesser = awspyml.JsonLinesSchemaGuesser()
+            with self.assertRaisesRegexp(awspyml.SchemaException,
+                                         'Line 2 is a JSON'):
+                guesser.from_file(self.filename)
+        self.write(['{"a": 1}'])
+        guesser = awspyml.JsonLinesSchemaGuesser()
+        guesser.from_file(self.filename)
+        self.write(['{"a": 1}', '', '[1]'])
+        with self.assertRaisesRegexp(awspyml.SchemaException,
+                                     'Line 3 is a JSON list'):
+            guesser.write_csv(self.filename, self.csv_filename)
+
+    def test_invalid_json(self):
+        self.write(['{"a": 1}', '{"a": '])
+        with self.assertRaisesRegexp(awspyml.SchemaException,
+                                     'Line 2 is not valid JSON'):
+            awspyml.JsonLinesSchemaGuesser().from_file(self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import io
+import unittest
+
+import realtime
+
+from test_bulk_predict import ServiceTestCase
+
+
+class LoadTestTest(ServiceTestCase):
+
+    def test_open_loop_is_bounded(self):
+        # 2000 requests a second need 6 in flight at 3ms each, so with 2
+        # they fall behind schedule.
+        self.service.max_delay_ms = 6
+        result = realtime.load_test('ml-a', [{'x': '1'}, {'x': '2'}], 0.2,
+                                    rate=2000, concurrency=2)
+        self.assertLessEqual(self.service.max_in_flight, 2)
+        self.assertEqual(result['requests'], 400)
+        self.assertEqual(result['errors'], 0)
+        self.assertGreater(result['sendLag'].percentile(99), 10000)
+        # Time waiting to be sent counts in the latency.
+        self.assertGreater(result['latency'].percentile(99),
+                           result['uncorrectedLatency'].percentile(99) * 2)
+
+    def test_open_loop_on_schedule(self):
+        self.service.max_delay_ms = 1
+        result = realtime.load_test('ml-a', [{'x': '1'}], 0.2, rate=100,
+                                    concurrency=4)
+        self.assertEqual(result['requests'], 20)
+        self.assertLess(result['sendLag'].percentile(50), 5000)
+
+    def test_closed_loop(self):
+        result = realtime.load_test('ml-a', [{'x': '1'}, {'fail': '1'}],
+                                    0.1, concurrency=3)
+        self.assertLessEqual(self.service.max_in_flight, 3)
+        self.assertGreater(result['requests'], 10)
+        self.assertAlmostEqual(result['errors'], result['requests'] / 2,
+                               delta=3)
+
+    def test_report(self):
+        result = realtime.load_test('ml-a', [{'x': '1'}], 0.1, rate=100)
+        report = realtime.load_test_report(result, 100, 16)
+        self.assertEqual(report['mode'], 'open')
+        self.assertEqual(report['requests'], 10)
+        self.assertIn('p99.99', report['latencyMs'])
+        self.assertIn('p100', report['sendLagMs'])
+        out = io.BytesIO()
+        realtime.print_percentile_table(report, out)
+        self.assertIn('Send lag: p50', out.getvalue())
+        closed = realtime.load_test_report(
+            realtime.load_test('ml-a', [{'x': '1'}], 0.05), None, 16)
+        self.assertNotIn('sendLagMs', closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
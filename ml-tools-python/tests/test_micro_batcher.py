@@ -0,0 +1,143 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import threading
+import time
+import unittest
+
+import awspyml
+
+from test_prediction_cache import wait_until
+
+
+class BatchBackend(object):
+
+    """A predict_batch function that records its batches, and while
+    blocked, waits for release before answering.
+    """
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, records):
+        self.batches.append(list(records))
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return [record * 2 for record in records]
+
+
+class MicroBatcherTest(unittest.TestCase):
+
+    def predict_in_threads(self, batcher, records):
+        """Starts a thread predicting each record, and returns the list
+        their predictions (or errors) go in, and the threads.
+        """
+        results = [None] * len(records)
+
+        def call(i):
+            try:
+                results[i] = batcher.predict(records[i])
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,))
+                   for i in xrange(len(records))]
+        for thread in threads:
+            thread.start()
+        return results, threads
+
+    def test_predictions_go_to_their_callers(self):
+        backend = BatchBackend()
+        batcher = awspyml.MicroBatcher(backend, max_wait_ms=20)
+        results, threads = self.predict_in_threads(batcher, range(50))
+        for thread in threads:
+            thread.join()
+        batcher.close()
+        self.assertEqual(results, [i * 2 for i in xrange(50)])
+        self.assertEqual(batcher.num_records, 50)
+        self.assertEqual(sum(len(batch) for batch in backend.batches), 50)
+        self.assertEqual(batcher.num_batches, len(backend.batches))
+
+    def test_requests_queue_up_while_a_batch_is_scored(self):
+        backend = BatchBackend()
+        backend.release.clear()
+        batcher = awspyml.MicroBatcher(backend, max_batch_size=8,
+                                       max_wait_ms=0)
+        first, threads = self.predict_in_threads(batcher, [100])
+        wait_until(lambda: len(backend.batches) == 1)
+        results, more_threads = self.predict_in_threads(batcher, range(20))
+        wait_until(lambda: batcher._queue.qsize() == 20)
+        backend.release.set()
+        for thread in threads + more_threads:
+            thread.join()
+        batcher.close()
+        self.assertEqual(first, [200])
+        self.assertEqual(results, [i * 2 for i in xrange(20)])
+        self.assertEqual([len(batch) for batch in backend.batches],
+                         [1, 8, 8, 4])
+        self.assertEqual(batcher.batch_sizes, {1: 1, 8: 2, 4: 1})
+
+    def test_waits_for_more_records(self):
+        backend = BatchBackend()
+        batcher = awspyml.MicroBatcher(backend, max_wait_ms=50)
+        start = time.time()
+        self.assertEqual(batcher.predict(1), 2)
+        self.assertGreaterEqual(time.time() - start, 0.04)
+        batcher.close()
+
+    def test_errors_go_to_the_whole_batch(self):
+        error = ValueError('bad model')
+        backend = BatchBackend(error)
+        backend.release.clear()
+        batcher = awspyml.MicroBatcher(backend, max_wait_ms=0)
+        first, threads = self.predict_in_threads(batcher, [0])
+        wait_until(lambda: len(backend.batches) == 1)
+        results, more_threads = self.predict_in_threads(batcher, range(5))
+        wait_until(lambda: batcher._queue.qsize() == 5)
+        backend.release.set()
+        for thread in threads + more_threads:
+            thread.join()
+        self.assertEqual(first, [error])
+        self.assertEqual(results, [error] * 5)
+        # The worker keeps going.
+        backend.error = None
+        self.assertEqual(batcher.predict(3), 6)
+        batcher.close()
+
+    def test_wrong_number_of_predictions(self):
+        batcher = awspyml.MicroBatcher(lambda records: [], max_wait_ms=0)
+        self.assertRaises(awspyml.AWSPyMLException, batcher.predict, 1)
+        batcher.close()
+
+    def test_close_scores_queued_requests(self):
+        backend = BatchBackend()
+        backend.release.clear()
+        batcher = awspyml.MicroBatcher(backend, max_wait_ms=0)
+        results, threads = self.predict_in_threads(batcher, range(3))
+        wait_until(lambda: sum(len(batch) for batch in backend.batches) +
+                   batcher._queue.qsize() == 3)
+        closer = threading.Thread(target=batcher.close)
+        closer.start()
+        backend.release.set()
+        closer.join()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [0, 2, 4])
+        self.assertFalse(batcher._worker.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import threading
+import time
+import unittest
+
+import awspyml
+
+
+class Backend(object):
+
+    """A predict function that counts its calls, and with block set,
+    waits for release before answering.
+    """
+
+    def __init__(self, block=False, error=None):
+        self.calls = 0
+        self.error = error
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+        self._lock = threading.Lock()
+
+    def __call__(self, ml_model_id, record, ml=None):
+        with self._lock:
+            self.calls += 1
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {'predictedLabel': record.get('x', '')}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.001)
+
+
+class PredictionCacheTest(unittest.TestCase):
+
+    def predict_concurrently(self, cache, record, num_threads=8):
+        """Returns the predictions (or errors) of num_threads concurrent
+        calls for record, once all of them are waiting on one call.
+        """
+        results = [None] * num_threads
+
+        def call(i):
+            try:
+                results[i] = cache.predict('ml-a', record)
+            except Exception as e:
+                results[i] = e
+        threads = [threading.Thread(target=call, args=(i,))
+                   for i in xrange(num_threads)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: cache.coalesced == num_threads - 1)
+        cache.predict_function.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_one_call(self):
+        backend = Backend(block=True)
+        cache = awspyml.PredictionCache(predict_function=backend)
+        results = self.predict_concurrently(cache, {'x': '1'})
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(results, [{'predictedLabel': '1'}] * 8)
+        self.assertEqual(cache.stats()['misses'], 1)
+        # And the result is cached.
+        cache.predict('ml-a', {'x': '1'})
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_error_reaches_every_waiter_and_is_not_cached(self):
+        backend = Backend(block=True, error=awspyml.AWSPyMLException('down'))
+        cache = awspyml.PredictionCache(predict_function=backend)
+        results = self.predict_concurrently(cache, {'x': '1'})
+        self.assertEqual(backend.calls, 1)
+        for result in results:
+            self.assertIsInstance(result, awspyml.AWSPyMLException)
+        self.assertEqual(cache.stats()['entries'], 0)
+        backend.error = None
+        self.assertEqual(cache.predict('ml-a', {'x': '1'}),
+                         {'predictedLabel': '1'})
+        self.assertEqual(backend.calls, 2)
+
+    def test_entries_expire(self):
+        backend = Backend()
+        cache = awspyml.PredictionCache(ttl=0.05, predict_function=backend)
+        cache.predict('ml-a', {'x': '1'})
+        cache.predict('ml-a', {'x': '1'})
+        self.assertEqual(backend.calls, 1)
+        time.sleep(0.1)
+        cache.predict('ml-a', {'x': '1'})
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(cache.stats()['entries'], 1)
+
+    def test_equivalent_records_share_an_entry(self):
+        backend = Backend()
+        cache = awspyml.PredictionCache(predict_function=backend)
+        cache.predict('ml-a', {'x': '1', 'text': 'a  b'})
+        cache.predict('ml-a', {'text': ' a b ', 'x': u'1', 'y': ''})
+        self.assertEqual(backend.calls, 1)
+        cache.predict('ml-b', {'x': '1', 'text': 'a b'})
+        cache.predict('ml-a', {'x': '2', 'text': 'a b'})
+        self.assertEqual(backend.calls, 3)
+
+    def test_least_recently_used_are_evicted(self):
+        backend = Backend()
+        cache = awspyml.PredictionCache(
+            max_bytes=3 * (awspyml.PredictionCache.ENTRY_OVERHEAD + 30),
+            predict_function=backend)
+        for x in ('1', '2', '3'):
+            cache.predict('ml-a', {'x': x})
+        cache.predict('ml-a', {'x': '1'})  # Now 2 is the oldest
+        cache.predict('ml-a', {'x': '4'})
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.num_bytes, cache.max_bytes)
+        calls = backend.calls
+        cache.predict('ml-a', {'x': '1'})
+        self.assertEqual(backend.calls, calls)
+        cache.predict('ml-a', {'x': '2'})
+        self.assertEqual(backend.calls, calls + 1)
+
+    def test_invalidate(self):
+        backend = Backend()
+        cache = awspyml.PredictionCache(predict_function=backend)
+        cache.predict('ml-a', {'x': '1'})
+        cache.predict('ml-b', {'x': '1'})
+        cache.invalidate('ml-a')
+        self.assertEqual(cache.stats()['entries'], 1)
+        cache.predict('ml-b', {'x': '1'})
+        self.assertEqual(backend.calls, 2)
+        cache.invalidate()
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import csv
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+
+def make_schema():
+    schema = awspyml.Schema()
+    for idx, (name, attribute_type) in enumerate([
+            ('id', 'CATEGORICAL'), ('amount', 'NUMERIC'),
+            ('kind', 'CATEGORICAL'), ('text', 'TEXT'),
+            ('flag', 'BINARY'), ('y', 'BINARY')]):
+        schema.set_variable_name(idx, name)
+        schema.set_variable_type(idx, attribute_type)
+    schema.set_target('y')
+    schema.set_row_id('id')
+    schema.set_header_line(True)
+    return schema
+
+
+ROWS = [
+    ['r1', '1', 'a', 'The cat, sat', 'yes', '1'],
+    ['r2', '2', 'b', 'a Dog', 'no', '0'],
+    ['r3', '', 'a', '', '', '1'],
+    ['r4', '4', 'c', 'cat cat', 'true', '0'],
+]
+
+
+class CsvColumnBlocksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, lines, filename=None):
+        f = open(filename or self.filename, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+
+    def test_columns(self):
+        f = open(self.filename, 'wb')
+        writer = csv.writer(f)
+        writer.writerow(['id', 'amount', 'kind', 'text', 'flag', 'y'])
+        writer.writerows(ROWS)
+        f.close()
+        blocks = list(awspyml.csv_column_blocks(self.filename, make_schema()))
+        self.assertEqual(len(blocks), 1)
+        columns = blocks[0]
+        self.assertEqual(columns['kind'].tolist(), ['a', 'b', 'a', 'c'])
+        self.assertEqual(columns['amount'][[0, 1, 3]].tolist(), [1, 2, 4])
+        self.assertTrue(math.isnan(columns['amount'][2]))
+        self.assertEqual(columns['flag'][[0, 1, 3]].tolist(), [1, 0, 1])
+        self.assertTrue(math.isnan(columns['flag'][2]))
+
+    def test_blank_lines_and_short_records(self):
+        self.write(['id,amount,kind,text,flag,y', 'r1,1', '', '', '',
+                    'r2,2,b,x,no,0', ''])
+        blocks = list(awspyml.csv_column_blocks(self.filename, make_schema(),
+                                                block_size=2))
+        self.assertEqual([block['id'].tolist() for block in blocks],
+                         [['r1'], ['r2']])
+        self.assertEqual(blocks[0]['kind'].tolist(), [''])
+
+    def test_directory_of_shards(self):
+        header = 'id,amount,kind,text,flag,y'
+        self.write([header, ','.join(ROWS[0])],
+                   os.path.join(self.directory, 'part-0'))
+        self.write([header, ','.join(ROWS[1]), ','.join(ROWS[2])],
+                   os.path.join(self.directory, 'part-1'))
+        ids = [value for block in awspyml.csv_column_blocks(
+               self.directory, make_schema()) for value in block['id']]
+        self.assertEqual(ids, ['r1', 'r2', 'r3'])
+
+
+class RecipeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = make_schema()
+        self.records = [dict(zip(['id', 'amount', 'kind', 'text', 'flag',
+                                  'y'], row)) for row in ROWS]
+        self.columns = awspyml.record_columns(self.records, self.schema)
+
+    def outputs(self, outputs, groups=None, assignments=None):
+        recipe = awspyml.Recipe({"groups": groups or {},
+                                 "assignments": assignments or {},
+                                 "outputs": outputs}, self.schema)
+        recipe.fit([self.columns])
+        return dict((output.name, output)
+                    for output in recipe.transform(self.columns))
+
+    def test_groups(self):
+        names = sorted(self.outputs(["ALL_INPUTS"]))
+        self.assertEqual(names, ['amount', 'flag', 'kind', 'text'])
+        self.assertEqual(sorted(self.outputs(
+            ["group_remove(ALL_INPUTS, ALL_TEXT, flag)"])),
+            ['amount', 'kind'])
+        self.assertEqual(sorted(self.outputs(
+            ["words"], groups={"words": "group(text, 'kind')"})),
+            ['kind', 'text'])
+
+    def test_text_transformations(self):
+        outputs = self.outputs(["ngram(no_punct(lowercase(text)), 2)",
+                                "osb(text, 3)"])
+        self.assertEqual(
+            outputs['ngram(no_punct(lowercase(text)),2)'].tokens(),
+            [['the', 'cat', 'sat', 'the_cat', 'cat_sat'],
+             ['a', 'dog', 'a_dog'], [], ['cat', 'cat', 'cat_cat']])
+        self.assertEqual(outputs['osb(text,3)'].tokens()[0],
+                         ['The_cat,', 'The__sat', 'cat,_sat'])
+
+    def test_quantile_bin_and_normalize(self):
+        outputs = self.outputs(["quantile_bin(amount, 2)",
+                                "normalize(amount)"])
+        bins = outputs['quantile_bin(amount,2)'].values.tolist()
+        self.assertEqual(bins[2], '')
+        self.assertEqual(len(set(bins[:2] + bins[3:])), 2)
+        self.assertEqual(bins[1], bins[3])
+        normalized = outputs['normalize(amount)'].values
+        self.assertAlmostEqual(normalized[[0, 1, 3]].mean(), 0)
+        self.assertAlmostEqual(normalized[[0, 1, 3]].std(), 1)
+        self.assertTrue(math.isnan(normalized[2]))
+
+    def test_cartesian(self):
+        outputs = self.outputs(["cartesian(kind, flag)",
+                                "cartesian(kind, text)"])
+        self.assertEqual(outputs['cartesian(kind,flag)'].values.tolist(),
+                         ['a_1', 'b_0', '', 'c_1'])
+        self.assertEqual(outputs['cartesian(kind,text)'].tokens(),
+                         [['a_The', 'a_cat,', 'a_sat'], ['b_a', 'b_Dog'],
+                          [], ['c_cat', 'c_cat']])
+
+    def test_must_be_fit(self):
+        recipe = awspyml.Recipe({"outputs": ["normalize(amount)"]},
+                                self.schema)
+        self.assertRaises(awspyml.AWSPyMLException, recipe.transform,
+                          self.columns)
+
+    def test_errors(self):
+        for outputs in [[], ["nope"], ["ngram(text)"], ["ngram(kind, 2)"],
+                        ["quantile_bin(normalize(amount), 2)"],
+                        ["lowercase(text"], ["frob(text)"],
+                        ["osb(text, x)"]]:
+            self.assertRaises(awspyml.SchemaException, awspyml.Recipe,
+                              {"outputs": outputs}, self.schema)
+
+    def test_feature_space(self):
+        recipe = awspyml.Recipe({"outputs": ["ALL_NUMERIC", "kind",
+                                             "lowercase(text)"]},
+                                self.schema)
+        space = recipe.feature_space([self.columns, self.columns]).as_obj()
+        self.assertEqual(space['numRecords'], 8)
+        self.assertEqual(space['outputs'], [
+            {'name': 'amount', 'attributeType': 'NUMERIC', 'numFeatures': 1},
+            {'name': 'kind', 'attributeType': 'CATEGORICAL',
+             'numFeatures': 3},
+            {'name': 'lowercase(text)', 'attributeType': 'TEXT',
+             'numFeatures': 6},
+        ])
+        self.assertEqual(space['numFeatures'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+import route_predictions
+
+
+class FakeKey(object):
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def set_contents_from_filename(self, filename):
+        f = open(filename, 'rb')
+        try:
+            self.bucket.contents[self.name] = f.read()
+        finally:
+            f.close()
+
+    def get_contents_to_file(self, f):
+        f.write(self.bucket.contents[self.name])
+
+
+class FakeBucket(object):
+
+    def __init__(self):
+        self.contents = {}
+
+    def new_key(self, name):
+        return FakeKey(self, name)
+
+    def list(self, prefix=''):
+        return [FakeKey(self, name) for name in sorted(self.contents)
+                if name.startswith(prefix)]
+
+
+class FakeS3(object):
+
+    def __init__(self):
+        self.buckets = {}
+
+    def get_bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket())
+
+
+class FakeML(object):
+
+    """Runs batch predictions instantly: the score of a record is its x
+    divided by 100, and results come back shuffled across two files.
+    The rows of the batch file numbered in drop_rows get no result.
+    """
+
+    def __init__(self, s3, drop_rows=()):
+        self.s3 = s3
+        self.drop_rows = set(drop_rows)
+        self.data_sources = {}
+
+    def create_data_source_from_s3(self, data_source_id, data_spec, **kwargs):
+        self.data_sources[data_source_id] = data_spec
+
+    def create_batch_prediction(self, batch_prediction_id, ml_model_id,
+                                batch_prediction_data_source_id, output_uri,
+                                **kwargs):
+        spec = self.data_sources[batch_prediction_data_source_id]
+        bucket, key = awspyml._parse_s3_url(spec['DataLocationS3'])
+        rows = list(csv.DictReader(io.BytesIO(
+            self.s3.get_bucket(bucket).contents[key])))
+        row_id = json.loads(spec['DataSchema'])['rowId']
+        results = [[row[row_id],
+                    '1' if float(row['x']) >= 50 else '0',
+                    str(float(row['x']) / 100)]
+                   for row in rows
+                   if int(row[row_id]) not in self.drop_rows]
+        random.Random(0).shuffle(results)
+        bucket, prefix = awspyml._parse_s3_url(
+            output_uri + 'batch-prediction/result/' + batch_prediction_id)
+        half = len(results) // 2
+        for i, part in enumerate([results[:half], results[half:]]):
+            data = io.BytesIO()
+            f = gzip.GzipFile(fileobj=data, mode='wb')
+            writer = csv.writer(f)
+            writer.writerow(['tag', 'bestAnswer', 'score'])
+            writer.writerows(part)
+            f.close()
+            self.s3.get_bucket(bucket).contents[
+                '%s-%d.gz' % (prefix, i)] = data.getvalue()
+        self.s3.get_bucket(bucket).contents[prefix + '.manifest'] = '{}'
+
+    def get_batch_prediction(self, batch_prediction_id):
+        return {'Status': 'COMPLETED'}
+
+
+class HybridRouterTest(unittest.TestCase):
+
+    def setUp(self):
+        # The batch prediction's poll reads ~/.awspyml/job-history.json.
+        self.home = tempfile.mkdtemp()
+        self.saved = (os.environ.get('HOME'), awspyml.aml_connection,
+                      awspyml.predict, route_predictions.boto.connect_s3,
+                      route_predictions.log)
+        os.environ['HOME'] = self.home
+        self.s3 = FakeS3()
+        # The batch's eighth row, record 12, goes missing.
+        self.ml = FakeML(self.s3, drop_rows=[7])
+        awspyml.aml_connection = lambda: self.ml
+        awspyml.predict = self.fake_predict
+        route_predictions.boto.connect_s3 = lambda: self.s3
+        route_predictions.log = lambda message: None
+
+        self.schema = awspyml.Schema()
+        for idx, (name, typ) in enumerate([('x', 'NUMERIC'),
+                                           ('y', 'BINARY')]):
+            self.schema.set_variable_name(idx, name)
+            self.schema.set_variable_type(idx, typ)
+        self.schema.set_target('y')
+
+    def tearDown(self):
+        home, awspyml.aml_connection, awspyml.predict, \
+            route_predictions.boto.connect_s3, route_predictions.log = \
+            self.saved
+        if home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = home
+        shutil.rmtree(self.home)
+
+    def fake_predict(self, ml_model_id, record):
+        if record['x'] == '13':
+            raise awspyml.AWSPyMLException('Throttled')
+        return {'Prediction': {'predictedLabel': 'realtime ' + record['x']}}
+
+    def test_matches_batch_results_to_records(self):
+        policy = route_predictions.RoutingPolicy(
+            spill_threshold=10, batch_turnaround=60, realtime_rate=1)
+        router = route_predictions.HybridRouter(
+            'ml-test', self.schema, 's3://bucket/staging/', policy,
+            threads=2)
+        records = [{'x': str(i)} for i in xrange(100)]
+        # The first five are due before a batch prediction could finish.
+        deadlines = [0] * 5 + [None] * 95
+        results = router.score(records, deadlines)
+
+        self.assertEqual(len(results), len(records))
+        for i in xrange(5):
+            self.assertEqual(results[i]['Route'], 'realtime')
+            self.assertEqual(results[i]['Prediction']['predictedLabel'],
+                             'realtime %d' % i)
+        for i in xrange(5, 100):
+            self.assertEqual(results[i]['Route'], 'batch')
+            if i == 12:
+                self.assertIn('Missing', results[i]['Error'])
+                continue
+            prediction = results[i]['Prediction']
+            self.assertEqual(prediction['predictedLabel'],
+                             '1' if i >= 50 else '0')
+            self.assertAlmostEqual(
+                prediction['predictedScores'][prediction['predictedLabel']],
+                i / 100.0)
+
+    def test_small_backlog_stays_realtime(self):
+        router = route_predictions.HybridRouter(
+            'ml-test', self.schema, 's3://bucket/staging',
+            route_predictions.RoutingPolicy(spill_threshold=1000))
+        results = router.score([{'x': str(i)} for i in xrange(20)])
+        self.assertEqual([result['Route'] for result in results],
+                         ['realtime'] * 20)
+        self.assertEqual(results[13]['Error'], 'Throttled')
+        self.assertEqual(self.s3.buckets, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
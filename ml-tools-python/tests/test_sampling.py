@@ -0,0 +1,217 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+from test_schema_guesser import write_csv
+
+
+class ReservoirSamplingTest(unittest.TestCase):
+
+    NUM_RECORDS = 10000
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'sorted.csv')
+        # Sorted so that the first fifth of the file looks different from
+        # the rest: "count" is 5 and then 1, and "code" is a number and
+        # then a word.
+        rows = []
+        for i in xrange(self.NUM_RECORDS):
+            first = i < self.NUM_RECORDS // 5
+            rows.append(['5' if first else '1',
+                         str(i) if first else 'c%d' % (i % 7),
+                         str(i % 2)])
+        write_csv(self.filename, ['count', 'code', 'y'], rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def guess(self, streaming, vectorize=True, seed=1):
+        random.seed(seed)
+        guesser = awspyml.SchemaGuesser()
+        guesser.vectorize = vectorize
+        schema = guesser.from_file(self.filename, num_lines_to_use=1000,
+                                   streaming=streaming)
+        return guesser, schema
+
+    def test_sample_covers_the_whole_file(self):
+        guesser, schema = self.guess(streaming=False)
+        self.assertEqual(
+            schema.get_variable_by_name('code')['attributeType'], 'NUMERIC')
+        guesser, schema = self.guess(streaming=True)
+        self.assertEqual(
+            schema.get_variable_by_name('code')['attributeType'],
+            'CATEGORICAL')
+        self.assertEqual(guesser.summary.records_seen, self.NUM_RECORDS)
+        self.assertEqual(guesser.summary.records_sampled, 1000)
+
+    def test_sample_is_uniform(self):
+        guesser, schema = self.guess(streaming=True)
+        counts = guesser.summary.counts
+        # Every sampled record is counted once per attribute.
+        self.assertEqual(counts.sum(axis=1).tolist(), [1000] * 3)
+        # About a fifth of the sample has count 5 (NUMERIC), the rest 1.
+        numeric = counts[0][awspyml.SchemaGuesser.CODE_NUMERIC]
+        self.assertAlmostEqual(numeric, 200, delta=50)
+
+    def test_vectorized_matches_scalar(self):
+        vectorized, schema = self.guess(streaming=True, vectorize=True)
+        scalar, scalar_schema = self.guess(streaming=True, vectorize=False)
+        self.assertEqual(vectorized.summary.counts.tolist(),
+                         scalar.summary.counts.tolist())
+        self.assertEqual(schema.as_obj(), scalar_schema.as_obj())
+
+    def test_small_file(self):
+        guesser = awspyml.SchemaGuesser()
+        guesser.from_file(self.filename, num_lines_to_use=2 * self.NUM_RECORDS,
+                          streaming=True)
+        self.assertEqual(guesser.summary.records_sampled, self.NUM_RECORDS)
+        self.assertEqual(guesser.summary.counts.sum(axis=1).tolist(),
+                         [self.NUM_RECORDS] * 3)
+
+
+class ByteRangeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data.csv')
+        rng = random.Random(2)
+        self.header = ['amount', 'kind', 'note', 'y']
+        self.rows = [[str(rng.randrange(1000)) if rng.random() < 0.9
+                      else 'n/a',
+                      'k%d' % rng.randrange(12),
+                      ' '.join('w%d' % rng.randrange(50)
+                               for j in xrange(rng.randrange(1, 30))),
+                      str(rng.randrange(2))]
+                     for i in xrange(3000)]
+        write_csv(self.filename, self.header, self.rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ranges_split_lines_exactly_once(self):
+        f = open(self.filename, 'rb')
+        try:
+            lines = f.readlines()
+            for bytes_per_range in (1, 7, 100, 4096, 1 << 30):
+                ranges = list(awspyml._byte_ranges([self.filename],
+                                                   bytes_per_range))
+                found = []
+                for fn, start, end in ranges:
+                    found.extend(awspyml._byte_range_lines(
+                        f, start, end, chunk_size=1000))
+                self.assertEqual(found, lines)
+        finally:
+            f.close()
+
+    def guess_serial(self, path):
+        guesser = awspyml.SchemaGuesser()
+        schema = guesser.from_file(path, num_lines_to_use=len(self.rows) + 1)
+        return guesser, schema
+
+    def guess_parallel(self, path):
+        # Each range has fewer records than num_lines_to_use, so all of
+        # them are sampled, as in the serial guess.
+        guesser = awspyml.SchemaGuesser()
+        schema = guesser.from_file_parallel(path, num_lines_to_use=2000,
+                                            processes=2,
+                                            bytes_per_task=16 * 1024)
+        return guesser, schema
+
+    def assertSameGuess(self, serial_guess, parallel_guess):
+        serial, serial_schema = serial_guess
+        parallel, parallel_schema = parallel_guess
+        self.assertEqual(parallel.summary.records_seen, len(self.rows))
+        self.assertEqual(parallel.summary.counts.tolist(),
+                         serial.summary.counts.tolist())
+        self.assertEqual(parallel_schema.as_obj(), serial_schema.as_obj())
+
+    def test_parallel_matches_serial(self):
+        self.assertSameGuess(self.guess_serial(self.filename),
+                             self.guess_parallel(self.filename))
+
+    def test_directory_of_shards(self):
+        shards = os.path.join(self.directory, 'shards')
+        os.mkdir(shards)
+        for i in xrange(3):
+            write_csv(os.path.join(shards, 'part-%d.csv' % i), self.header,
+                      self.rows[i * 1000:(i + 1) * 1000])
+        self.assertSameGuess(self.guess_serial(self.filename),
+                             self.guess_parallel(shards))
+
+
+class CountingReader(awspyml.LocalRangeReader):
+
+    def __init__(self, filename):
+        super(CountingReader, self).__init__(filename)
+        self.bytes_read = 0
+
+    def read(self, start, end):
+        self.bytes_read += end - start
+        return super(CountingReader, self).read(start, end)
+
+
+class ObjectSamplingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'big.csv')
+        rng = random.Random(4)
+        rows = [[str(i), str(rng.randrange(100)), 'k%d' % rng.randrange(5),
+                 str(rng.randrange(2))] for i in xrange(50000)]
+        write_csv(self.filename, ['event_id', 'amount', 'kind', 'y'], rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ranges_are_stratified(self):
+        size = 10 ** 9
+        for seed in xrange(20):
+            random.seed(seed)
+            ranges = awspyml._sample_byte_ranges(size, 16, 4096)
+            self.assertEqual(len(ranges), 17)
+            self.assertEqual(ranges[0], (0, 4096))
+            stratum = (size - 4096) // 16
+            for i, (start, end) in enumerate(ranges[1:]):
+                self.assertEqual(end - start, 4096)
+                self.assertGreaterEqual(start, 4096 + i * stratum)
+                self.assertLessEqual(end, 4096 + (i + 1) * stratum)
+        self.assertEqual(awspyml._sample_byte_ranges(1000, 16, 4096),
+                         [(0, 1000)])
+
+    def test_block_lines_are_complete(self):
+        data = b'ail\nfirst\nsecond\nthi'
+        self.assertEqual(awspyml._block_lines(data, 10, 30, 100),
+                         [b'first\n', b'second\n'])
+        self.assertEqual(awspyml._block_lines(data, 0, 22, 22),
+                         [b'ail\n', b'first\n', b'second\n', b'thi'])
+
+    def test_reads_only_the_sampled_blocks(self):
+        reader = CountingReader(self.filename)
+        guesser = awspyml.SchemaGuesser()
+        schema = guesser.from_object(reader, num_blocks=8, block_size=8192)
+        self.assertEqual(reader.bytes_read, 9 * 8192)
+        full_schema = awspyml.SchemaGuesser().from_file(self.filename)
+        self.assertEqual(schema.as_obj(), full_schema.as_obj())
+        # Extrapolated from the bytes read.
+        self.assertAlmostEqual(guesser.num_records, 50001, delta=5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+
+def make_schema(names, attribute_type='NUMERIC'):
+    schema = awspyml.Schema()
+    for idx, name in enumerate(names):
+        schema.set_variable_name(idx, name)
+        schema.set_variable_type(idx, attribute_type)
+    return schema
+
+
+class NameIndexTest(unittest.TestCase):
+
+    def test_lookup(self):
+        schema = make_schema(['a%d' % i for i in xrange(1000)])
+        self.assertIs(schema.get_variable_by_name('a500'),
+                      schema.attributes()[500])
+        self.assertIsNone(schema.get_variable_by_name('b'))
+
+    def test_set_variable_name(self):
+        schema = make_schema(['a', 'b'])
+        schema.set_variable_name(1, 'c')
+        self.assertIsNone(schema.get_variable_by_name('b'))
+        self.assertEqual(schema.get_variable_by_name('c'),
+                         {'attributeName': 'c', 'attributeType': 'NUMERIC'})
+
+    def test_duplicate_names_find_the_first(self):
+        schema = make_schema(['a', 'b', 'a'])
+        self.assertIs(schema.get_variable_by_name('a'),
+                      schema.attributes()[0])
+        schema.set_variable_name(0, 'z')
+        self.assertIs(schema.get_variable_by_name('z'),
+                      schema.attributes()[0])
+
+    def test_renaming_a_duplicate_keeps_the_other(self):
+        schema = make_schema(['a', 'a'])
+        schema.set_variable_name(0, 'b')
+        self.assertIs(schema.get_variable_by_name('a'),
+                      schema.attributes()[1])
+        schema.set_target('a')
+        self.assertEqual(schema.as_obj()['targetAttributeName'], 'a')
+
+    def test_rename_attributes(self):
+        schema = make_schema(['a', 'b', 'y'])
+        schema.set_target('y')
+        schema.set_row_id('a')
+        schema.exclude_attributes(['b'])
+        # Swapping names works, because both are looked up first.
+        schema.rename_attributes({'a': 'b', 'b': 'a', 'y': 'label'})
+        self.assertEqual([var['attributeName'] for var in schema.attributes()],
+                         ['b', 'a', 'label'])
+        self.assertIs(schema.get_variable_by_name('b'),
+                      schema.attributes()[0])
+        obj = schema.as_obj()
+        self.assertEqual(obj['targetAttributeName'], 'label')
+        self.assertEqual(obj['rowId'], 'b')
+        self.assertEqual(obj['excludedAttributeNames'], ['a'])
+
+    def test_renamed_in_place(self):
+        schema = make_schema(['a', 'b'])
+        # Not through set_variable_name, so the index is out of date.
+        schema.attributes()[1]['attributeName'] = 'c'
+        self.assertIs(schema.get_variable_by_name('c'),
+                      schema.attributes()[1])
+        self.assertIsNone(schema.get_variable_by_name('b'))
+
+    def test_undefined(self):
+        schema = make_schema(['a'])
+        self.assertRaises(awspyml.SchemaException, schema.set_target, 'b')
+        self.assertRaises(awspyml.SchemaException,
+                          schema.set_variable_types, {'b': 'TEXT'})
+        self.assertRaises(awspyml.SchemaException,
+                          schema.exclude_attributes, ['b'])
+
+
+class IncrementalValidationTest(unittest.TestCase):
+
+    def test_changes_are_validated(self):
+        schema = make_schema(['a', 'b'])
+        self.assertTrue(schema.validate())
+        schema.set_variable_type(1, 'BOGUS')
+        self.assertRaises(awspyml.InvalidSchemaException, schema.validate)
+        schema.set_variable_type(1, 'TEXT')
+        self.assertTrue(schema.validate())
+
+    def test_changes_through_lookups_are_validated(self):
+        schema = make_schema(['a', 'b'])
+        schema.validate()
+        schema.get_variable_by_name('a')['attributeType'] = 'BOGUS'
+        self.assertRaises(awspyml.InvalidSchemaException, schema.as_obj)
+        schema.get_variable_by_idx(0)['attributeType'] = 'CATEGORICAL'
+        schema.get_variable_by_idx(3)  # Adds two undefined attributes
+        self.assertRaises(awspyml.InvalidSchemaException, schema.validate)
+
+    def test_changes_in_place_are_validated(self):
+        schema = make_schema(['a', 'b'])
+        schema.validate()
+        schema.attributes()[0]['attributeType'] = 'BOGUS'
+        self.assertRaises(awspyml.InvalidSchemaException, schema.validate)
+        schema.set_variable_type(0, 'TEXT')
+        schema.as_obj()['attributes'][1]['attributeType'] = 'BOGUS'
+        self.assertRaises(awspyml.InvalidSchemaException,
+                          schema.as_json_string)
+
+    def test_only_changed_attributes_are_checked(self):
+        schema = make_schema(['a', 'b'])
+        schema.validate()
+        # Unchecked, because it didn't go through the Schema.
+        schema._obj['attributes'][0]['attributeType'] = 'BOGUS'
+        self.assertTrue(schema.validate())
+        self.assertEqual(schema._dirty, set())
+
+    def test_read_from_file_validates_everything(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'data.csv.schema')
+            obj = make_schema(['a', 'b']).as_obj()
+            obj['attributes'][1]['attributeType'] = 'BOGUS'
+            f = open(filename, 'w')
+            json.dump(obj, f)
+            f.close()
+            schema = awspyml.Schema.read_from_file(filename)
+            self.assertRaises(awspyml.InvalidSchemaException,
+                              schema.validate)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_copy_keeps_pending_changes(self):
+        schema = make_schema(['a', 'b'])
+        schema.validate()
+        schema.set_variable_type(0, 'BOGUS')
+        copy = schema.copy()
+        self.assertRaises(awspyml.InvalidSchemaException, copy.validate)
+        copy.set_variable_type(0, 'TEXT')
+        copy.validate()
+        self.assertRaises(awspyml.InvalidSchemaException, schema.validate)
+
+
+if __name__ == '__main__':
+    unittest.main()
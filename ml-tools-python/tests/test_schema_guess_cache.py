@@ -0,0 +1,137 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import os
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+from test_schema_guesser import write_csv
+
+
+class CountingGuesser(awspyml.SchemaGuesser):
+
+    """Counts how many times the whole file is read.
+    """
+
+    reads = 0
+
+    def _read_file(self, filename, num_lines_to_use, streaming):
+        CountingGuesser.reads += 1
+        super(CountingGuesser, self)._read_file(filename, num_lines_to_use,
+                                                streaming)
+
+
+class SchemaGuessCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = awspyml.SchemaGuessCache(
+            os.path.join(self.directory, 'cache'))
+        self.filename = os.path.join(self.directory, 'data.csv')
+        self.rows = [[str(i % 97), 'k%d' % (i % 5), str(i % 2)]
+                     for i in xrange(2000)]
+        write_csv(self.filename, ['amount', 'kind', 'y'], self.rows)
+        CountingGuesser.reads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def guess(self, cache=True, **kwargs):
+        guesser = CountingGuesser()
+        schema = guesser.from_file(self.filename, 'y',
+                                   cache=self.cache if cache else None,
+                                   **kwargs)
+        return guesser, schema
+
+    def append(self, rows):
+        f = open(self.filename, 'ab')
+        try:
+            for row in rows:
+                f.write(','.join(row) + '\n')
+        finally:
+            f.close()
+
+    def test_unchanged_file_is_not_read_again(self):
+        first, schema = self.guess()
+        second, cached_schema = self.guess()
+        self.assertEqual(CountingGuesser.reads, 1)
+        self.assertEqual(cached_schema.as_obj(), schema.as_obj())
+        self.assertEqual(second.summary.counts.tolist(),
+                         first.summary.counts.tolist())
+
+    def test_changed_file_is_read_again(self):
+        self.guess()
+        stat = os.stat(self.filename)
+        # Same size and mtime, different contents.
+        rows = [['x' * len(a), kind, y] for a, kind, y in self.rows]
+        write_csv(self.filename, ['amount', 'kind', 'y'], rows)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime))
+        self.assertEqual(os.path.getsize(self.filename), stat.st_size)
+        guesser, schema = self.guess()
+        self.assertEqual(CountingGuesser.reads, 2)
+        self.assertEqual(
+            schema.get_variable_by_name('amount')['attributeType'],
+            'CATEGORICAL')
+
+    def test_appended_records_are_merged(self):
+        self.guess(streaming=True, num_lines_to_use=5000)
+        more = [['a%d' % i, 'k9', '1'] for i in xrange(3000)]
+        self.append(more)
+        merged, schema = self.guess(streaming=True, num_lines_to_use=5000)
+        self.assertEqual(CountingGuesser.reads, 1)
+        self.assertEqual(merged.summary.records_seen, 5000)
+        # The same as reading the whole file, since every record fits in
+        # the sample.
+        fresh, fresh_schema = self.guess(cache=False, streaming=True,
+                                         num_lines_to_use=5000)
+        self.assertEqual(merged.summary.counts.tolist(),
+                         fresh.summary.counts.tolist())
+        self.assertEqual(schema.as_obj(), fresh_schema.as_obj())
+
+    def test_growing_file_without_streaming(self):
+        # Only the first 1000 records are used, and they haven't changed.
+        self.guess(num_lines_to_use=1000)
+        self.append([['a', 'k9', '1']])
+        self.guess(num_lines_to_use=1000)
+        self.assertEqual(CountingGuesser.reads, 1)
+        # But a file shorter than that has more records to use.
+        self.guess(num_lines_to_use=3000)
+        self.append([['b', 'k9', '1']])
+        guesser, schema = self.guess(num_lines_to_use=3000)
+        self.assertEqual(CountingGuesser.reads, 3)
+        self.assertEqual(guesser.summary.records_seen, 2002)
+
+    def test_options_are_part_of_the_key(self):
+        self.guess()
+        guesser = CountingGuesser()
+        guesser.id_distinct_ratio = 0.5
+        guesser.from_file(self.filename, 'y', cache=self.cache)
+        self.guess(num_lines_to_use=500)
+        self.guess(streaming=True)
+        self.assertEqual(CountingGuesser.reads, 4)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.guess()
+        size = sum(os.path.getsize(os.path.join(self.cache.directory, fn))
+                   for fn in os.listdir(self.cache.directory))
+        self.cache.max_bytes = int(size * 1.5)
+        self.guess(num_lines_to_use=500)
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+        self.guess(num_lines_to_use=500)
+        self.assertEqual(CountingGuesser.reads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import collections
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import awspyml
+
+
+def write_csv(filename, header, rows):
+    f = open(filename, 'wb')
+    try:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    finally:
+        f.close()
+
+
+class IdDetectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'ids.csv')
+        rng = random.Random(3)
+        words = ['w%d' % i for i in xrange(5000)]
+        rows = []
+        for i in xrange(5000):
+            rows.append([
+                i + 1000,
+                ' '.join(rng.choice(words)
+                         for j in xrange(rng.randint(3, 40))),
+                rng.randint(20000, 300000),
+                'SKU-%08x' % rng.getrandbits(32),
+                rng.randint(0, 1),
+            ])
+        write_csv(self.filename,
+                  ['customer_id', 'desc', 'income', 'sku', 'y'], rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_schema(self, schema):
+        self.assertEqual(
+            schema.get_variable_by_name('desc')['attributeType'], 'TEXT')
+        self.assertEqual(
+            schema.get_variable_by_name('income')['attributeType'],
+            'NUMERIC')
+        self.assertEqual(schema.row_id(), 'customer_id')
+        self.assertEqual(schema.as_obj()['excludedAttributeNames'],
+                         ['sku'])
+
+    def test_keeps_text_and_numeric_features(self):
+        self.check_schema(awspyml.SchemaGuesser().from_file(
+            self.filename, 'y', num_lines_to_use=5000))
+
+    def test_parallel_keeps_text_and_numeric_features(self):
+        self.check_schema(awspyml.SchemaGuesser().from_file_parallel(
+            self.filename, 'y', processes=2, bytes_per_task=64 * 1024))
+
+    def test_repeated_integers_are_features(self):
+        # Nearly all distinct, but a few repeat, as counts do.
+        rng = random.Random(5)
+        filename = os.path.join(self.directory, 'counts.csv')
+        write_csv(filename, ['visits', 'y'],
+                  [[rng.randrange(100000), i % 2] for i in xrange(1000)])
+        schema = awspyml.SchemaGuesser().from_file(filename, 'y')
+        self.assertEqual(schema.row_id(), None)
+        self.assertEqual(
+            schema.as_obj()['excludedAttributeNames'], [])
+
+    def test_keep_ids(self):
+        guesser = awspyml.SchemaGuesser()
+        guesser.id_distinct_ratio = None
+        schema = guesser.from_file(self.filename, 'y')
+        self.assertEqual(schema.row_id(), None)
+
+
+class TweetIdDetectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'tweets.json')
+        rng = random.Random(8)
+        words = ['w%d' % i for i in xrange(300)]
+        first_names = ['Ann', 'Bob', 'Cy', 'Di', 'Ed', 'Flo', 'Gus', 'Hal']
+        f = open(self.filename, 'w')
+        for i in xrange(3000):
+            tweet = collections.OrderedDict([
+                ('created_at_in_seconds', 1440000000 + i // 3),
+                ('sid', 600000000000000000 + rng.getrandbits(50)),
+                ('text', ' '.join(rng.choice(words)
+                                  for j in xrange(rng.randint(2, 12)))),
+                ('uid', rng.getrandbits(40)),
+                ('user', collections.OrderedDict([
+                    ('name', '%s %s%d' % (rng.choice(first_names),
+                                          rng.choice(first_names),
+                                          rng.randrange(10000))),
+                    ('followers_count', rng.randrange(5000)),
+                ])),
+            ])
+            if i % 3 == 0:
+                tweet['r'] = collections.OrderedDict([
+                    ('sid', 500000000000000000 + rng.getrandbits(50)),
+                    ('uid', rng.getrandbits(40)),
+                ])
+            f.write(json.dumps(tweet) + '\n')
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tweet_ids(self):
+        schema = awspyml.JsonLinesSchemaGuesser().from_file(self.filename)
+        self.assertEqual(schema.row_id(), 'sid')
+        self.assertEqual(sorted(schema.as_obj()['excludedAttributeNames']),
+                         ['r.sid', 'r.uid', 'uid'])
+        self.assertEqual(
+            schema.get_variable_by_name('sid')['attributeType'], 'NUMERIC')
+
+
+if __name__ == '__main__':
+    unittest.main()
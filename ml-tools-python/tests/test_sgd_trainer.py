@@ -0,0 +1,126 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import awspyml
+
+from test_columnar import write_rows
+from test_recipe import make_schema
+
+
+class AucTest(unittest.TestCase):
+
+    def test_auc(self):
+        self.assertEqual(awspyml.auc([0.1, 0.4, 0.35, 0.8], [0, 0, 1, 1]),
+                         0.75)
+        self.assertEqual(awspyml.auc([0.5, 0.5], [0, 1]), 0.5)
+        self.assertEqual(awspyml.auc([0.9, 0.1, 0.2], [1, 0, 0]), 1.0)
+        self.assertIsNone(awspyml.auc([0.1, 0.2], [1, 1]))
+
+
+class SGDTrainerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data.csv')
+        self.schema = make_schema()
+        rng = random.Random(3)
+        rows = []
+        for i in xrange(2000):
+            y = rng.random() < 0.4
+            kind = rng.choice(['good', 'good', 'bad'] if y else
+                              ['good', 'bad', 'bad'])
+            amount = rng.gauss(3 if y else 1, 1)
+            words = ['w%d' % rng.randrange(50) for j in xrange(3)]
+            if rng.random() < 0.05:
+                words.append('rare%d' % i)
+            rows.append(['r%d' % i, '%.3f' % amount, kind, ' '.join(words),
+                         rng.choice(['yes', 'no']),
+                         '' if i % 97 == 0 else str(int(y))])
+        write_rows(self.filename, rows)
+        self.dataset = awspyml.ColumnarDataset.from_csv(self.filename,
+                                                        self.schema)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def trainer(self, outputs=None, **parameters):
+        recipe = awspyml.Recipe(
+            {"outputs": outputs or ["ALL_NUMERIC", "ALL_CATEGORICAL",
+                                    "ALL_TEXT", "ALL_BINARY"]},
+            self.schema)
+        return awspyml.SGDTrainer(recipe, parameters)
+
+    def test_train(self):
+        trainer = self.trainer()
+        report = trainer.train(self.dataset).as_obj()
+        self.assertGreater(report['auc'], 0.85)
+        self.assertEqual(report['trainingRecords'], 1400)
+        # Records without a target aren't evaluated.
+        self.assertEqual(report['evaluationRecords'], 600 - 6)
+        # amount and flag, good and bad, and the tokens.
+        self.assertGreater(report['numFeatures'], 54)
+        self.assertEqual(report['parameters']['sgd.maxPasses'], '10')
+        self.assertEqual(len(trainer.weights), report['numFeatures'])
+
+    def test_recipe_changes_the_auc(self):
+        with_amount = self.trainer(["amount"]).train(self.dataset)
+        without = self.trainer(["ALL_TEXT"]).train(self.dataset)
+        self.assertGreater(with_amount.as_obj()['auc'],
+                           without.as_obj()['auc'] + 0.2)
+
+    def test_model_size_drops_the_rarest_features(self):
+        trainer = self.trainer(["text"], **{
+            "sgd.maxMLModelSizeInBytes": str(30 * (8 + 4 + 1 + 3))})
+        report = trainer.train(self.dataset).as_obj()
+        self.assertLessEqual(report['numFeatures'], 30)
+        self.assertTrue(all(not token.startswith('rare')
+                            for token in trainer.features['text']))
+
+    def test_l1_regularization_zeroes_weights(self):
+        dense = self.trainer().train(self.dataset).as_obj()
+        sparse = self.trainer(**{
+            "sgd.l1RegularizationAmount": "0.05"}).train(
+            self.dataset).as_obj()
+        self.assertLess(sparse['numNonZeroWeights'],
+                        dense['numNonZeroWeights'] // 2)
+
+    def test_shuffled_training(self):
+        numpy.random.seed(1)
+        report = self.trainer(**{"sgd.shuffleType": "auto",
+                                 "sgd.maxPasses": "3"}).train(self.dataset)
+        self.assertGreater(report.as_obj()['auc'], 0.85)
+
+    def test_predict_records(self):
+        trainer = self.trainer(["amount", "kind"])
+        trainer.train(self.dataset)
+        predictions = trainer.predict_records([
+            {'amount': 4.5, 'kind': 'good'}, {'amount': '-1', 'kind': 'bad'},
+            {'kind': u'unseen'}])
+        self.assertEqual([p['predictedLabel'] for p in predictions],
+                         ['1', '0', '0'])
+        self.assertGreater(predictions[0]['predictedScores']['1'], 0.8)
+
+    def test_target_must_be_binary(self):
+        self.schema.set_variable_type(5, 'NUMERIC')
+        self.assertRaises(awspyml.SchemaException, self.trainer)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+import math
+import random
+import unittest
+
+import awspyml
+
+
+class HyperLogLogTest(unittest.TestCase):
+
+    def test_estimate(self):
+        for n in (10, 1000, 50000):
+            sketch = awspyml.HyperLogLog()
+            for i in xrange(n):
+                sketch.add('value%d' % i)
+                sketch.add('value%d' % i)  # Repeats don't count
+            self.assertAlmostEqual(sketch.estimate(), n, delta=0.05 * n)
+
+    def test_merge_counts_the_union(self):
+        a = awspyml.HyperLogLog()
+        b = awspyml.HyperLogLog()
+        union = awspyml.HyperLogLog()
+        for i in xrange(20000):
+            a.add(str(i))
+            union.add(str(i))
+        for i in xrange(10000, 30000):
+            b.add(str(i))
+            union.add(str(i))
+        merged = a.merge(b)
+        self.assertEqual(merged.registers, union.registers)
+        self.assertAlmostEqual(merged.estimate(), 30000, delta=1500)
+
+
+class TDigestTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.random() for i in xrange(20000)]
+
+    def assertQuantilesClose(self, digest, values):
+        values = sorted(values)
+        for q in (0.001, 0.01, 0.25, 0.5, 0.75, 0.99, 0.999):
+            exact = values[int(q * (len(values) - 1))]
+            # Uniform on [0, 1), so rank error is value error.
+            self.assertAlmostEqual(digest.quantile(q), exact, delta=0.01)
+
+    def test_quantiles(self):
+        digest = awspyml.TDigest()
+        for value in self.values:
+            digest.add(value)
+        self.assertEqual(digest.count, len(self.values))
+        self.assertEqual(digest.min, min(self.values))
+        self.assertEqual(digest.max, max(self.values))
+        self.assertLessEqual(len(digest.centroids), 2 * digest.compression)
+        self.assertQuantilesClose(digest, self.values)
+
+    def test_add_array(self):
+        digest = awspyml.TDigest()
+        values = awspyml.numpy.array(self.values + [float('nan')])
+        digest.add_array(values)
+        self.assertEqual(digest.count, len(self.values))
+        self.assertQuantilesClose(digest, self.values)
+
+    def test_merge(self):
+        low = awspyml.TDigest()
+        high = awspyml.TDigest()
+        for value in self.values:
+            (low if value < 0.3 else high).add(value)
+        merged = low.merge(high)
+        self.assertEqual(merged.count, len(self.values))
+        self.assertEqual(merged.min, min(self.values))
+        self.assertQuantilesClose(merged, self.values)
+
+    def test_empty(self):
+        self.assertIsNone(awspyml.TDigest().quantile(0.5))
+
+
+class TopKTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(11)
+        # Five frequent values among many rare ones.
+        self.stream = ['frequent%d' % (i % 5) for i in xrange(5000)]
+        self.stream += ['rare%d' % rng.randrange(20000)
+                        for i in xrange(20000)]
+        rng.shuffle(self.stream)
+
+    def counts_of(self, values):
+        counts = {}
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def assertFindsFrequent(self, summary, exact):
+        top = summary.top(5)
+        self.assertEqual(sorted(value for value, count in top),
+                         ['frequent%d' % i for i in xrange(5)])
+        for value, count in top:
+            # Counts are low by at most error, never high.
+            self.assertLessEqual(count, exact[value])
+            self.assertGreaterEqual(count, exact[value] - summary.error)
+        self.assertLessEqual(summary.error,
+                             len(self.stream) / (summary.capacity + 1.0))
+
+    def test_top(self):
+        summary = awspyml.TopK(capacity=50)
+        for i in xrange(0, len(self.stream), 1000):
+            summary.update(self.counts_of(self.stream[i:i + 1000]))
+        self.assertLessEqual(len(summary.counts), summary.capacity)
+        self.assertFindsFrequent(summary, self.counts_of(self.stream))
+
+    def test_merge(self):
+        half = len(self.stream) // 2
+        a = awspyml.TopK(capacity=50)
+        a.update(self.counts_of(self.stream[:half]))
+        b = awspyml.TopK(capacity=50)
+        b.update(self.counts_of(self.stream[half:]))
+        self.assertFindsFrequent(a.merge(b), self.counts_of(self.stream))
+
+    def test_exact_under_capacity(self):
+        summary = awspyml.TopK(capacity=10)
+        summary.update({'a': 3, 'b': 1})
+        summary.update({'b': 4})
+        self.assertEqual(summary.top(5), [['b', 5], ['a', 3]])
+        self.assertEqual(summary.error, 0)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(5)
+        # Mostly a few milliseconds, with a long tail out to seconds.
+        self.values = [int(rng.lognormvariate(8, 1.5)) for i in xrange(20000)]
+
+    def assertPercentilesClose(self, histogram, values):
+        values = sorted(values)
+        for percent in (50, 90, 99, 99.9, 100):
+            rank = int(math.ceil(percent / 100.0 * len(values)))
+            exact = values[max(rank, 1) - 1]
+            # 3 significant digits
+            self.assertAlmostEqual(histogram.percentile(percent), exact,
+                                   delta=exact / 1000.0 + 1)
+
+    def test_percentiles(self):
+        histogram = awspyml.LatencyHistogram()
+        for value in self.values:
+            histogram.record(value)
+        self.assertEqual(histogram.total, len(self.values))
+        self.assertEqual(histogram.min, min(self.values))
+        self.assertEqual(histogram.max, max(self.values))
+        self.assertAlmostEqual(histogram.mean(),
+                               sum(self.values) / float(len(self.values)))
+        self.assertPercentilesClose(histogram, self.values)
+
+    def test_small_values_are_exact(self):
+        histogram = awspyml.LatencyHistogram()
+        for value in xrange(1, 1001):
+            histogram.record(value)
+        for percent in (1, 10, 50, 99, 100):
+            self.assertEqual(histogram.percentile(percent), percent * 10)
+
+    def test_merge(self):
+        a = awspyml.LatencyHistogram()
+        b = awspyml.LatencyHistogram()
+        for i, value in enumerate(self.values):
+            (a if i % 3 else b).record(value)
+        merged = a.merge(b)
+        self.assertEqual(merged.total, len(self.values))
+        self.assertEqual(merged.min, min(self.values))
+        self.assertEqual(merged.max, max(self.values))
+        self.assertPercentilesClose(merged, self.values)
+
+    def test_values_are_clamped(self):
+        histogram = awspyml.LatencyHistogram(max_value=1000000)
+        histogram.record(-5)
+        histogram.record(5000000, count=2)
+        self.assertEqual(histogram.min, 0)
+        self.assertEqual(histogram.percentile(100), 1000000)
+        self.assertEqual(histogram.total, 3)
+
+    def test_empty(self):
+        histogram = awspyml.LatencyHistogram()
+        self.assertEqual(histogram.percentile(99), 0)
+        self.assertEqual(histogram.mean(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
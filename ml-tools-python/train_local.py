@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Local training utility for Amazon Machine Learning.
+Trains a binary logistic regression model on a CSV file with the same
+recipe and training parameters create_ml_model takes, and reports the AUC
+on the last records of the file, held out from training.  Use it to screen
+recipes and parameters before paying for models in the service.
+
+Parameters are given as name=value, for example
+    --param sgd.maxPasses=5 --param sgd.l2RegularizationAmount=1e-4
+
+Usage:
+    python train_local.py [--param name=value ...] [--train-percent 70]
+        [--cache] data_file.csv data_file.csv.schema recipe.json
+
+Requires numpy.
+"""
+import argparse
+import awspyml
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("data_fn")
+    parser.add_argument("schema_fn")
+    parser.add_argument("recipe_fn")
+    parser.add_argument("--param", action="append", default=[])
+    parser.add_argument("--train-percent", type=int, default=70)
+    parser.add_argument("--cache", action="store_true",
+                        help="Keep the parsed CSV in ~/.awspyml to load "
+                        "it faster next time")
+    args = parser.parse_args()
+
+    parameters = {}
+    for param in args.param:
+        if "=" not in param:
+            parser.error("--param must be name=value, not %s" % param)
+        name, value = param.split("=", 1)
+        parameters[name] = value
+
+    schema = awspyml.Schema.read_from_file(args.schema_fn)
+    recipe = awspyml.Recipe.read_from_file(args.recipe_fn, schema)
+    cache = awspyml.ColumnarCache() if args.cache else None
+    dataset = awspyml.ColumnarDataset.from_csv(args.data_fn, schema, cache)
+    trainer = awspyml.SGDTrainer(recipe, parameters)
+    report = trainer.train(dataset, args.train_percent)
+    print(report.as_json_string())
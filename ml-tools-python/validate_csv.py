@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# Copyright 2015 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express
+# or implied. See the License for the specific language governing permissions
+# and limitations under the License.
+"""
+Pre-flight check of a CSV file against its schema, before a data source is
+created from it.  Reads the file (or a directory of CSV shard files) on
+every core and reports how many records have each kind of problem, with
+the line numbers of a few of them:
+
+    wrongColumnCount  a record doesn't have one value per attribute
+    notNumeric        a NUMERIC attribute's value isn't a number
+    notBinary         a BINARY attribute's value isn't 0/1, y/n, yes/no,
+                      t/f or true/false
+    missingTarget     the target attribute's value is empty
+    headerMismatch    the header line doesn't match the attribute names
+
+Usage:
+    python validate_csv.py [--processes N] data_file.csv data_file.csv.schema
+
+Exits with status 1 if any problems were found.
+"""
+import argparse
+import sys
+import awspyml
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("data_fn")
+    parser.add_argument("schema_fn")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    schema = awspyml.Schema.read_from_file(args.schema_fn)
+    report = awspyml.DataValidator(schema).validate_file(
+        args.data_fn, processes=args.processes)
+    print(report.as_json_string())
+    if not report.is_valid():
+        sys.exit(1)
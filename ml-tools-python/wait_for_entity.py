@@ -24,49 +24,228 @@ or specified manually with the convention:
 
 Useage:
     python wait_for_entity.py entity_id [entity_type]
+or, to wait for several entities of any types at once:
+    python wait_for_entity.py entity_id entity_id ... [--name-prefix prefix]
+
+Several entities are polled with a few paginated describe calls per entity
+type, listing the entities that are still pending or in progress (or, with
+--name-prefix, those whose names start with the prefix), instead of one get
+call per entity.  Each entity's status changes are printed as they are
+seen, and the exit status is 1 if any of them failed.
+
+How long jobs took is kept in ~/.awspyml/job-history.json, and entities
+are polled densely only around when similar jobs finished before.
 """
-import boto
+import argparse
+import awspyml
 import datetime
 import json
-import random
 import sys
 import time
 
+# Entity type -> (id key, get method, describe method)
+ENTITY_TYPES = {
+    'ds': ('DataSourceId', 'get_data_source', 'describe_data_sources'),
+    'ml': ('MLModelId', 'get_ml_model', 'describe_ml_models'),
+    'ev': ('EvaluationId', 'get_evaluation', 'describe_evaluations'),
+    'bp': ('BatchPredictionId', 'get_batch_prediction',
+           'describe_batch_predictions'),
+}
+# Entity type -> key of the id of the data source its job reads
+INPUT_DATA_SOURCE_KEYS = {
+    'ml': 'TrainingDataSourceId',
+    'ev': 'EvaluationDataSourceId',
+    'bp': 'BatchPredictionDataSourceId',
+}
+
+
+def input_size(ml, entity_type_str, entity):
+    """Returns the size in bytes of the data an entity's job reads, or None
+    if it isn't known.
+    """
+    ds_id = entity.get(INPUT_DATA_SOURCE_KEYS.get(entity_type_str))
+    if not ds_id:
+        return None
+    size = ml.get_data_source(ds_id).get('DataSizeInBytes')
+    return int(size) if size is not None else None
+
 
 def poll_until_completed(entity_id, entity_type_str):
-    ml = boto.connect_machinelearning()
+    ml = awspyml.aml_connection()
     polling_function = {
         'ds': ml.get_data_source,
         'ml': ml.get_ml_model,
         'ev': ml.get_evaluation,
         'bp': ml.get_batch_prediction,
     }[entity_type_str]
-    delay = 2
-    while True:
-        results = polling_function(entity_id)
-        status = results['Status']
-        message = results.get('Message', '')
+    responses = [polling_function(entity_id)]
+    size = input_size(ml, entity_type_str, responses[0])
+
+    def poll():
+        results = responses.pop() if responses else \
+            polling_function(entity_id)
         now = str(datetime.datetime.now().time())
-        print("Object %s is %s (%s) at %s" % (entity_id, status, message, now))
-        if status in ['COMPLETED', 'FAILED', 'INVALID']:
-            break
+        print("Object %s is %s (%s) at %s" % (
+            entity_id, results['Status'], results.get('Message', ''), now))
+        return results
 
-        # exponential backoff with jitter
-        delay *= random.uniform(1.1, 2.0)
-        time.sleep(delay)
+    results = awspyml.poll_until_terminal(poll, entity_type_str, size)
     print(json.dumps(results, indent=2))
 
 
+class EntityPoller(object):
+
+    """Fetches the state of many entities of one type with as few calls as
+    it can, and counts the calls it makes.
+    """
+
+    def __init__(self, ml, entity_type_str, name_prefix=None):
+        self.ml = ml
+        self.id_key, self.get_method, self.describe_method = \
+            ENTITY_TYPES[entity_type_str]
+        self.name_prefix = name_prefix
+        self.num_calls = 0
+
+    def _describe_all(self, **filters):
+        describe = getattr(self.ml, self.describe_method)
+        results = []
+        next_token = None
+        while True:
+            response = describe(limit=100, next_token=next_token, **filters)
+            self.num_calls += 1
+            results.extend(response.get('Results', []))
+            next_token = response.get('NextToken')
+            if not next_token:
+                return results
+
+    def poll(self, entity_ids):
+        """Returns a dict of entity id -> the entity's description, for
+        each of entity_ids.
+        """
+        entity_ids = set(entity_ids)
+        found = {}
+        if self.name_prefix:
+            listings = [{'filter_variable': 'Name',
+                         'prefix': self.name_prefix}]
+        elif len(entity_ids) > 2:
+            # With only a couple of entities, getting each is as cheap.
+            listings = [{'filter_variable': 'Status', 'eq': status}
+                        for status in ('PENDING', 'INPROGRESS')]
+        else:
+            listings = []
+        for filters in listings:
+            for result in self._describe_all(**filters):
+                if result[self.id_key] in entity_ids:
+                    found[result[self.id_key]] = result
+        # Entities that weren't listed have finished since the last poll,
+        # or don't match the name prefix, so get them one at a time.
+        get = getattr(self.ml, self.get_method)
+        for entity_id in entity_ids - set(found):
+            found[entity_id] = get(entity_id)
+            self.num_calls += 1
+        return found
+
+
+def job_seconds(entity, started, now):
+    """Returns how long an entity's job has run, from its timestamps if it
+    has them, or else since started.
+    """
+    seconds = awspyml.job_seconds(entity, now)
+    if seconds is None:
+        seconds = now - started
+    return seconds
+
+
+def wait_for_entities(entity_ids, name_prefix=None, ml=None, history=None,
+                      clock=time.time, sleep=time.sleep):
+    """Waits for every one of a list of entity ids (of any types) to reach
+    a terminal state, printing each change of status.  Returns a dict of
+    entity id -> the entity's final description.
+
+    Each entity has its own PollSchedule, and is polled only when it is
+    due, together with the others of its type that are due then.
+    """
+    ml = ml or awspyml.aml_connection()
+    if history is None:
+        history = awspyml.JobHistory()
+    pollers = {}
+    for entity_id in entity_ids:
+        entity_type_str = entity_id[:2]
+        if entity_type_str not in ENTITY_TYPES:
+            raise RuntimeError("Unknown entity type of %s" % entity_id)
+        if entity_type_str not in pollers:
+            pollers[entity_type_str] = EntityPoller(ml, entity_type_str,
+                                                    name_prefix)
+    schedules = {}  # entity id -> PollSchedule
+    started = clock()
+    due = dict((entity_id, started) for entity_id in entity_ids)
+    results = {}
+    while due:
+        now = clock()
+        polled = sorted(entity_id for entity_id, when in due.items()
+                        if when <= now)
+        for entity_type_str, poller in sorted(pollers.items()):
+            waiting = [entity_id for entity_id in polled
+                       if entity_id[:2] == entity_type_str]
+            if not waiting:
+                continue
+            for entity_id, result in sorted(poller.poll(waiting).items()):
+                previous = results.get(entity_id, {}).get('Status')
+                if result['Status'] != previous:
+                    print("Object %s is %s (%s) at %s" % (
+                        entity_id, result['Status'],
+                        result.get('Message', ''),
+                        datetime.datetime.fromtimestamp(clock()).time()))
+                    # Only jobs seen running are timed; one that had
+                    # finished before the first poll may have been already.
+                    if result['Status'] == 'COMPLETED' and \
+                            previous is not None:
+                        history.record(entity_type_str, None,
+                                       job_seconds(result, started, clock()))
+                results[entity_id] = result
+
+        # Only the entities just polled move on to their next poll, so
+        # each one's backoff advances once per poll of it, not per sleep.
+        now = clock()
+        for entity_id in polled:
+            result = results[entity_id]
+            if result['Status'] in awspyml.TERMINAL_STATUSES:
+                del due[entity_id]
+                continue
+            if entity_id not in schedules:
+                estimate = history.estimate(entity_id[:2])
+                schedules[entity_id] = awspyml.PollSchedule(estimate,
+                                                            max_delay=60)
+            due[entity_id] = now + schedules[entity_id].next_delay(
+                job_seconds(result, started, now))
+        if due:
+            sleep(max(min(due.values()) - clock(), 0))
+    done = len(results)
+    print("%d entities finished after %d calls" % (
+        done, sum(poller.num_calls for poller in pollers.values())))
+    return results
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("entity_ids", nargs="+")
+    parser.add_argument("--name-prefix")
     try:
-        entity_id = sys.argv[1]
-        if len(sys.argv) > 2:
-            entity_type_str = sys.argv[2]
+        args = parser.parse_args()
+        entity_ids = args.entity_ids
+        if len(entity_ids) == 2 and entity_ids[1] in ENTITY_TYPES:
+            entity_ids, entity_type_str = entity_ids[:1], entity_ids[1]
         else:
-            entity_type_str = entity_id[:2]
-        if entity_type_str not in ['ds', 'ml', 'ev', 'bp']:
+            entity_type_str = entity_ids[0][:2]
+        if entity_type_str not in ENTITY_TYPES:
             raise RuntimeError("Unknown entity type")
     except:
         print(__doc__)
         sys.exit(-1)
-    poll_until_completed(entity_id, entity_type_str)
+    if len(entity_ids) == 1 and not args.name_prefix:
+        poll_until_completed(entity_ids[0], entity_type_str)
+    else:
+        results = wait_for_entities(entity_ids, args.name_prefix)
+        if any(result['Status'] != 'COMPLETED'
+               for result in results.values()):
+            sys.exit(1)